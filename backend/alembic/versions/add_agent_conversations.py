@@ -0,0 +1,52 @@
+"""add agent conversation memory tables
+
+Revision ID: add_agent_conversations
+Revises: 7a9b2c3d4e5f
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_agent_conversations'
+down_revision = '7a9b2c3d4e5f'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'agent_conversations',
+        sa.Column('agent_id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.String(length=128), nullable=False),
+        sa.Column('summary', sa.Text(), nullable=True),
+        sa.Column('summarized_until_id', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('pending_messages', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['agent_id'], ['agents.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('agent_id', 'session_id')
+    )
+    op.create_table(
+        'agent_conversation_messages',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('agent_id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.String(length=128), nullable=False),
+        sa.Column('role', sa.String(length=16), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('token_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.ForeignKeyConstraint(['agent_id'], ['agents.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_agent_conversation_messages_session',
+        'agent_conversation_messages',
+        ['agent_id', 'session_id', 'id'],
+        unique=False
+    )
+
+def downgrade():
+    op.drop_index('ix_agent_conversation_messages_session', table_name='agent_conversation_messages')
+    op.drop_table('agent_conversation_messages')
+    op.drop_table('agent_conversations')
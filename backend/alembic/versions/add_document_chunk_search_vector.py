@@ -0,0 +1,33 @@
+"""add full-text search vectors to document chunks
+
+Revision ID: add_document_chunk_search_vector
+Revises: add_document_chunk_tombstones
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'add_document_chunk_search_vector'
+down_revision = 'add_document_chunk_tombstones'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('document_chunks', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute(
+        "UPDATE document_chunks AS c SET search_vector = "
+        "setweight(to_tsvector('simple', coalesce(d.title, '')), 'A') || "
+        "setweight(to_tsvector('simple', c.content), 'B') "
+        "FROM documents AS d WHERE d.id = c.document_id AND c.deleted_at IS NULL"
+    )
+    op.create_index(
+        'ix_document_chunks_search_vector', 'document_chunks', ['search_vector'], unique=False,
+        postgresql_using='gin'
+    )
+
+def downgrade():
+    op.drop_index('ix_document_chunks_search_vector', table_name='document_chunks')
+    op.drop_column('document_chunks', 'search_vector')
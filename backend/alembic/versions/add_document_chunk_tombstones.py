@@ -0,0 +1,49 @@
+"""add content hashes and tombstones to document chunks
+
+Revision ID: add_document_chunk_tombstones
+Revises: add_document_chunks
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_document_chunk_tombstones'
+down_revision = 'add_document_chunks'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('document_chunks', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('document_chunks', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE document_chunks SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')")
+    op.alter_column('document_chunks', 'content_hash', nullable=False)
+    op.create_index(
+        'ix_document_chunks_content_hash', 'document_chunks', ['knowledge_base_id', 'content_hash'], unique=False
+    )
+    op.create_index(
+        'ix_document_chunks_tombstones', 'document_chunks', ['knowledge_base_id', 'id'], unique=False,
+        postgresql_where=sa.text('deleted_at IS NOT NULL')
+    )
+
+    # 删除文档时保留片段作为墓碑，由压缩任务清理
+    op.drop_constraint('document_chunks_document_id_fkey', 'document_chunks', type_='foreignkey')
+    op.alter_column('document_chunks', 'document_id', nullable=True)
+    op.create_foreign_key(
+        'document_chunks_document_id_fkey', 'document_chunks', 'documents',
+        ['document_id'], ['id'], ondelete='SET NULL'
+    )
+
+def downgrade():
+    op.execute("DELETE FROM document_chunks WHERE deleted_at IS NOT NULL OR document_id IS NULL")
+    op.drop_constraint('document_chunks_document_id_fkey', 'document_chunks', type_='foreignkey')
+    op.alter_column('document_chunks', 'document_id', nullable=False)
+    op.create_foreign_key(
+        'document_chunks_document_id_fkey', 'document_chunks', 'documents',
+        ['document_id'], ['id'], ondelete='CASCADE'
+    )
+    op.drop_index('ix_document_chunks_tombstones', table_name='document_chunks')
+    op.drop_index('ix_document_chunks_content_hash', table_name='document_chunks')
+    op.drop_column('document_chunks', 'deleted_at')
+    op.drop_column('document_chunks', 'content_hash')
@@ -0,0 +1,79 @@
+"""add document chunks for knowledge base retrieval
+
+Revision ID: add_document_chunks
+Revises: add_agent_conversations
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_document_chunks'
+down_revision = 'add_agent_conversations'
+branch_labels = None
+depends_on = None
+
+# 与 settings.EMBEDDING_DIMENSIONS 保持一致
+EMBEDDING_DIMENSIONS = 1536
+
+def upgrade():
+    bind = op.get_bind()
+    existing_tables = sa.inspect(bind).get_table_names()
+
+    # 知识库表此前只由 init_db 的 create_all 创建，这里补齐
+    if 'knowledge_bases' not in existing_tables:
+        op.create_table(
+            'knowledge_bases',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=False),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_knowledge_bases_id'), 'knowledge_bases', ['id'], unique=False)
+    if 'documents' not in existing_tables:
+        op.create_table(
+            'documents',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=255), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('knowledge_base_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['knowledge_base_id'], ['knowledge_bases.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_documents_id'), 'documents', ['id'], unique=False)
+
+    op.create_table(
+        'document_chunks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('knowledge_base_id', sa.Integer(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('embedding', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['knowledge_base_id'], ['knowledge_bases.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_document_chunks_kb_id', 'document_chunks', ['knowledge_base_id', 'id'], unique=False)
+    op.create_index('ix_document_chunks_document_id', 'document_chunks', ['document_id', 'chunk_index'], unique=False)
+
+    # 数据库安装了 pgvector 时增加向量列和 HNSW 索引，否则使用应用内的 NumPy 索引
+    available = bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")).first()
+    if available:
+        op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        op.execute(f"ALTER TABLE document_chunks ADD COLUMN embedding_vector vector({EMBEDDING_DIMENSIONS})")
+        op.execute(
+            "CREATE INDEX ix_document_chunks_embedding_vector ON document_chunks "
+            "USING hnsw (embedding_vector vector_cosine_ops)"
+        )
+
+def downgrade():
+    op.drop_index('ix_document_chunks_document_id', table_name='document_chunks')
+    op.drop_index('ix_document_chunks_kb_id', table_name='document_chunks')
+    op.drop_table('document_chunks')
@@ -0,0 +1,20 @@
+"""add (knowledge_base_id, id) index to documents
+
+Revision ID: add_documents_kb_id_index
+Revises: add_document_chunk_search_vector
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_documents_kb_id_index'
+down_revision = 'add_document_chunk_search_vector'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_documents_knowledge_base_id_id', 'documents', ['knowledge_base_id', 'id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_documents_knowledge_base_id_id', table_name='documents')
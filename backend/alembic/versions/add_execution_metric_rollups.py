@@ -0,0 +1,107 @@
+"""add execution metric rollups
+
+Revision ID: add_execution_metric_rollups
+Revises: add_monitoring_stats_indexes
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'add_execution_metric_rollups'
+down_revision = 'add_monitoring_stats_indexes'
+branch_labels = None
+depends_on = None
+
+# 与 app.services.metrics_rollup.DURATION_BUCKETS 保持一致
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+def _histogram(column):
+    """按区间计数的数组表达式，区间为 (上一个上界, 上界]"""
+    counts = []
+    bounds = (None,) + DURATION_BUCKETS + (None,)
+    for lower, upper in zip(bounds, bounds[1:]):
+        conditions = [f"{column} >= 0"]
+        if lower is not None:
+            conditions.append(f"{column} > {lower}")
+        if upper is not None:
+            conditions.append(f"{column} <= {upper}")
+        counts.append(f"count(*) FILTER (WHERE {' AND '.join(conditions)})")
+    return f"ARRAY[{', '.join(counts)}]::bigint[]"
+
+
+def _backfill(granularity):
+    bucket = f"date_trunc('{granularity}', e.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'"
+    aggregates = (
+        "count(*), count(d.duration) FILTER (WHERE d.duration >= 0), "
+        "coalesce(sum(d.duration) FILTER (WHERE d.duration >= 0), 0), "
+        "max(d.duration) FILTER (WHERE d.duration >= 0), "
+        f"{_histogram('d.duration')}"
+    )
+    columns = (
+        "INSERT INTO execution_metric_rollups (granularity, bucket_start, kind, task_type, status, "
+        "workflow_id, user_id, count, duration_count, duration_sum, duration_max, duration_histogram) "
+    )
+    op.execute(
+        columns +
+        f"SELECT '{granularity}', {bucket}, 'workflow', '', lower(e.status::text), e.workflow_id, e.user_id, "
+        f"{aggregates} "
+        "FROM workflow_executions AS e "
+        "CROSS JOIN LATERAL (SELECT extract(epoch FROM e.completed_at - e.started_at)::float8 AS duration) AS d "
+        "WHERE e.status IN ('COMPLETED', 'FAILED') "
+        "GROUP BY 2, 5, 6, 7"
+    )
+    # 任务日志每次尝试一条，按 (执行, 任务) 合并为一次运行：有成功记录即为成功
+    op.execute(
+        columns +
+        f"SELECT '{granularity}', {bucket}, 'task', coalesce(lower(t.type::text), ''), r.status, "
+        f"e.workflow_id, e.user_id, {aggregates} "
+        "FROM ("
+        "  SELECT execution_id, task_id, "
+        "    CASE WHEN bool_or(status = 'COMPLETED') THEN 'completed' ELSE 'failed' END AS status, "
+        "    extract(epoch FROM max(completed_at) - min(started_at))::float8 AS duration "
+        "  FROM task_logs GROUP BY execution_id, task_id "
+        "  HAVING bool_or(status IN ('COMPLETED', 'FAILED'))"
+        ") AS r "
+        "JOIN workflow_executions AS e ON e.id = r.execution_id "
+        "JOIN workflow_tasks AS t ON t.id = r.task_id "
+        "CROSS JOIN LATERAL (SELECT r.duration) AS d(duration) "
+        "GROUP BY 2, 4, 5, 6, 7"
+    )
+
+
+def upgrade():
+    op.create_table(
+        'execution_metric_rollups',
+        sa.Column('granularity', sa.String(length=8), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('task_type', sa.String(length=32), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('workflow_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.Column('duration_count', sa.BigInteger(), nullable=False),
+        sa.Column('duration_sum', sa.Float(), nullable=False),
+        sa.Column('duration_max', sa.Float(), nullable=True),
+        sa.Column('duration_histogram', postgresql.ARRAY(sa.BigInteger()), nullable=False),
+        sa.PrimaryKeyConstraint(
+            'granularity', 'bucket_start', 'kind', 'task_type', 'status', 'workflow_id', 'user_id'
+        )
+    )
+    op.create_index(
+        'ix_workflow_executions_active', 'workflow_executions', ['created_at'], unique=False,
+        postgresql_where=sa.text("status IN ('PENDING', 'RUNNING')")
+    )
+
+    # 从明细表回填历史数据；分钟和小时桶之后由 worker 按保留期清理
+    for granularity in ('minute', 'hour', 'day'):
+        _backfill(granularity)
+
+
+def downgrade():
+    op.drop_index('ix_workflow_executions_active', table_name='workflow_executions')
+    op.drop_table('execution_metric_rollups')
@@ -0,0 +1,30 @@
+"""add covering indexes for monitoring statistics
+
+Revision ID: add_monitoring_stats_indexes
+Revises: add_documents_kb_id_index
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_monitoring_stats_indexes'
+down_revision = 'add_documents_kb_id_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index(
+        'ix_workflow_tasks_created_at_stats', 'workflow_tasks', ['created_at'], unique=False,
+        postgresql_include=['type', 'status', 'started_at', 'completed_at']
+    )
+    op.create_index(
+        'ix_workflow_executions_created_at_stats', 'workflow_executions', ['created_at'], unique=False,
+        postgresql_include=['status', 'started_at', 'completed_at']
+    )
+    op.create_index('ix_task_logs_execution_id_task_id', 'task_logs', ['execution_id', 'task_id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_task_logs_execution_id_task_id', table_name='task_logs')
+    op.drop_index('ix_workflow_executions_created_at_stats', table_name='workflow_executions')
+    op.drop_index('ix_workflow_tasks_created_at_stats', table_name='workflow_tasks')
@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
+from app.core.sse import event_stream_response
 from app.core.deps import get_current_user
 from app.services.agent_service import AgentService
 from app.schemas.agent import (
@@ -97,7 +98,7 @@ async def execute_agent(
     """Execute an agent."""
     service = AgentService(db)
     try:
-        result = await service.execute_agent(agent_id, request.input_text)
+        result = await service.execute_agent(agent_id, request.input_text, request.session_id)
         return AgentExecutionResponse(
             output=result["output"],
             steps=result["steps"],
@@ -112,4 +113,32 @@ async def execute_agent(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        ) 
\ No newline at end of file
+        ) 
+
+@router.post("/{agent_id}/execute/stream")
+async def execute_agent_stream(
+    agent_id: int,
+    request: AgentExecutionRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Execute an agent and stream tokens and steps as Server-Sent Events."""
+    service = AgentService(db)
+    events = service.stream_agent(agent_id, request.input_text, request.session_id)
+    try:
+        # 先取第一个事件，Agent 不存在或未启用时仍返回普通的错误响应
+        first_event = await events.__anext__()
+    except StopAsyncIteration:
+        first_event = None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    async def stream():
+        if first_event is not None:
+            yield first_event
+        async for event in events:
+            yield event
+    
+    return event_stream_response(stream())
@@ -1,60 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from fastapi import APIRouter, HTTPException
 from typing import Dict
 
-from app.core.deps import get_db
-from app.models.workflow_task import WorkflowTask, TaskStatus, TaskType
-from app.models.agent import Agent
+from app.core.cache import TieredCache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis_client import get_redis
+from app.services.monitoring import MonitoringService
 
 router = APIRouter()
 
+# 仪表盘统计与用户无关，所有请求共享同一个缓存条目
+dashboard_stats_cache = TieredCache(
+    "bizbrain:dashboard",
+    maxsize=16,
+    redis=get_redis if settings.DASHBOARD_CACHE_REDIS_ENABLED else None
+)
+
+
+async def _load_dashboard_stats() -> Dict[str, int]:
+    # 加载可能被多个请求共享，使用独立的会话而不是某个请求的会话
+    async with AsyncSessionLocal() as db:
+        return await MonitoringService(db).get_dashboard_stats(hours=24)
+
+
 @router.get("/stats", response_model=Dict[str, int])
-async def get_dashboard_stats(
-    db: AsyncSession = Depends(get_db),
-) -> Dict[str, int]:
+async def get_dashboard_stats() -> Dict[str, int]:
     """
     获取仪表盘统计数据
     """
     try:
-        # 获取任务统计
-        total_tasks = await db.scalar(select(func.count()).select_from(WorkflowTask))
-        running_tasks = await db.scalar(
-            select(func.count())
-            .select_from(WorkflowTask)
-            .where(WorkflowTask.status == TaskStatus.RUNNING)
-        )
-        completed_tasks = await db.scalar(
-            select(func.count())
-            .select_from(WorkflowTask)
-            .where(WorkflowTask.status == TaskStatus.COMPLETED)
+        if settings.DASHBOARD_CACHE_TTL <= 0:
+            return await _load_dashboard_stats()
+        # 缓存几秒，同时到达的刷新请求合并为一次查询
+        return await dashboard_stats_cache.get_or_load(
+            "stats", _load_dashboard_stats, settings.DASHBOARD_CACHE_TTL, namespace="dashboard"
         )
-        failed_tasks = await db.scalar(
-            select(func.count())
-            .select_from(WorkflowTask)
-            .where(WorkflowTask.status == TaskStatus.FAILED)
-        )
-        scheduled_tasks = await db.scalar(
-            select(func.count())
-            .select_from(WorkflowTask)
-            .where(WorkflowTask.type == TaskType.LOOP)
-        )
-        llm_tasks = await db.scalar(
-            select(func.count())
-            .select_from(WorkflowTask)
-            .where(WorkflowTask.type == TaskType.LLM)
-        )
-
-        return {
-            "total_tasks": total_tasks or 0,
-            "running_tasks": running_tasks or 0,
-            "completed_tasks": completed_tasks or 0,
-            "failed_tasks": failed_tasks or 0,
-            "scheduled_tasks": scheduled_tasks or 0,
-            "llm_tasks": llm_tasks or 0,
-        }
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"获取仪表盘统计数据失败: {str(e)}"
-        ) 
\ No newline at end of file
+        )
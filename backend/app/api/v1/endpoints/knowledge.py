@@ -1,6 +1,7 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
 from app.models.knowledge import KnowledgeBase, Document
@@ -10,176 +11,224 @@ from app.schemas.knowledge import (
     KnowledgeBaseResponse,
     DocumentCreate,
     DocumentUpdate,
-    DocumentResponse
+    DocumentResponse,
+    DocumentPage,
+    KnowledgeSearchRequest,
+    KnowledgeSearchResponse
 )
+from app.services.knowledge_index import (
+    KnowledgeIndexService,
+    compact_if_needed,
+    ingest_document,
+    local_vector_store,
+    reindex_knowledge_base
+)
+from app.services.lexical_index import local_lexical_store
 
 router = APIRouter()
 
+async def _get_knowledge_base(db: AsyncSession, knowledge_base_id: int) -> KnowledgeBase:
+    knowledge_base = await db.get(KnowledgeBase, knowledge_base_id)
+    if not knowledge_base:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Knowledge base with ID {knowledge_base_id} not found"
+        )
+    return knowledge_base
+
+async def _get_document(db: AsyncSession, knowledge_base_id: int, document_id: int) -> Document:
+    result = await db.execute(
+        select(Document).where(
+            Document.knowledge_base_id == knowledge_base_id,
+            Document.id == document_id
+        )
+    )
+    document = result.scalar_one_or_none()
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document with ID {document_id} not found in knowledge base {knowledge_base_id}"
+        )
+    return document
+
 @router.post("/", response_model=KnowledgeBaseResponse, status_code=status.HTTP_201_CREATED)
-def create_knowledge_base(
+async def create_knowledge_base(
     knowledge_base: KnowledgeBaseCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new knowledge base."""
     db_knowledge_base = KnowledgeBase(**knowledge_base.dict())
     db.add(db_knowledge_base)
-    db.commit()
-    db.refresh(db_knowledge_base)
+    await db.commit()
+    await db.refresh(db_knowledge_base)
     return db_knowledge_base
 
 @router.get("/", response_model=List[KnowledgeBaseResponse])
-def list_knowledge_bases(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+async def list_knowledge_bases(
+    cursor: Optional[int] = Query(None, description="上一页最后一个知识库的ID"),
+    limit: int = Query(100, ge=1, le=1000, description="每页数量"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """List all knowledge bases."""
-    knowledge_bases = db.query(KnowledgeBase).offset(skip).limit(limit).all()
-    return knowledge_bases
+    """List knowledge bases ordered by ID; pass the last ID as cursor for the next page."""
+    stmt = select(KnowledgeBase).order_by(KnowledgeBase.id).limit(limit)
+    if cursor is not None:
+        stmt = stmt.where(KnowledgeBase.id > cursor)
+    result = await db.execute(stmt)
+    return result.scalars().all()
 
 @router.get("/{knowledge_base_id}", response_model=KnowledgeBaseResponse)
-def get_knowledge_base(
+async def get_knowledge_base(
     knowledge_base_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a specific knowledge base by ID."""
-    knowledge_base = db.query(KnowledgeBase).filter(KnowledgeBase.id == knowledge_base_id).first()
-    if not knowledge_base:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Knowledge base with ID {knowledge_base_id} not found"
-        )
-    return knowledge_base
+    return await _get_knowledge_base(db, knowledge_base_id)
 
 @router.put("/{knowledge_base_id}", response_model=KnowledgeBaseResponse)
-def update_knowledge_base(
+async def update_knowledge_base(
     knowledge_base_id: int,
     knowledge_base_update: KnowledgeBaseUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a knowledge base."""
-    db_knowledge_base = db.query(KnowledgeBase).filter(KnowledgeBase.id == knowledge_base_id).first()
-    if not db_knowledge_base:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Knowledge base with ID {knowledge_base_id} not found"
-        )
+    db_knowledge_base = await _get_knowledge_base(db, knowledge_base_id)
     
     for field, value in knowledge_base_update.dict(exclude_unset=True).items():
         setattr(db_knowledge_base, field, value)
     
-    db.commit()
-    db.refresh(db_knowledge_base)
+    await db.commit()
+    await db.refresh(db_knowledge_base)
     return db_knowledge_base
 
 @router.delete("/{knowledge_base_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_knowledge_base(
+async def delete_knowledge_base(
     knowledge_base_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Delete a knowledge base."""
-    db_knowledge_base = db.query(KnowledgeBase).filter(KnowledgeBase.id == knowledge_base_id).first()
-    if not db_knowledge_base:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Knowledge base with ID {knowledge_base_id} not found"
-        )
+    """Delete a knowledge base with its documents and index."""
+    await _get_knowledge_base(db, knowledge_base_id)
     
-    db.delete(db_knowledge_base)
-    db.commit()
+    # 批量删除文档，不把整个知识库的文档加载进会话；片段随知识库级联删除
+    await db.execute(delete(Document).where(Document.knowledge_base_id == knowledge_base_id))
+    await db.execute(delete(KnowledgeBase).where(KnowledgeBase.id == knowledge_base_id))
+    await db.commit()
+    local_vector_store.drop(knowledge_base_id)
+    local_lexical_store.invalidate(knowledge_base_id)
     return None
 
 @router.post("/{knowledge_base_id}/documents", response_model=DocumentResponse)
-def create_document(
+async def create_document(
     knowledge_base_id: int,
     document: DocumentCreate,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Create a new document in a knowledge base."""
-    db_knowledge_base = db.query(KnowledgeBase).filter(KnowledgeBase.id == knowledge_base_id).first()
-    if not db_knowledge_base:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Knowledge base with ID {knowledge_base_id} not found"
-        )
+    """Create a new document in a knowledge base and index it in the background."""
+    await _get_knowledge_base(db, knowledge_base_id)
     
     db_document = Document(**document.dict(), knowledge_base_id=knowledge_base_id)
     db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    await db.commit()
+    await db.refresh(db_document)
+    background_tasks.add_task(ingest_document, db_document.id)
     return db_document
 
-@router.get("/{knowledge_base_id}/documents", response_model=List[DocumentResponse])
-def list_documents(
+@router.get("/{knowledge_base_id}/documents", response_model=DocumentPage)
+async def list_documents(
     knowledge_base_id: int,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[int] = Query(None, description="上一页返回的 next_cursor"),
+    limit: int = Query(100, ge=1, le=1000, description="每页数量"),
+    include_content: bool = Query(False, description="是否返回文档正文"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """List all documents in a knowledge base."""
-    documents = db.query(Document).filter(Document.knowledge_base_id == knowledge_base_id).offset(skip).limit(limit).all()
-    return documents
+    """List documents in a knowledge base with keyset pagination on (knowledge_base_id, id).
+
+    Content is omitted unless include_content is set.
+    """
+    columns = [Document.id, Document.title, Document.knowledge_base_id, Document.created_at, Document.updated_at]
+    if include_content:
+        columns.append(Document.content)
+    # 走 (knowledge_base_id, id) 索引，任意页的代价都相同；多取一行判断是否还有下一页
+    stmt = (
+        select(*columns)
+        .where(Document.knowledge_base_id == knowledge_base_id)
+        .order_by(Document.id)
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(Document.id > cursor)
+    rows = (await db.execute(stmt)).mappings().all()
+
+    items = rows[:limit]
+    next_cursor = items[-1]["id"] if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.get("/{knowledge_base_id}/documents/{document_id}", response_model=DocumentResponse)
-def get_document(
+async def get_document(
     knowledge_base_id: int,
     document_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a specific document by ID."""
-    document = db.query(Document).filter(
-        Document.knowledge_base_id == knowledge_base_id,
-        Document.id == document_id
-    ).first()
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Document with ID {document_id} not found in knowledge base {knowledge_base_id}"
-        )
-    return document
+    return await _get_document(db, knowledge_base_id, document_id)
 
 @router.put("/{knowledge_base_id}/documents/{document_id}", response_model=DocumentResponse)
-def update_document(
+async def update_document(
     knowledge_base_id: int,
     document_id: int,
     document_update: DocumentUpdate,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Update a document."""
-    db_document = db.query(Document).filter(
-        Document.knowledge_base_id == knowledge_base_id,
-        Document.id == document_id
-    ).first()
-    if not db_document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Document with ID {document_id} not found in knowledge base {knowledge_base_id}"
-        )
+    """Update a document; changed content or title is re-indexed in the background."""
+    db_document = await _get_document(db, knowledge_base_id, document_id)
     
-    for field, value in document_update.dict(exclude_unset=True).items():
+    changes = document_update.dict(exclude_unset=True)
+    for field, value in changes.items():
         setattr(db_document, field, value)
     
-    db.commit()
-    db.refresh(db_document)
+    await db.commit()
+    await db.refresh(db_document)
+    if "content" in changes or "title" in changes:
+        background_tasks.add_task(ingest_document, db_document.id)
     return db_document
 
 @router.delete("/{knowledge_base_id}/documents/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_document(
+async def delete_document(
     knowledge_base_id: int,
     document_id: int,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Delete a document."""
-    db_document = db.query(Document).filter(
-        Document.knowledge_base_id == knowledge_base_id,
-        Document.id == document_id
-    ).first()
-    if not db_document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Document with ID {document_id} not found in knowledge base {knowledge_base_id}"
-        )
+    """Delete a document; its chunks are tombstoned and purged by a background compaction."""
+    db_document = await _get_document(db, knowledge_base_id, document_id)
     
-    db.delete(db_document)
-    db.commit()
-    return None 
\ No newline at end of file
+    await KnowledgeIndexService(db).tombstone_document(document_id)
+    await db.delete(db_document)
+    await db.commit()
+    background_tasks.add_task(compact_if_needed, knowledge_base_id)
+    return None
+
+@router.post("/{knowledge_base_id}/search", response_model=KnowledgeSearchResponse)
+async def search_knowledge_base(
+    knowledge_base_id: int,
+    request: KnowledgeSearchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Return the top-k document chunks for the query, fusing vector and full-text rankings by default."""
+    await _get_knowledge_base(db, knowledge_base_id)
+    results = await KnowledgeIndexService(db).search(
+        knowledge_base_id, request.query, request.top_k, request.mode
+    )
+    return {"results": results}
+
+@router.post("/{knowledge_base_id}/reindex", status_code=status.HTTP_202_ACCEPTED)
+async def reindex(
+    knowledge_base_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """Re-chunk every document in the background, re-embedding only changed chunks."""
+    await _get_knowledge_base(db, knowledge_base_id)
+    background_tasks.add_task(reindex_knowledge_base, knowledge_base_id)
+    return {"status": "accepted"}
@@ -0,0 +1,19 @@
+import logging
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.core.metrics import CONTENT_TYPE, EXECUTION_QUEUE_DEPTH, metrics_writer
+from app.services.execution_queue import get_execution_queue
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Expose process metrics in the Prometheus text format"""
+    try:
+        EXECUTION_QUEUE_DEPTH.set(await get_execution_queue().depth())
+    except Exception as e:
+        logger.warning(f"Failed to read execution queue depth: {str(e)}")
+    return Response(metrics_writer.collect(), media_type=CONTENT_TYPE)
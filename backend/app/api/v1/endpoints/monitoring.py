@@ -1,13 +1,17 @@
 from datetime import datetime
-from typing import Optional
-from fastapi import APIRouter, Depends
+from typing import List, Literal, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core import deps
 from app.services.monitoring import MonitoringService
+from app.services.llm_service import llm_response_cache
 from app.schemas.monitoring import (
     TaskExecutionStats,
     WorkflowExecutionStats,
+    ExecutionMetricsBucket,
+    SystemStats,
     MonitoringStats
 )
 
@@ -15,8 +19,8 @@ router = APIRouter()
 
 @router.get("/task-stats", response_model=TaskExecutionStats)
 async def get_task_stats(
-    task_id: Optional[int] = None,
-    execution_id: Optional[int] = None,
+    task_id: Optional[UUID] = None,
+    execution_id: Optional[UUID] = None,
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
     db: AsyncSession = Depends(deps.get_db)
@@ -43,10 +47,50 @@ async def get_workflow_stats(
         end_time=end_time
     )
 
+@router.get("/timeseries", response_model=List[ExecutionMetricsBucket])
+async def get_execution_timeseries(
+    granularity: Literal["minute", "hour", "day"] = "hour",
+    kind: Literal["workflow", "task"] = "workflow",
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    workflow_id: Optional[UUID] = None,
+    user_id: Optional[UUID] = None,
+    task_type: Optional[str] = Query(None, description="kind 为 task 时按任务类型过滤"),
+    db: AsyncSession = Depends(deps.get_db)
+):
+    """Get per-bucket execution counts and durations from the metrics rollups"""
+    monitoring_service = MonitoringService(db)
+    return await monitoring_service.get_execution_timeseries(
+        granularity,
+        kind=kind,
+        start_time=start_time,
+        end_time=end_time,
+        workflow_id=workflow_id,
+        user_id=user_id,
+        task_type=task_type
+    )
+
+@router.get("/system", response_model=SystemStats)
+async def get_system_stats():
+    """Get the latest resource usage sample of this process"""
+    return await MonitoringService.get_system_stats()
+
+@router.get("/system/history", response_model=List[SystemStats])
+async def get_system_stats_history(
+    limit: Optional[int] = Query(None, ge=1, description="只返回最近的若干个样本")
+):
+    """Get recent resource usage samples of this process, oldest first"""
+    return MonitoringService.get_system_stats_history(limit)
+
 @router.get("/stats", response_model=MonitoringStats)
 async def get_monitoring_stats(
     db: AsyncSession = Depends(deps.get_db)
 ):
     """Get all monitoring statistics"""
     monitoring_service = MonitoringService(db)
-    return await monitoring_service.get_monitoring_stats() 
\ No newline at end of file
+    return await monitoring_service.get_monitoring_stats() 
+
+@router.get("/llm-cache")
+async def get_llm_cache_stats():
+    """Get LLM response cache hit/miss counters of this process"""
+    return llm_response_cache.stats()
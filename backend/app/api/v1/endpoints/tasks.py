@@ -15,6 +15,7 @@ from app.schemas.workflow_task import (
     WorkflowTaskResponse
 )
 from app.core.deps import get_current_user
+from app.services.workflow_plan import mark_workflow_changed
 from app.models.user import User
 
 router = APIRouter()
@@ -38,6 +39,7 @@ async def create_task(
     task_data = task.model_dump()
     db_task = WorkflowTask(**task_data)
     db.add(db_task)
+    await mark_workflow_changed(db, db_task.workflow_id)
     await db.commit()
     await db.refresh(db_task)
     return db_task
@@ -182,6 +184,7 @@ async def update_task(
     for field, value in update_data.items():
         setattr(db_task, field, value)
     
+    await mark_workflow_changed(db, db_task.workflow_id)
     await db.commit()
     await db.refresh(db_task)
     
@@ -225,6 +228,7 @@ async def delete_task(
         )
     
     await db.delete(db_task)
+    await mark_workflow_changed(db, db_task.workflow_id)
     await db.commit()
     return {"message": f"Task {task_id} deleted successfully"}
 
@@ -1,25 +1,28 @@
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from app.core.database import get_db
+from app.core.sse import event_stream_response
 from app.models.workflow import Workflow
 from app.models.workflow_task import WorkflowTask, TaskType, TaskStatus
 from app.schemas.workflow import (
     WorkflowCreate,
     WorkflowUpdate,
-    WorkflowResponse,
-    WorkflowExecutionResponse
+    WorkflowResponse
 )
+from app.schemas.workflow_execution import WorkflowExecutionResponse
 from app.schemas.workflow_task import (
     WorkflowTaskCreate,
     WorkflowTaskUpdate,
     WorkflowTaskResponse
 )
-from app.services.workflow_engine import WorkflowEngine
+from app.services.workflow_engine import WorkflowEngine, stream_execution
+from app.services.execution_queue import ExecutionJob, get_execution_queue
+from app.services.workflow_plan import mark_workflow_changed, workflow_plan_cache
 from app.core.auth import get_current_user
 from app.models.user import User
 from app.core.deps import get_current_user
@@ -116,6 +119,7 @@ async def update_workflow(
     for field, value in update_data.items():
         setattr(db_workflow, field, value)
     
+    await mark_workflow_changed(db, workflow_id)
     await db.commit()
     await db.refresh(db_workflow)
     return db_workflow
@@ -136,6 +140,7 @@ async def delete_workflow(
     
     await db.delete(db_workflow)
     await db.commit()
+    workflow_plan_cache.invalidate(workflow_id)
     return {"message": "工作流已删除"}
 
 
@@ -165,6 +170,7 @@ async def create_workflow_task(
         **task_data
     )
     db.add(db_task)
+    await mark_workflow_changed(db, workflow_id)
     await db.commit()
     await db.refresh(db_task)
     return db_task
@@ -191,31 +197,82 @@ async def list_workflow_tasks(
     return workflow.tasks
 
 
-@router.post("/{workflow_id}/execute", response_model=WorkflowExecutionResponse)
+@router.post(
+    "/{workflow_id}/execute",
+    response_model=WorkflowExecutionResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
 async def execute_workflow(
     workflow_id: UUID,
+    input_data: Optional[Dict[str, Any]] = Body(None),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Execute workflow."""
-    stmt = select(Workflow).where(
+    """Execute workflow.
+
+    创建执行记录并放入执行队列后立即返回，由 worker 异步执行；
+    通过 GET /executions/{id} 查询执行状态和结果。
+    """
+    stmt = select(Workflow.id).where(
         Workflow.id == workflow_id,
         Workflow.user_id == current_user.id
     )
     result = await db.execute(stmt)
-    workflow = result.scalar_one_or_none()
-    if not workflow:
+    if result.scalar_one_or_none() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Workflow not found"
         )
     
     engine = WorkflowEngine(db)
+    execution = await engine.create_execution(workflow_id, current_user.id, input_data)
+    job = ExecutionJob(
+        execution_id=str(execution.id),
+        workflow_id=str(workflow_id),
+        user_id=str(current_user.id),
+        input_data=input_data or {}
+    )
     try:
-        execution = await engine.execute_workflow(workflow_id, current_user.id)
-        return execution
+        await get_execution_queue().enqueue(job)
     except Exception as e:
+        await engine.fail_execution(execution, f"Failed to enqueue execution: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
-        )
\ No newline at end of file
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Execution queue is unavailable"
+        )
+    return execution
+
+
+@router.post("/{workflow_id}/execute/stream")
+async def execute_workflow_stream(
+    workflow_id: UUID,
+    input_data: Optional[Dict[str, Any]] = Body(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Execute workflow and stream progress as Server-Sent Events.
+
+    不经过执行队列，在当前进程中运行，依次推送 execution_created、execution_started、
+    task_running / task_completed / task_failed 以及 execution_completed 或 execution_failed 事件。
+    """
+    stmt = select(Workflow.id).where(
+        Workflow.id == workflow_id,
+        Workflow.user_id == current_user.id
+    )
+    result = await db.execute(stmt)
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Workflow not found"
+        )
+    
+    engine = WorkflowEngine(db)
+    execution = await engine.create_execution(workflow_id, current_user.id, input_data)
+    execution_id = execution.id
+    
+    async def events():
+        yield {"event": "execution_created", "data": {"execution_id": execution_id}}
+        async for event in stream_execution(execution_id):
+            yield event
+    
+    return event_stream_response(events())
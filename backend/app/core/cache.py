@@ -0,0 +1,175 @@
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(*parts: Any) -> str:
+    """对请求内容做规范化 JSON 序列化后取 SHA-256，字段顺序不同的相同请求得到同一个键"""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """进程内 LRU 缓存，每个条目带过期时间，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, maxsize: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """返回 (是否命中, 值)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        self._entries[key] = (self.clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TieredCache:
+    """两级缓存：进程内 LRU 在前，可选的 Redis 在后，多个进程共享 Redis 中的条目
+
+    值以 JSON 存入 Redis；Redis 不可用时只记录警告并按未命中处理。
+    命中和未命中按 namespace 分别计数。get_or_load 合并同一进程内对同一个键的并发加载。
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, redis: Optional[Callable] = None):
+        self.name = name
+        self.local = TTLCache(maxsize)
+        # 传入返回 Redis 客户端的函数，首次访问时才创建连接
+        self.redis = redis
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.redis_hits: Counter = Counter()
+        self.coalesced = 0
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.name}:{key}"
+
+    async def get(self, key: str, namespace: str = "default") -> Tuple[bool, Any]:
+        """返回 (是否命中, 值)"""
+        hit, value = self.local.get(key)
+        if hit:
+            self.hits[namespace] += 1
+            return True, value
+
+        if self.redis is not None:
+            try:
+                async with self.redis().pipeline(transaction=False) as pipe:
+                    pipe.get(self._redis_key(key))
+                    pipe.ttl(self._redis_key(key))
+                    raw, ttl = await pipe.execute()
+                if raw is not None:
+                    value = json.loads(raw)
+                    # 回填本地缓存，过期时间不超过 Redis 中剩余的时间
+                    if ttl and ttl > 0:
+                        self.local.set(key, value, ttl)
+                    self.hits[namespace] += 1
+                    self.redis_hits[namespace] += 1
+                    return True, value
+            except Exception as e:
+                logger.warning(f"Cache {self.name} redis get failed: {str(e)}")
+
+        self.misses[namespace] += 1
+        return False, None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        self.local.set(key, value, ttl)
+        if self.redis is not None:
+            try:
+                await self.redis().set(
+                    self._redis_key(key),
+                    json.dumps(value, ensure_ascii=False, default=str),
+                    ex=max(int(ttl), 1)
+                )
+            except Exception as e:
+                logger.warning(f"Cache {self.name} redis set failed: {str(e)}")
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+        if self.redis is not None:
+            try:
+                await self.redis().delete(self._redis_key(key))
+            except Exception as e:
+                logger.warning(f"Cache {self.name} redis delete failed: {str(e)}")
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float,
+        namespace: str = "default"
+    ) -> Any:
+        """读取缓存，未命中时调用 loader 加载并写入
+
+        同一个键同时只有一次加载在进行，其余未命中的调用等待这次加载的结果。
+        加载在独立的任务中运行，发起加载的请求被取消时不影响其他等待者，
+        因此 loader 不应依赖调用方请求范围内的资源（如请求的数据库会话）。
+        """
+        hit, value = await self.get(key, namespace)
+        if hit:
+            return value
+
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(key, loader, ttl))
+            self._loading[key] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(loading)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        value = await loader()
+        await self.set(key, value, ttl)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        hits = sum(self.hits.values())
+        misses = sum(self.misses.values())
+        namespaces = set(self.hits) | set(self.misses)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "redis_hits": sum(self.redis_hits.values()),
+            "coalesced": self.coalesced,
+            "local_size": len(self.local),
+            "namespaces": {
+                namespace: {
+                    "hits": self.hits[namespace],
+                    "misses": self.misses[namespace],
+                    "redis_hits": self.redis_hits[namespace]
+                }
+                for namespace in sorted(namespaces)
+            }
+        }
@@ -73,8 +73,89 @@ class Settings(BaseSettings):
         """构建同步数据库 URI"""
         return f"postgresql+psycopg2://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    # Redis settings
+    REDIS_URL: str = read_secret("redis_url", "redis://localhost:6379/0")
+
+    # Execution queue settings
+    EXECUTION_QUEUE_BACKEND: str = "redis"  # redis 或 memory（本地开发/测试，进程内执行）
+    EXECUTION_QUEUE_NAME: str = "bizbrain:executions"
+    EXECUTION_VISIBILITY_TIMEOUT: int = 600  # 任务被领取后未确认的最长时间（秒），超时重新投递
+    EXECUTION_MAX_DELIVERIES: int = 5  # 同一任务最多投递次数，超过后标记执行失败
+    WORKER_CONCURRENCY: int = 4  # 每个 worker 进程同时执行的工作流数
+
+    # HTTP client settings
+    HTTP_TIMEOUT: float = 60.0  # 外部请求的读写超时（秒）
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP_MAX_CONNECTIONS: int = 100  # default 客户端对所有主机合计的最大连接数
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20  # default 客户端对单个主机的最大并发请求数
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20  # 保持空闲以供复用的连接数
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保持时间（秒）
+    HTTP2_ENABLED: bool = False  # 需要另行安装 h2（httpx[http2]），未安装时回退到 HTTP/1.1
+    LLM_MAX_CONNECTIONS: int = 50  # 到 LLM 服务的最大连接数
+
     # OpenAI settings
     OPENAI_API_KEY: str = read_secret("openai_api_key", "")
+    OPENAI_API_BASE: Optional[str] = None  # 兼容 OpenAI 协议的代理或私有部署地址
+    EMBEDDING_BATCH_SIZE: int = 512  # 单次嵌入请求的最大文本条数
+    EMBEDDING_BATCH_MAX_CHARS: int = 400000  # 单次嵌入请求的最大总字符数，约束请求的总 token 数
+    EMBEDDING_COALESCE_WINDOW_MS: int = 5  # 合并并发单条嵌入请求的等待窗口（毫秒）
+    LLM_RATE_LIMIT_RPM: int = 3500  # 每个进程中每个模型的每分钟请求数上限（初始值，之后按响应头校准），0 表示不限制
+    LLM_RATE_LIMIT_TPM: int = 90000  # 每个进程中每个模型的每分钟 token 数上限（初始值，之后按响应头校准），0 表示不限制
+    LLM_RATE_LIMIT_DEFAULT_BACKOFF: float = 5.0  # 429 响应未给出 Retry-After 时的暂停时间（秒）
+    AGENT_EXECUTOR_CACHE_SIZE: int = 128  # 缓存的 AgentExecutor 数量
+    AGENT_MEMORY_MAX_TURNS: int = 10  # 会话记忆保留的最近对话轮数
+    AGENT_MEMORY_MAX_TOKENS: int = 2000  # 会话记忆窗口的 token 上限
+    AGENT_MEMORY_SUMMARY_BATCH: int = 10  # 窗口外积累的消息数达到该值时合并进摘要
+    AGENT_MEMORY_SUMMARY_MODEL: str = "gpt-3.5-turbo"
+    AGENT_MEMORY_SUMMARY_MAX_TOKENS: int = 500
+
+    # Knowledge base retrieval settings
+    EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    EMBEDDING_DIMENSIONS: int = 1536  # 需与 pgvector 列的维度一致
+    KNOWLEDGE_CHUNK_SIZE: int = 1000  # 文档切分的片段长度（字符）
+    KNOWLEDGE_CHUNK_OVERLAP: int = 200  # 相邻片段的重叠字符数
+    KNOWLEDGE_INGEST_BATCH_DOCUMENTS: int = 50  # 重建索引时每批嵌入的文档数
+    VECTOR_INDEX_BACKEND: str = "auto"  # auto（有 pgvector 列时使用）、pgvector 或 local
+    VECTOR_INDEX_DIR: Optional[str] = None  # 本地索引文件目录，默认系统临时目录
+    VECTOR_INDEX_CACHE_SIZE: int = 32  # 进程内缓存的知识库索引数量
+    VECTOR_INDEX_COMPACTION_RATIO: float = 0.1  # 墓碑和增量片段超过有效片段的该比例时压缩
+    VECTOR_INDEX_COMPACTION_MIN: int = 100  # 触发压缩的最少墓碑和增量片段数
+    LEXICAL_INDEX_BACKEND: str = "postgres"  # postgres（tsvector + GIN）或 local（进程内 BM25）
+    KNOWLEDGE_RRF_K: int = 60  # 倒数排名融合的平滑常数
+    KNOWLEDGE_HYBRID_CANDIDATES: int = 4  # 混合检索时每路召回 top_k 的倍数
+
+    # LLM response cache settings
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_SIZE: int = 2048  # 进程内缓存的响应条数
+    LLM_CACHE_REDIS_ENABLED: bool = False  # 是否启用 Redis 二级缓存，多进程共享
+    LLM_CACHE_TTLS: Dict[str, int] = {  # 各操作的缓存时间（秒）
+        "completion": 3600,
+        "embedding": 7 * 24 * 3600,
+        "sentiment": 24 * 3600,
+        "entities": 24 * 3600,
+        "summary": 24 * 3600
+    }
+
+    # Workflow engine settings
+    WORKFLOW_MAX_CONCURRENCY: int = 8  # 单次执行中同时运行的任务数上限
+    PARALLEL_MAX_CONCURRENCY: int = 10  # 并行任务默认同时运行的分支数
+    LOOP_BATCH_SIZE: int = 100  # 循环任务每个分块的循环项数
+    TASK_RETRY_MAX_DELAY: float = 60.0  # 任务重试的指数退避上限（秒）
+    WORKFLOW_PLAN_CACHE_SIZE: int = 256  # 编译执行计划缓存的工作流数量
+    TASK_LOG_BATCH_SIZE: int = 200  # 任务日志缓冲达到该条数时批量写入
+    TASK_LOG_FLUSH_INTERVAL: float = 1.0  # 任务日志最长缓冲时间（秒）
+    METRICS_ROLLUP_RETENTION_DAYS: Dict[str, int] = {  # 执行指标各粒度桶的保留天数，未列出的粒度永久保留
+        "minute": 2,
+        "hour": 90
+    }
+    METRICS_ROLLUP_PURGE_INTERVAL: int = 3600  # worker 清理过期指标桶的间隔（秒）
+    DASHBOARD_CACHE_TTL: float = 5.0  # 仪表盘统计的缓存时间（秒），0 表示不缓存
+    DASHBOARD_CACHE_REDIS_ENABLED: bool = True  # 是否在多个进程间通过 Redis 共享仪表盘统计
+    SYSTEM_METRICS_INTERVAL: float = 5.0  # 系统指标采样间隔（秒）
+    SYSTEM_METRICS_BUFFER_SIZE: int = 720  # 保留的样本数，默认约 1 小时
+    SYSTEM_METRICS_LAG_WARNING: float = 0.5  # 事件循环延迟超过该值（秒）时记录警告
+    METRICS_MULTIPROC_DIR: Optional[str] = None  # 多进程部署时各进程写入指标快照的目录，不设置时 /metrics 只输出本进程
+    METRICS_FLUSH_INTERVAL: float = 5.0  # 写入指标快照的间隔（秒）
 
     # Token settings
     SECRET_KEY: str = read_secret("secret_key", secrets.token_urlsafe(32))
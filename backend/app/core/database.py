@@ -3,6 +3,7 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine import URL
 from sqlalchemy.dialects import postgresql
 from ..core.config import settings
+from ..core.metrics import instrument_engine
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,6 +29,7 @@ engine = create_async_engine(
     pool_recycle=1800,  # 30分钟后回收连接
     future=True
 )
+instrument_engine(engine)
 
 # 创建异步会话工厂
 AsyncSessionLocal = sessionmaker(
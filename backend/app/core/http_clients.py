@@ -0,0 +1,118 @@
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import importlib.util
+import logging
+import httpx
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    if not settings.HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP2_ENABLED is set but the h2 package is not installed, falling back to HTTP/1.1")
+        return False
+    return True
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """响应体读完或关闭时释放主机的连接名额"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class PerHostLimitTransport(httpx.AsyncBaseTransport):
+    """在连接池外按目标主机限制并发请求数，一个慢上游最多占用 max_per_host 个连接
+
+    请求从发出到响应体关闭期间占用名额；等待名额的时间计入 pool 超时，超时抛出 httpx.PoolTimeout。
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self._transport = transport
+        self.max_per_host = max_per_host
+        self._semaphores: Dict[Tuple[bytes, bytes, Optional[int]], asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = request.url
+        semaphore = self._semaphores.setdefault(
+            (url.raw_scheme, url.raw_host, url.port), asyncio.Semaphore(self.max_per_host)
+        )
+        timeout = request.extensions.get("timeout", {}).get("pool")
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout(f"Timed out waiting for a connection to {url.host}", request=request)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, semaphore.release)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def get_http_client(
+    name: str = "default",
+    base_url: str = "",
+    headers: Optional[Dict[str, str]] = None,
+    max_connections: Optional[int] = None,
+    max_connections_per_host: Optional[int] = None
+) -> httpx.AsyncClient:
+    """获取进程内共享的命名 HTTP 客户端（首次调用时按参数创建，之后复用同一个连接池）
+
+    default 客户端由所有外部 API 共享：HTTP_MAX_CONNECTIONS 是所有主机合计的连接上限，
+    HTTP_MAX_CONNECTIONS_PER_HOST 限制单个主机的并发请求数，一个慢上游不会占满整个连接池；
+    高频访问的上游（如 LLM 服务）使用独立命名的客户端，max_connections 即该上游单独的连接上限。
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        max_connections = max_connections or settings.HTTP_MAX_CONNECTIONS
+        max_connections_per_host = max_connections_per_host or settings.HTTP_MAX_CONNECTIONS_PER_HOST
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=min(settings.HTTP_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+            ),
+            # 上游支持时通过 ALPN 协商 HTTP/2，多个请求复用同一连接
+            http2=_http2_available()
+        )
+        if max_connections_per_host < max_connections:
+            transport = PerHostLimitTransport(transport, max_connections_per_host)
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            transport=transport
+        )
+        _clients[name] = client
+    return client
+
+
+async def close_http_clients():
+    """关闭所有共享的 HTTP 客户端"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,373 @@
+"""进程内指标和 Prometheus 文本格式输出
+
+计数在各进程内存中累加，热路径上只有字典查找和加法，不加锁（只在事件循环线程中更新）。
+设置 METRICS_MULTIPROC_DIR 后，每个进程定期把快照写入该目录下的 {pid}.json，
+/metrics 读取目录中所有快照合并输出：计数器和直方图累加，已退出进程的保留；
+Gauge 只合并仍存活的进程。该目录应在部署启动前清空，并且不在多台主机间共享。
+"""
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import logging
+import os
+import time
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# 请求、查询等短耗时操作的区间上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 任务和 LLM 调用的区间上界（秒），与执行指标汇总表的区间一致
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], Any] = {}
+
+    def _snapshot_values(self) -> List[list]:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": self._snapshot_values(),
+        }
+
+
+class Counter(_Metric):
+    """单调递增的计数，名称应以 _total 结尾"""
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的当前值
+
+    multiprocess_mode 决定多进程合并方式：sum 累加各进程的值，max 取最大值，
+    latest 取最近写入快照的进程的值（如各进程看到的同一个共享队列的长度）。
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum"):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, *labels: str):
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), "mode": self.multiprocess_mode}
+
+
+class Histogram(_Metric):
+    """按固定区间计数，每组标签保存 [各区间计数..., 总和]，输出时再累计"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        counts = self.values.get(labels)
+        if counts is None:
+            # 最后两个位置分别是超出最大上界的计数和总和
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum") -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, multiprocess_mode))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "written_at": time.time(),
+            "metrics": {name: metric.snapshot() for name, metric in self.metrics.items()},
+        }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]], live_pids: Optional[set] = None) -> Dict[str, Dict[str, Any]]:
+    """合并多个进程的快照；live_pids 为 None 时视所有进程为存活"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    # 按写入时间排序，latest 模式的 Gauge 后写入的覆盖先写入的
+    for snapshot in sorted(snapshots, key=lambda item: item.get("written_at", 0)):
+        alive = live_pids is None or snapshot.get("pid") in live_pids
+        for name, metric in snapshot["metrics"].items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            samples = target["samples"]
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = list(value) if isinstance(value, list) else value
+                elif metric["type"] == "histogram":
+                    samples[key] = [a + b for a, b in zip(current, value)]
+                elif metric["type"] == "gauge" and metric.get("mode") == "max":
+                    samples[key] = max(current, value)
+                elif metric["type"] == "gauge" and metric.get("mode") == "latest":
+                    samples[key] = value
+                else:
+                    samples[key] = current + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(merged: Dict[str, Dict[str, Any]]) -> str:
+    """按 Prometheus 文本格式（0.0.4）输出"""
+    lines: List[str] = []
+    for name in sorted(merged):
+        metric = merged[name]
+        names = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(names, labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for upper, count in zip(list(metric["buckets"]) + [float("inf")], value[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(upper)}"'
+                lines.append(f"{name}_bucket{_format_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(names, labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class MultiprocessWriter:
+    """定期将本进程的快照写入 METRICS_MULTIPROC_DIR"""
+
+    def __init__(self, registry: MetricsRegistry, directory: Optional[str] = None, interval: float = None):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval or settings.METRICS_FLUSH_INTERVAL
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def write(self):
+        """先写临时文件再原子替换，读取方不会读到写了一半的快照"""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.registry.snapshot(), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        """读取目录中所有进程的快照，本进程直接使用内存中的值"""
+        own_pid = os.getpid()
+        snapshots = [self.registry.snapshot()]
+        if not self.enabled or not os.path.isdir(self.directory):
+            return snapshots
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json") or filename == f"{own_pid}.json":
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to read metrics snapshot {filename}: {str(e)}")
+        return snapshots
+
+    def collect(self) -> str:
+        snapshots = self.read_all()
+        live_pids = {snapshot["pid"] for snapshot in snapshots if _pid_alive(snapshot["pid"])}
+        return render(merge_snapshots(snapshots, live_pids))
+
+    def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # 退出前写入最后的计数，已退出进程的计数器仍计入合计
+        try:
+            self.write()
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"Failed to write metrics snapshot: {str(e)}")
+
+
+registry = MetricsRegistry()
+metrics_writer = MultiprocessWriter(registry, settings.METRICS_MULTIPROC_DIR)
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "bizbrain_http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status")
+)
+DB_QUERY_DURATION = registry.histogram(
+    "bizbrain_db_query_duration_seconds", "Database statement latency by statement type", ("operation",)
+)
+TASK_DURATION = registry.histogram(
+    "bizbrain_task_duration_seconds", "Task execution time including retries", ("task_type", "status"),
+    buckets=DURATION_BUCKETS
+)
+TASK_RETRIES = registry.counter("bizbrain_task_retries_total", "Task attempts that were retried", ("task_type",))
+TASKS_IN_PROGRESS = registry.gauge("bizbrain_tasks_in_progress", "Tasks currently executing", ("task_type",))
+LLM_REQUEST_DURATION = registry.histogram(
+    "bizbrain_llm_request_duration_seconds", "LLM API call latency", ("model", "endpoint", "outcome"),
+    buckets=DURATION_BUCKETS
+)
+LLM_TOKENS = registry.counter("bizbrain_llm_tokens_total", "Tokens reported by the LLM API", ("model", "kind"))
+EXECUTION_QUEUE_DEPTH = registry.gauge(
+    "bizbrain_execution_queue_depth", "Jobs waiting in the execution queue", multiprocess_mode="latest"
+)
+EXECUTIONS_IN_PROGRESS = registry.gauge("bizbrain_executions_in_progress", "Workflow executions currently running")
+PROCESS_CPU = registry.gauge("bizbrain_process_cpu_percent", "Process CPU usage as percent of one core")
+PROCESS_RSS = registry.gauge("bizbrain_process_resident_memory_bytes", "Process resident memory")
+PROCESS_OPEN_FDS = registry.gauge("bizbrain_process_open_fds", "Process open file descriptors")
+EVENT_LOOP_LAG = registry.gauge(
+    "bizbrain_event_loop_lag_seconds", "Largest event loop lag among processes", multiprocess_mode="max"
+)
+DB_POOL_CHECKED_OUT = registry.gauge("bizbrain_db_pool_checked_out", "Database connections checked out")
+DB_POOL_OVERFLOW = registry.gauge("bizbrain_db_pool_overflow", "Database connections opened beyond pool_size")
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+def _operation(statement: str) -> str:
+    operation = statement.lstrip()[:8].split(None, 1)[0].upper() if statement.strip() else ""
+    return operation if operation in _OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine):
+    """在 SQLAlchemy 引擎上记录每条语句的耗时"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, _operation(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            DB_QUERY_DURATION.observe(time.perf_counter() - started.pop(), "ERROR")
+
+
+class MetricsMiddleware:
+    """记录 HTTP 请求耗时，按路由模板而不是实际路径分组，避免标签基数随路径参数增长"""
+
+    def __init__(self, app, exclude: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status)
+            )
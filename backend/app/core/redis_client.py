@@ -0,0 +1,24 @@
+from typing import Optional
+from redis import asyncio as aioredis
+from ..core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+_redis: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """获取进程内共享的 Redis 客户端（自带连接池，首次调用时创建）"""
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+
+async def close_redis():
+    """关闭 Redis 客户端"""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
@@ -0,0 +1,26 @@
+from typing import Any, AsyncIterator, Dict
+import json
+from fastapi.responses import StreamingResponse
+
+
+def format_sse(event: str, data: Any) -> str:
+    """格式化为一条 Server-Sent Events 消息"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def event_stream_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """将 {"event": ..., "data": ...} 事件流包装为 text/event-stream 响应"""
+    async def body():
+        async for event in events:
+            yield format_sse(event["event"], event.get("data"))
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 关闭 nginx 缓冲，事件到达即转发
+            "X-Accel-Buffering": "no"
+        }
+    )
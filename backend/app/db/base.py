@@ -6,5 +6,8 @@ from app.models.workflow_execution import WorkflowExecution  # noqa
 from app.models.task_log import TaskLog  # noqa
 from app.models.execution_log import ExecutionLog  # noqa
 from app.models.agent import Agent  # noqa
+from app.models.knowledge import KnowledgeBase, Document, DocumentChunk  # noqa
+from app.models.conversation import AgentConversation, AgentConversationMessage  # noqa
+from app.models.metrics_rollup import ExecutionMetricRollup  # noqa
 
 # This will make sure all models are registered properly before being used by Alembic
\ No newline at end of file
@@ -6,6 +6,9 @@ from app.models.workflow_execution import WorkflowExecution
 from app.models.task_log import TaskLog
 from app.models.execution_log import ExecutionLog
 from app.models.agent import Agent
+from app.models.knowledge import KnowledgeBase, Document, DocumentChunk
+from app.models.conversation import AgentConversation, AgentConversationMessage
+from app.models.metrics_rollup import ExecutionMetricRollup
 
 __all__ = [
     "User",
@@ -14,5 +17,11 @@ __all__ = [
     "WorkflowExecution",
     "TaskLog",
     "ExecutionLog",
-    "Agent"
+    "Agent",
+    "AgentConversation",
+    "AgentConversationMessage",
+    "KnowledgeBase",
+    "Document",
+    "DocumentChunk",
+    "ExecutionMetricRollup"
 ] 
\ No newline at end of file
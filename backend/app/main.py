@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 from fastapi import FastAPI
@@ -5,7 +6,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.api import api_router
 from app.core.config import settings
 from app.core.init_db import init_db
-from app.api.v1.endpoints import docs
+from app.core.http_clients import close_http_clients
+from app.core.metrics import MetricsMiddleware, metrics_writer
+from app.core.redis_client import close_redis
+from app.services.execution_queue import get_execution_queue
+from app.services.llm_service import get_llm_service
+from app.services.system_metrics import system_metrics_sampler
+from app.worker import ExecutionWorker
+from app.api.v1.endpoints import docs, metrics
 
 # 配置根日志记录器
 root_logger = logging.getLogger()
@@ -40,6 +48,10 @@ if settings.BACKEND_CORS_ORIGINS:
         expose_headers=["*"]
     )
 
+# 按路由记录请求耗时，放在最外层以包含其他中间件的耗时
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(metrics.router, tags=["metrics"])
 app.include_router(docs.router, prefix=f"{settings.API_V1_STR}/docs", tags=["documentation"])
 app.include_router(api_router)
 
@@ -47,8 +59,26 @@ app.include_router(api_router)
 async def startup_event():
     logging.info("Starting up application...")
     await init_db()
+    system_metrics_sampler.start()
+    metrics_writer.start()
+    if settings.EXECUTION_QUEUE_BACKEND == "memory":
+        # 内存队列只能在本进程内消费，启动进程内 worker
+        app.state.execution_worker = ExecutionWorker(get_execution_queue())
+        app.state.execution_worker_task = asyncio.create_task(app.state.execution_worker.run())
     logging.info("Application startup complete")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    worker = getattr(app.state, "execution_worker", None)
+    if worker:
+        worker.stop()
+        await app.state.execution_worker_task
+    await system_metrics_sampler.stop()
+    await metrics_writer.stop()
+    await get_llm_service().close()
+    await close_http_clients()
+    await close_redis()
+
 @app.get("/")
 async def root():
     return {}
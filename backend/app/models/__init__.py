@@ -5,6 +5,9 @@ from .workflow_task import WorkflowTask
 from .task_log import TaskLog
 from .execution_log import ExecutionLog
 from .agent import Agent
+from .conversation import AgentConversation, AgentConversationMessage
+from .knowledge import KnowledgeBase, Document, DocumentChunk
+from .metrics_rollup import ExecutionMetricRollup
 
 __all__ = [
     'User',
@@ -13,5 +16,11 @@ __all__ = [
     'WorkflowTask',
     'TaskLog',
     'ExecutionLog',
-    'Agent'
+    'Agent',
+    'AgentConversation',
+    'AgentConversationMessage',
+    'KnowledgeBase',
+    'Document',
+    'DocumentChunk',
+    'ExecutionMetricRollup'
 ] 
\ No newline at end of file
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, DateTime, Index
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+
+class AgentConversation(Base):
+    """Agent 会话：保存早期对话的滚动摘要"""
+    __tablename__ = "agent_conversations"
+
+    agent_id = Column(Integer, ForeignKey("agents.id", ondelete="CASCADE"), primary_key=True)
+    session_id = Column(String(128), primary_key=True)
+    summary = Column(Text, nullable=True)
+    # 已并入摘要的最后一条消息ID，之后的消息逐条保留
+    summarized_until_id = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # 尚未并入摘要的消息数，达到阈值时触发摘要
+    pending_messages = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class AgentConversationMessage(Base):
+    """Agent 会话中的单条消息"""
+    __tablename__ = "agent_conversation_messages"
+    __table_args__ = (
+        # 按会话倒序读取最近 N 条消息
+        Index("ix_agent_conversation_messages_session", "agent_id", "session_id", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    agent_id = Column(Integer, ForeignKey("agents.id", ondelete="CASCADE"), nullable=False)
+    session_id = Column(String(128), nullable=False)
+    role = Column(String(16), nullable=False)  # human 或 ai
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
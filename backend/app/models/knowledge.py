@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, LargeBinary, Index, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -18,6 +19,10 @@ class KnowledgeBase(Base):
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # 按知识库分页列出文档
+        Index("ix_documents_knowledge_base_id_id", "knowledge_base_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
@@ -27,4 +32,38 @@ class Document(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationship with knowledge base
-    knowledge_base = relationship("KnowledgeBase", back_populates="documents") 
\ No newline at end of file
+    knowledge_base = relationship("KnowledgeBase", back_populates="documents")
+    # 删除文档时由数据库把片段的 document_id 置空，片段作为墓碑保留到压缩
+    chunks = relationship("DocumentChunk", back_populates="document", passive_deletes=True)
+
+class DocumentChunk(Base):
+    """文档切分后的片段及其嵌入向量"""
+    __tablename__ = "document_chunks"
+    __table_args__ = (
+        Index("ix_document_chunks_kb_id", "knowledge_base_id", "id"),
+        Index("ix_document_chunks_document_id", "document_id", "chunk_index"),
+        Index("ix_document_chunks_content_hash", "knowledge_base_id", "content_hash"),
+        Index(
+            "ix_document_chunks_tombstones", "knowledge_base_id", "id",
+            postgresql_where=text("deleted_at IS NOT NULL")
+        ),
+        Index("ix_document_chunks_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
+    # 冗余知识库ID，按知识库构建索引时不需要关联 documents
+    knowledge_base_id = Column(Integer, ForeignKey("knowledge_bases.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    # 片段内容的 SHA-256，内容未变的片段更新时复用已有向量
+    content_hash = Column(String(64), nullable=False)
+    # float32 小端字节序的向量；启用 pgvector 时另有 embedding_vector 列（由迁移按需创建）
+    embedding = Column(LargeBinary, nullable=True)
+    # 标题和片段内容的全文检索向量，由索引服务写入
+    search_vector = Column(TSVECTOR, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # 墓碑：片段已失效但尚未从索引中清除，检索时过滤，由后台压缩删除
+    deleted_at = Column(DateTime, nullable=True)
+
+    document = relationship("Document", back_populates="chunks") 
\ No newline at end of file
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, BigInteger, Float, String, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from app.db.base_class import Base
+
+
+class ExecutionMetricRollup(Base):
+    """按分钟/小时/天分桶预聚合的执行指标
+
+    每个工作流执行结束时增量累加；kind 为 workflow 时 task_type 为空字符串。
+    主键以 (granularity, bucket_start) 开头，按时间范围读取时只扫描涉及的桶。
+    """
+    __tablename__ = "execution_metric_rollups"
+
+    granularity = Column(String(8), primary_key=True)  # minute、hour 或 day
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)  # 按执行创建时间（UTC）截断
+    kind = Column(String(16), primary_key=True)  # workflow 或 task
+    task_type = Column(String(32), primary_key=True, default="")
+    status = Column(String(16), primary_key=True)  # completed 或 failed
+    workflow_id = Column(UUID(as_uuid=True), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+    # 有执行时长的样本数及其合计/最大值，以及按固定区间统计的直方图（用于估算分位数）
+    duration_count = Column(BigInteger, nullable=False, default=0)
+    duration_sum = Column(Float, nullable=False, default=0.0)
+    duration_max = Column(Float, nullable=True)
+    duration_histogram = Column(ARRAY(BigInteger), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, JSON, DateTime, ForeignKey, Enum, text
+from sqlalchemy import Column, String, JSON, DateTime, ForeignKey, Enum, text, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
@@ -15,6 +15,9 @@ class TaskLogStatus(PyEnum):
 class TaskLog(Base):
     """任务日志模型"""
     __tablename__ = "task_logs"
+    __table_args__ = (
+        Index("ix_task_logs_execution_id_task_id", "execution_id", "task_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, server_default=text('gen_random_uuid()'))
     task_id = Column(UUID(as_uuid=True), ForeignKey("workflow_tasks.id"), nullable=False)
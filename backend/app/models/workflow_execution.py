@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, JSON, DateTime, ForeignKey, Enum, text
+from sqlalchemy import Column, String, JSON, DateTime, ForeignKey, Enum, text, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
@@ -15,6 +15,18 @@ class ExecutionStatus(PyEnum):
 class WorkflowExecution(Base):
     """工作流执行模型"""
     __tablename__ = "workflow_executions"
+    __table_args__ = (
+        # 监控统计按创建时间过滤，聚合所需的列都在索引里，可以只扫描索引
+        Index(
+            "ix_workflow_executions_created_at_stats", "created_at",
+            postgresql_include=["status", "started_at", "completed_at"]
+        ),
+        # 未结束的执行只占一小部分，单独计数时只扫描这部分
+        Index(
+            "ix_workflow_executions_active", "created_at",
+            postgresql_where=text("status IN ('PENDING', 'RUNNING')")
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, server_default=text('gen_random_uuid()'))
     workflow_id = Column(UUID(as_uuid=True), ForeignKey("workflows.id"), nullable=False)
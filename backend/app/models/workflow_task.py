@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, JSON, ForeignKey, DateTime, Enum, Table, text, Integer
+from sqlalchemy import Column, String, JSON, ForeignKey, DateTime, Enum, Table, text, Integer, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -36,6 +36,13 @@ task_dependencies = Table(
 class WorkflowTask(Base):
     """工作流任务模型"""
     __tablename__ = "workflow_tasks"
+    __table_args__ = (
+        # 监控统计按创建时间过滤，聚合所需的列都在索引里，可以只扫描索引
+        Index(
+            "ix_workflow_tasks_created_at_stats", "created_at",
+            postgresql_include=["type", "status", "started_at", "completed_at"]
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, server_default=text('gen_random_uuid()'))
     workflow_id = Column(UUID(as_uuid=True), ForeignKey("workflows.id"), nullable=False)
@@ -58,6 +58,7 @@ class AgentInDB(AgentCreate):
 
 class AgentExecutionRequest(BaseModel):
     input_text: str
+    session_id: Optional[str] = Field(None, max_length=128, description="会话ID，启用记忆的Agent按会话保存对话历史")
 
 class AgentExecutionResponse(BaseModel):
     output: str
@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import List, Literal, Optional
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class KnowledgeBaseBase(BaseModel):
     name: str
@@ -38,4 +38,37 @@ class DocumentResponse(DocumentBase):
     updated_at: datetime
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class DocumentSummary(BaseModel):
+    id: int
+    title: str
+    knowledge_base_id: int
+    created_at: datetime
+    updated_at: datetime
+    content: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class DocumentPage(BaseModel):
+    items: List[DocumentSummary]
+    next_cursor: Optional[int] = None
+
+class KnowledgeSearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    top_k: int = Field(5, ge=1, le=50)
+    mode: Literal["hybrid", "vector", "lexical"] = "hybrid"
+
+class KnowledgeSearchResult(BaseModel):
+    chunk_id: int
+    document_id: int
+    chunk_index: int
+    title: str
+    content: str
+    score: float
+    vector_score: Optional[float] = None
+    lexical_score: Optional[float] = None
+
+class KnowledgeSearchResponse(BaseModel):
+    results: List[KnowledgeSearchResult]
@@ -10,6 +10,8 @@ class TaskTypeStats(BaseModel):
     success_count: int
     failure_count: int
     average_duration: Optional[float] = None
+    p50_duration: Optional[float] = None
+    p95_duration: Optional[float] = None
 
 
 class TaskExecutionStats(BaseModel):
@@ -20,6 +22,8 @@ class TaskExecutionStats(BaseModel):
     pending_tasks: int
     running_tasks: int
     average_duration: Optional[float] = None
+    p50_duration: Optional[float] = None
+    p95_duration: Optional[float] = None
     by_type: List[TaskTypeStats]
 
 
@@ -31,14 +35,33 @@ class WorkflowExecutionStats(BaseModel):
     pending_executions: int
     running_executions: int
     average_duration: Optional[float] = None
+    p50_duration: Optional[float] = None
+    p95_duration: Optional[float] = None
+
+
+class ExecutionMetricsBucket(BaseModel):
+    """单个时间桶内已结束的执行统计"""
+    bucket_start: datetime
+    count: int
+    failed: int
+    average_duration: Optional[float] = None
+    p95_duration: Optional[float] = None
 
 
 class SystemStats(BaseModel):
-    """系统统计"""
+    """系统统计，来自本进程最近一次采样；读不到的指标为空"""
     cpu_usage: float
-    memory_usage: float
-    disk_usage: float
+    memory_usage: Optional[float] = None
+    disk_usage: Optional[float] = None
     uptime: float
+    sampled_at: Optional[datetime] = None
+    rss_bytes: Optional[int] = None
+    open_fds: Optional[int] = None
+    event_loop_lag: Optional[float] = None
+    db_pool_size: Optional[int] = None
+    db_pool_checked_out: Optional[int] = None
+    db_pool_overflow: Optional[int] = None
+    inflight_executions: Optional[int] = None
 
 
 class MonitoringStats(BaseModel):
@@ -1,4 +1,5 @@
-from typing import List, Optional, Dict, Any
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ..models.agent import Agent
@@ -8,6 +9,8 @@ from langchain_openai import ChatOpenAI
 from langchain.tools import Tool
 from langchain.agents import create_openai_functions_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import BaseMessage
 from langchain.agents.output_parsers import OpenAIFunctionsAgentOutputParser
 import json
 import time
@@ -25,15 +28,85 @@ import io
 import matplotlib.pyplot as plt
 from sqlalchemy.sql import text
 from langchain.agents import Tool, AgentExecutor, LLMSingleActionAgent
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts import StringPromptTemplate
 from langchain.chains import LLMChain
 from langchain_community.chat_models import ChatOpenAI
 from fastapi import HTTPException, status
-import concurrent.futures
+import asyncio
+import logging
 import uuid
 from ..models.execution_log import ExecutionLog
+from .conversation_memory import ConversationMemoryStore, MemoryWindow
+from ..core.cache import make_cache_key
 from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def _serialize_step(action, observation=None) -> Dict[str, Any]:
+    """将 AgentAction 转换为可 JSON 序列化的步骤"""
+    step = {
+        "tool": getattr(action, "tool", None),
+        "tool_input": getattr(action, "tool_input", None),
+        "log": getattr(action, "log", None)
+    }
+    if observation is not None:
+        step["observation"] = str(observation)
+    return step
+
+
+class _StreamingCallbackHandler(AsyncCallbackHandler):
+    """将 LLM token 和 Agent 步骤推送到队列"""
+
+    def __init__(self, events: asyncio.Queue):
+        self.events = events
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token:
+            self.events.put_nowait({"event": "token", "data": {"token": token}})
+
+    async def on_agent_action(self, action, **kwargs) -> None:
+        self.events.put_nowait({"event": "step", "data": _serialize_step(action)})
+
+    async def on_tool_end(self, output: str, **kwargs) -> None:
+        self.events.put_nowait({"event": "observation", "data": {"output": str(output)}})
+
+
+class AgentExecutorCache:
+    """按 (Agent ID, 配置哈希) 缓存构建好的 AgentExecutor，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._executors: "OrderedDict[Tuple[int, str], AgentExecutor]" = OrderedDict()
+
+    def get(self, agent_id: int, config_hash: str) -> Optional[AgentExecutor]:
+        key = (agent_id, config_hash)
+        executor = self._executors.get(key)
+        if executor is not None:
+            self._executors.move_to_end(key)
+        return executor
+
+    def put(self, agent_id: int, config_hash: str, executor: AgentExecutor):
+        key = (agent_id, config_hash)
+        self._executors[key] = executor
+        self._executors.move_to_end(key)
+        while len(self._executors) > self.maxsize:
+            self._executors.popitem(last=False)
+
+    def invalidate(self, agent_id: int):
+        for key in [key for key in self._executors if key[0] == agent_id]:
+            del self._executors[key]
+
+    def clear(self):
+        self._executors.clear()
+
+    def __len__(self) -> int:
+        return len(self._executors)
+
+
+agent_executor_cache = AgentExecutorCache(settings.AGENT_EXECUTOR_CACHE_SIZE)
+
 
 class AgentService:
     def __init__(self, db: AsyncSession):
@@ -124,6 +197,7 @@ class AgentService:
             setattr(db_agent, key, value)
         
         await self.db.commit()
+        agent_executor_cache.invalidate(agent_id)
         await self.db.refresh(db_agent)
         return db_agent
 
@@ -134,10 +208,24 @@ class AgentService:
         
         await self.db.delete(db_agent)
         await self.db.commit()
+        agent_executor_cache.invalidate(agent_id)
         return True
 
-    def create_agent_executor(self, agent: Agent) -> AgentExecutor:
-        """创建LangChain Agent执行器"""
+    def create_agent_executor(self, agent: Agent, streaming: bool = False) -> AgentExecutor:
+        """获取LangChain Agent执行器，相同配置的Agent复用已构建的执行器"""
+        config_hash = make_cache_key(agent.config, streaming)
+        agent_executor = agent_executor_cache.get(agent.id, config_hash)
+        if agent_executor is None:
+            agent_executor = self._build_agent_executor(agent, streaming)
+            agent_executor_cache.put(agent.id, config_hash, agent_executor)
+        return agent_executor
+
+    def _build_agent_executor(self, agent: Agent, streaming: bool = False) -> AgentExecutor:
+        """创建LangChain Agent执行器
+
+        执行器会被缓存并在多个请求间共享，因此不绑定对话记忆和请求的数据库会话，
+        对话历史在每次调用时通过 chat_history 传入。
+        """
         # 获取Agent配置
         config = agent.config
         
@@ -145,12 +233,10 @@ class AgentService:
         llm = ChatOpenAI(
             temperature=config.get("temperature", 0),
             model_name=config.get("model", "gpt-3.5-turbo"),
-            openai_api_key=settings.OPENAI_API_KEY
+            openai_api_key=settings.OPENAI_API_KEY,
+            streaming=streaming
         )
         
-        # 创建记忆组件
-        memory = self._create_memory(config.get("memory", "none"))
-        
         # 创建工具集
         tools = self._create_tools(agent)
         
@@ -171,7 +257,6 @@ class AgentService:
         agent_executor = AgentExecutor(
             agent=agent,
             tools=tools,
-            memory=memory,
             verbose=True,
             max_iterations=config.get("maxIterations", 3),
             early_stopping_method="force",
@@ -181,19 +266,29 @@ class AgentService:
         
         return agent_executor
 
-    def _create_memory(self, memory_type: str):
-        """创建记忆组件"""
-        if memory_type == "conversation":
-            return ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True
-            )
-        elif memory_type == "vectorstore":
-            # 实现向量存储记忆
-            pass
-        return None
+    def _create_memory(self, agent: Agent) -> Optional[MemoryWindow]:
+        """返回会话记忆窗口，未启用记忆时返回 None"""
+        memory_type = agent.config.get("memory", "none")
+        if memory_type == "vectorstore":
+            # 向量检索记忆尚未实现，退化为持久化的窗口记忆
+            logger.warning(f"Agent {agent.id}: vectorstore memory is not supported, using conversation memory")
+        elif memory_type != "conversation":
+            return None
+        return MemoryWindow.from_config(agent.config)
 
-    async def execute_agent(self, agent_id: int, input_text: str) -> Dict[str, Any]:
+    async def _load_history(self, agent: Agent, session_id: Optional[str]) -> List[BaseMessage]:
+        window = self._create_memory(agent)
+        if window is None or not session_id:
+            return []
+        return await ConversationMemoryStore(self.db).load(agent.id, session_id, window)
+
+    async def _save_turn(self, agent: Agent, session_id: Optional[str], input_text: str, output: str):
+        window = self._create_memory(agent)
+        if window is None or not session_id:
+            return
+        await ConversationMemoryStore(self.db).append(agent.id, session_id, input_text, output, window)
+
+    async def execute_agent(self, agent_id: int, input_text: str, session_id: Optional[str] = None) -> Dict[str, Any]:
         """执行Agent"""
         agent = await self.get_agent(agent_id)
         if not agent:
@@ -202,73 +297,163 @@ class AgentService:
         if not agent.is_active:
             raise ValueError("Agent is not active")
         
+        try:
+            return await self._run_agent(agent, input_text, session_id)
+        except Exception as e:
+            error_strategy = agent.config.get("errorStrategy", "fail")
+            if error_strategy == "retry":
+                # 实现重试逻辑
+                return await self._retry_execution(agent, input_text, session_id=session_id)
+            elif error_strategy == "ignore":
+                # 返回部分结果
+                return await self._handle_partial_result(e)
+            else:
+                raise ValueError(f"Error executing agent: {str(e)}")
+
+    async def _run_agent(self, agent: Agent, input_text: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """异步运行一次Agent并记录执行历史
+
+        使用 ainvoke 在事件循环内执行，同步工具由 LangChain 放到默认线程池运行；
+        超时后取消执行，不会阻塞同一进程中的其他请求。
+        """
         start_time = time.time()
+        
+        # 创建执行上下文
+        context = self._create_execution_context(agent)
+        
+        # 创建Agent执行器
+        agent_executor = self.create_agent_executor(agent)
+        
+        # 设置超时
+        timeout = agent.config.get("timeout", 60)
+        
+        # 加载会话历史
+        chat_history = await self._load_history(agent, session_id)
+        
+        # 执行Agent
         try:
-            # 创建执行上下文
-            context = self._create_execution_context(agent)
-            
-            # 创建Agent执行器
-            agent_executor = self.create_agent_executor(agent)
-            
-            # 设置超时
-            timeout = agent.config.get("timeout", 60)
+            result = await asyncio.wait_for(
+                agent_executor.ainvoke({"input": input_text, "chat_history": chat_history}),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            raise ValueError(f"Agent execution timed out after {timeout} seconds")
+        
+        execution_time = time.time() - start_time
+        steps = [_serialize_step(action, observation) for action, observation in result["intermediate_steps"]]
+        
+        # 记录执行历史
+        await self.log_execution(
+            agent_id=agent.id,
+            input_text=input_text,
+            output=result["output"],
+            steps=steps,
+            execution_time=execution_time,
+            context=context
+        )
+        await self._save_turn(agent, session_id, input_text, result["output"])
+        
+        return {
+            "output": result["output"],
+            "steps": steps,
+            "execution_time": execution_time,
+            "context": context
+        }
+
+    async def stream_agent(
+        self,
+        agent_id: int,
+        input_text: str,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式执行Agent，依次产出 token、step、observation 事件，最后产出 done 或 error 事件"""
+        agent = await self.get_agent(agent_id)
+        if not agent:
+            raise ValueError("Agent not found")
+        
+        if not agent.is_active:
+            raise ValueError("Agent is not active")
+        
+        context = self._create_execution_context(agent)
+        agent_executor = self.create_agent_executor(agent, streaming=True)
+        chat_history = await self._load_history(agent, session_id)
+        timeout = agent.config.get("timeout", 60)
+        events: asyncio.Queue = asyncio.Queue()
+        handler = _StreamingCallbackHandler(events)
+        
+        async def run():
+            try:
+                async with asyncio.timeout(timeout):
+                    return await agent_executor.ainvoke(
+                        {"input": input_text, "chat_history": chat_history},
+                        config={"callbacks": [handler]}
+                    )
+            finally:
+                events.put_nowait(None)
+        
+        start_time = time.time()
+        runner = asyncio.create_task(run())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
             
-            # 执行Agent
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(agent_executor.invoke, {"input": input_text})
-                try:
-                    result = future.result(timeout=timeout)
-                except concurrent.futures.TimeoutError:
-                    raise ValueError(f"Agent execution timed out after {timeout} seconds")
+            try:
+                result = runner.result()
+            except asyncio.TimeoutError:
+                yield {"event": "error", "data": {"error": f"Agent execution timed out after {timeout} seconds"}}
+                return
+            except Exception as e:
+                yield {"event": "error", "data": {"error": f"Error executing agent: {str(e)}"}}
+                return
             
             execution_time = time.time() - start_time
-            
-            # 记录执行历史
+            steps = [_serialize_step(action, observation) for action, observation in result["intermediate_steps"]]
             await self.log_execution(
                 agent_id=agent_id,
                 input_text=input_text,
                 output=result["output"],
-                steps=result["intermediate_steps"],
+                steps=steps,
                 execution_time=execution_time,
                 context=context
             )
-            
-            return {
-                "output": result["output"],
-                "steps": result["intermediate_steps"],
-                "execution_time": execution_time,
-                "context": context
+            await self._save_turn(agent, session_id, input_text, result["output"])
+            yield {
+                "event": "done",
+                "data": {"output": result["output"], "steps": steps, "execution_time": execution_time}
             }
-            
-        except Exception as e:
-            error_strategy = agent.config.get("errorStrategy", "fail")
-            if error_strategy == "retry":
-                # 实现重试逻辑
-                return await self._retry_execution(agent, input_text)
-            elif error_strategy == "ignore":
-                # 返回部分结果
-                return await self._handle_partial_result(e)
-            else:
-                raise ValueError(f"Error executing agent: {str(e)}")
+        finally:
+            # 客户端断开时停止执行，避免继续消耗模型调用
+            if not runner.done():
+                runner.cancel()
+                await asyncio.gather(runner, return_exceptions=True)
 
     def _create_execution_context(self, agent: Agent) -> Dict[str, Any]:
         """创建执行上下文"""
         return {
             "agent_id": agent.id,
-            "agent_type": agent.type,
+            "agent_type": agent.agent_type,
             "timestamp": datetime.utcnow().isoformat(),
             "execution_id": str(uuid.uuid4())
         }
 
-    async def _retry_execution(self, agent: Agent, input_text: str, max_retries: int = 3) -> Dict[str, Any]:
+    async def _retry_execution(
+        self,
+        agent: Agent,
+        input_text: str,
+        max_retries: int = 3,
+        session_id: Optional[str] = None
+    ) -> Dict[str, Any]:
         """重试执行"""
         last_error = None
         for attempt in range(max_retries):
             try:
-                return await self.execute_agent(agent.id, input_text)
+                return await self._run_agent(agent, input_text, session_id)
             except Exception as e:
                 last_error = e
-                time.sleep(2 ** attempt)  # 指数退避
+                await asyncio.sleep(2 ** attempt)  # 指数退避
         raise ValueError(f"Failed after {max_retries} retries: {str(last_error)}")
 
     async def _handle_partial_result(self, error: Exception) -> Dict[str, Any]:
@@ -489,21 +674,26 @@ class AgentService:
         # 添加数据库查询工具
         async def execute_sql_query(query: str) -> str:
             try:
-                # Use the existing database session
-                result = await self.db.execute(text(query))
-                if query.strip().upper().startswith('SELECT'):
-                    results = [dict(row) for row in result]
-                    return json.dumps(results)
-                else:
-                    await self.db.commit()
-                    return "Query executed successfully"
+                # 工具随执行器缓存，不能引用请求的会话，每次查询使用独立的会话
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(text(query))
+                    if query.strip().upper().startswith('SELECT'):
+                        results = [dict(row._mapping) for row in result]
+                        return json.dumps(results, default=str)
+                    else:
+                        await db.commit()
+                        return "Query executed successfully"
             except Exception as e:
                 return f"Error executing SQL query: {str(e)}"
         
+        def execute_sql_query_sync(query: str) -> str:
+            return "Error executing SQL query: SQLQuery is only available in async execution"
+        
         tools.append(
             Tool(
                 name="SQLQuery",
-                func=execute_sql_query,
+                func=execute_sql_query_sync,
+                coroutine=execute_sql_query,
                 description="Useful for executing SQL queries. Input should be a valid SQL query string."
             )
         )
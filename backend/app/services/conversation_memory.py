@@ -0,0 +1,181 @@
+from dataclasses import dataclass
+from typing import Callable, List
+import asyncio
+import logging
+from sqlalchemy import select, update, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.conversation import AgentConversation, AgentConversationMessage
+from .llm_service import get_llm_service
+
+logger = logging.getLogger(__name__)
+
+# 等待中的后台摘要任务，保持引用直到完成
+_background_summaries: set = set()
+
+
+def count_tokens(text: str) -> int:
+    """粗略估算 token 数（约 4 个字符一个 token）"""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class MemoryWindow:
+    """会话记忆窗口的大小限制"""
+    max_turns: int
+    max_tokens: int
+
+    @classmethod
+    def from_config(cls, config: dict) -> "MemoryWindow":
+        return cls(
+            max_turns=int(config.get("memoryMaxTurns", settings.AGENT_MEMORY_MAX_TURNS)),
+            max_tokens=int(config.get("memoryMaxTokens", settings.AGENT_MEMORY_MAX_TOKENS))
+        )
+
+
+class ConversationMemoryStore:
+    """持久化的 Agent 会话记忆
+
+    每轮对话保存为两条消息；读取时只取最近 max_turns 轮中不超过 max_tokens 的部分，
+    更早的消息由后台任务合并进滚动摘要，随窗口一起作为系统消息放在历史最前面，
+    因此提示词长度不随对话轮数增长。
+    """
+
+    def __init__(self, db: AsyncSession, session_factory: Callable = AsyncSessionLocal):
+        self.db = db
+        self.session_factory = session_factory
+
+    async def load(self, agent_id: int, session_id: str, window: MemoryWindow) -> List[BaseMessage]:
+        """读取会话摘要和最近的对话窗口"""
+        conversation = await self.db.get(AgentConversation, (agent_id, session_id))
+        summarized_until_id = conversation.summarized_until_id if conversation else 0
+
+        # 走 (agent_id, session_id, id) 索引倒序取最近的消息
+        stmt = (
+            select(AgentConversationMessage.role, AgentConversationMessage.content, AgentConversationMessage.token_count)
+            .where(
+                AgentConversationMessage.agent_id == agent_id,
+                AgentConversationMessage.session_id == session_id,
+                AgentConversationMessage.id > summarized_until_id
+            )
+            .order_by(AgentConversationMessage.id.desc())
+            .limit(window.max_turns * 2)
+        )
+        rows = (await self.db.execute(stmt)).all()
+
+        messages: List[BaseMessage] = []
+        tokens = 0
+        for role, content, token_count in rows:
+            tokens += token_count
+            if messages and tokens > window.max_tokens:
+                break
+            messages.append(HumanMessage(content=content) if role == "human" else AIMessage(content=content))
+        messages.reverse()
+
+        if conversation and conversation.summary:
+            messages.insert(0, SystemMessage(content=f"Summary of the earlier conversation:\n{conversation.summary}"))
+        return messages
+
+    async def append(self, agent_id: int, session_id: str, human: str, ai: str, window: MemoryWindow):
+        """保存一轮对话，未摘要的消息超出窗口较多时在后台触发摘要"""
+        await self.db.execute(
+            pg_insert(AgentConversation)
+            .values(agent_id=agent_id, session_id=session_id, pending_messages=2)
+            .on_conflict_do_update(
+                index_elements=["agent_id", "session_id"],
+                set_={"pending_messages": AgentConversation.pending_messages + 2}
+            )
+        )
+        await self.db.execute(
+            insert(AgentConversationMessage),
+            [
+                {"agent_id": agent_id, "session_id": session_id, "role": "human",
+                 "content": human, "token_count": count_tokens(human)},
+                {"agent_id": agent_id, "session_id": session_id, "role": "ai",
+                 "content": ai, "token_count": count_tokens(ai)}
+            ]
+        )
+        result = await self.db.execute(
+            select(AgentConversation.pending_messages).where(
+                AgentConversation.agent_id == agent_id,
+                AgentConversation.session_id == session_id
+            )
+        )
+        pending = result.scalar_one()
+        await self.db.commit()
+
+        # 窗口外积累了一批消息后再摘要，避免每轮都调用模型
+        if pending >= window.max_turns * 2 + settings.AGENT_MEMORY_SUMMARY_BATCH:
+            task = asyncio.create_task(self._summarize(agent_id, session_id, window))
+            _background_summaries.add(task)
+            task.add_done_callback(_background_summaries.discard)
+
+    async def _summarize(self, agent_id: int, session_id: str, window: MemoryWindow):
+        """将窗口之外的消息并入滚动摘要
+
+        读取和写入分在两个短事务中，调用模型期间不持有会话行的锁，不阻塞并发的 append；
+        写入时以 summarized_until_id 未变为条件，期间已被其他任务摘要过则放弃本次结果。
+        """
+        try:
+            async with self.session_factory() as db:
+                conversation = await db.get(AgentConversation, (agent_id, session_id))
+                if conversation is None:
+                    return
+                summarized_until_id = conversation.summarized_until_id
+                previous_summary = conversation.summary
+                stmt = (
+                    select(AgentConversationMessage.id, AgentConversationMessage.role, AgentConversationMessage.content)
+                    .where(
+                        AgentConversationMessage.agent_id == agent_id,
+                        AgentConversationMessage.session_id == session_id,
+                        AgentConversationMessage.id > summarized_until_id
+                    )
+                    .order_by(AgentConversationMessage.id)
+                )
+                messages = (await db.execute(stmt)).all()
+                await db.commit()
+
+            # 保留最近的窗口，其余并入摘要
+            to_summarize = messages[:-window.max_turns * 2]
+            if not to_summarize:
+                return
+
+            transcript = "\n".join(f"{message.role}: {message.content}" for message in to_summarize)
+            prompt = (
+                "Update the running summary of a conversation with the new messages below. "
+                "Keep facts, decisions and open questions; be concise.\n\n"
+                f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+                f"New messages:\n{transcript}\n\nUpdated summary:"
+            )
+            response = await get_llm_service().generate_completion(
+                prompt=prompt,
+                model=settings.AGENT_MEMORY_SUMMARY_MODEL,
+                temperature=0,
+                max_tokens=settings.AGENT_MEMORY_SUMMARY_MAX_TOKENS
+            )
+            summary = response["choices"][0]["message"]["content"].strip()
+
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    update(AgentConversation)
+                    .where(
+                        AgentConversation.agent_id == agent_id,
+                        AgentConversation.session_id == session_id,
+                        AgentConversation.summarized_until_id == summarized_until_id
+                    )
+                    .values(
+                        summary=summary,
+                        summarized_until_id=to_summarize[-1].id,
+                        pending_messages=AgentConversation.pending_messages - len(to_summarize)
+                    )
+                )
+                if result.rowcount == 0:
+                    await db.rollback()
+                    logger.info(f"Conversation {agent_id}/{session_id} was summarized concurrently, discarding result")
+                    return
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to summarize conversation {agent_id}/{session_id}: {str(e)}")
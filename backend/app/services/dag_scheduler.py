@@ -0,0 +1,169 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence
+from enum import Enum
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CyclicDependencyError(ValueError):
+    """任务依赖图中存在环"""
+
+    def __init__(self, task_ids: Iterable[Hashable]):
+        self.task_ids = list(task_ids)
+        super().__init__(
+            f"Task graph contains a dependency cycle among tasks: {', '.join(map(str, self.task_ids))}"
+        )
+
+
+def _dependents_of(task_graph: Mapping[Hashable, Sequence[Hashable]]) -> Dict[Hashable, List[Hashable]]:
+    """反转依赖图，得到 {任务ID: [依赖它的任务ID, ...]}"""
+    dependents = {task_id: [] for task_id in task_graph}
+    for task_id, deps in task_graph.items():
+        for dep_id in set(deps):
+            if dep_id not in task_graph:
+                raise ValueError(f"Task {task_id} depends on unknown task {dep_id}")
+            dependents[dep_id].append(task_id)
+    return dependents
+
+
+def topological_levels(task_graph: Mapping[Hashable, Sequence[Hashable]]) -> List[List[Hashable]]:
+    """将任务依赖图按拓扑顺序分层
+
+    task_graph 为 {任务ID: [依赖任务ID, ...]}。同一层内的任务互不依赖，可以并发执行；
+    图中存在环时抛出 CyclicDependencyError。
+    """
+    dependents = _dependents_of(task_graph)
+    in_degree = {task_id: len(set(deps)) for task_id, deps in task_graph.items()}
+
+    levels = []
+    current = [task_id for task_id, degree in in_degree.items() if degree == 0]
+    while current:
+        levels.append(current)
+        next_level = []
+        for task_id in current:
+            for dependent_id in dependents[task_id]:
+                in_degree[dependent_id] -= 1
+                if in_degree[dependent_id] == 0:
+                    next_level.append(dependent_id)
+        current = next_level
+
+    if sum(len(level) for level in levels) != len(task_graph):
+        raise CyclicDependencyError(task_id for task_id, degree in in_degree.items() if degree > 0)
+    return levels
+
+
+class DAGScheduler:
+    """按依赖关系并发调度任务
+
+    依赖全部完成的任务立即启动，同时运行的任务数受 max_concurrency 限制，
+    因此总耗时取决于关键路径，而不是所有任务耗时之和。
+    """
+
+    def __init__(self, max_concurrency: int = 8):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+
+    async def run(
+        self,
+        task_graph: Mapping[Hashable, Sequence[Hashable]],
+        run_task: Callable[[Hashable], Awaitable[Any]],
+        levels: Optional[Sequence[Sequence[Hashable]]] = None
+    ) -> Dict[Hashable, Any]:
+        """执行任务图，返回 {任务ID: 结果}
+
+        levels 为预先计算好的拓扑分层（如来自已编译的执行计划），省略时现场计算。
+        任一任务失败时取消其余正在运行的任务，并将该异常抛出。
+        """
+        # 先完成拓扑分层，环路在任何任务启动前就会被发现
+        if levels is None:
+            levels = topological_levels(task_graph)
+        if not levels:
+            return {}
+
+        dependents = _dependents_of(task_graph)
+        remaining = {task_id: len(set(deps)) for task_id, deps in task_graph.items()}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        running: Dict[asyncio.Task, Hashable] = {}
+        results = {}
+
+        async def run_with_limit(task_id: Hashable) -> Any:
+            async with semaphore:
+                return await run_task(task_id)
+
+        def start(task_id: Hashable):
+            running[asyncio.create_task(run_with_limit(task_id))] = task_id
+
+        for task_id in levels[0]:
+            start(task_id)
+
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    task_id = running.pop(future)
+                    results[task_id] = future.result()
+                    for dependent_id in dependents[task_id]:
+                        remaining[dependent_id] -= 1
+                        if remaining[dependent_id] == 0:
+                            start(dependent_id)
+        finally:
+            if running:
+                logger.info(f"Cancelling {len(running)} running task(s)")
+                for future in running:
+                    future.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return results
+
+
+class FailurePolicy(str, Enum):
+    """并行分支失败时的处理策略"""
+    FAIL_FAST = "fail_fast"  # 任一分支失败即取消其余分支并抛出异常
+    COLLECT_ALL = "collect_all"  # 所有分支执行完毕，失败分支的异常作为结果返回
+
+
+async def fan_out(
+    branches: Mapping[Hashable, Callable[[], Awaitable[Any]]],
+    max_concurrency: int = 8,
+    failure_policy: FailurePolicy = FailurePolicy.FAIL_FAST
+) -> Dict[Hashable, Any]:
+    """并发执行互不依赖的分支，同时运行的分支数受 max_concurrency 限制
+
+    返回 {分支键: 结果}。COLLECT_ALL 策略下失败分支的结果为其异常对象；
+    FAIL_FAST 策略下第一个失败的分支会取消其余分支，并将其异常抛出。
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    failure_policy = FailurePolicy(failure_policy)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_with_limit(branch: Callable[[], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            return await branch()
+
+    running = {asyncio.create_task(run_with_limit(branch)): key for key, branch in branches.items()}
+    results = {}
+    pending = set(running)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                key = running[future]
+                error = future.exception()
+                if error is None:
+                    results[key] = future.result()
+                elif failure_policy == FailurePolicy.FAIL_FAST:
+                    raise error
+                else:
+                    results[key] = error
+    finally:
+        if pending:
+            logger.info(f"Cancelling {len(pending)} running branch(es)")
+            for future in pending:
+                future.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    # 按分支的提交顺序返回
+    return {key: results[key] for key in branches}
@@ -0,0 +1,77 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (texts, model) -> 与 texts 顺序一致的嵌入向量
+EmbedFunction = Callable[[List[str], str], Awaitable[List[List[float]]]]
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.futures: Dict[str, asyncio.Future] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingBatcher:
+    """合并短时间内的单条嵌入请求
+
+    同一模型的请求在 max_delay 秒内累积，达到 max_batch_size 条或等待超时后
+    合并为一次批量调用，再把结果分发给各个调用方；相同文本只请求一次。
+    """
+
+    def __init__(self, embed: EmbedFunction, max_batch_size: int = 256, max_delay: float = 0.005):
+        self.embed = embed
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._flushes: set = set()
+
+    async def submit(self, text: str, model: str) -> List[float]:
+        """提交一条文本，等待所在批次完成后返回其嵌入"""
+        batch = self._pending.get(model)
+        if batch is None:
+            batch = self._pending[model] = _PendingBatch()
+            batch.timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush, model)
+
+        future = batch.futures.get(text)
+        if future is None:
+            future = batch.futures[text] = asyncio.get_running_loop().create_future()
+            if len(batch.futures) >= self.max_batch_size:
+                self._flush(model)
+        # shield：单个调用方被取消不影响同批次的其他调用方
+        return await asyncio.shield(future)
+
+    def _flush(self, model: str):
+        batch = self._pending.pop(model, None)
+        if batch is None:
+            return
+        if batch.timer:
+            batch.timer.cancel()
+        task = asyncio.create_task(self._run(model, batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, model: str, batch: _PendingBatch):
+        texts = list(batch.futures)
+        try:
+            embeddings = await self.embed(texts, model)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        except Exception as e:
+            logger.error(f"Embedding batch of {len(texts)} texts failed: {str(e)}")
+            for future in batch.futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, embedding in zip(texts, embeddings):
+            future = batch.futures[text]
+            if not future.done():
+                future.set_result(embedding)
+
+    async def close(self):
+        """立即发出所有等待中的批次并等待完成"""
+        for model in list(self._pending):
+            self._flush(model)
+        await asyncio.gather(*self._flushes, return_exceptions=True)
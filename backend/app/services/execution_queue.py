@@ -0,0 +1,222 @@
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Optional
+import asyncio
+import json
+import logging
+import time
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ExecutionJob:
+    """待执行的工作流任务，job_id 与 WorkflowExecution.id 相同"""
+    execution_id: str
+    workflow_id: str
+    user_id: str
+    input_data: Dict[str, Any] = field(default_factory=dict)
+    deliveries: int = 0  # 已投递次数（含本次），由队列在领取时填写
+
+    @property
+    def job_id(self) -> str:
+        return self.execution_id
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data.pop("deliveries")
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, payload: str, deliveries: int = 0) -> "ExecutionJob":
+        return cls(**json.loads(payload), deliveries=deliveries)
+
+
+class ExecutionQueue:
+    """至少一次投递的执行队列
+
+    reserve 领取任务后，任务在 visibility_timeout 秒内对其他消费者不可见；
+    处理完成需调用 ack，否则超时后由 requeue_expired 重新放回队列。
+    长时间运行的任务应定期调用 extend 续期。
+    """
+
+    def __init__(self, visibility_timeout: int = None):
+        self.visibility_timeout = visibility_timeout or settings.EXECUTION_VISIBILITY_TIMEOUT
+
+    async def enqueue(self, job: ExecutionJob):
+        raise NotImplementedError
+
+    async def reserve(self, timeout: float = 1.0) -> Optional[ExecutionJob]:
+        """领取一个任务，timeout 秒内没有任务时返回 None"""
+        raise NotImplementedError
+
+    async def ack(self, job: ExecutionJob):
+        raise NotImplementedError
+
+    async def extend(self, job: ExecutionJob):
+        """延长任务的不可见时间"""
+        raise NotImplementedError
+
+    async def requeue_expired(self) -> int:
+        """将超时未确认的任务放回队列，返回数量"""
+        raise NotImplementedError
+
+    async def depth(self) -> int:
+        """等待中的任务数"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class InMemoryExecutionQueue(ExecutionQueue):
+    """进程内队列，用于测试和本地开发"""
+
+    def __init__(self, visibility_timeout: int = None):
+        super().__init__(visibility_timeout)
+        self._pending: "asyncio.Queue[str]" = asyncio.Queue()
+        self._payloads: Dict[str, str] = {}
+        self._deliveries: Dict[str, int] = {}
+        self._inflight: Dict[str, float] = {}
+
+    async def enqueue(self, job: ExecutionJob):
+        self._payloads[job.job_id] = job.to_json()
+        await self._pending.put(job.job_id)
+
+    async def reserve(self, timeout: float = 1.0) -> Optional[ExecutionJob]:
+        try:
+            job_id = await asyncio.wait_for(self._pending.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._inflight[job_id] = time.monotonic() + self.visibility_timeout
+        self._deliveries[job_id] = self._deliveries.get(job_id, 0) + 1
+        return ExecutionJob.from_json(self._payloads[job_id], self._deliveries[job_id])
+
+    async def ack(self, job: ExecutionJob):
+        self._inflight.pop(job.job_id, None)
+        self._payloads.pop(job.job_id, None)
+        self._deliveries.pop(job.job_id, None)
+
+    async def extend(self, job: ExecutionJob):
+        if job.job_id in self._inflight:
+            self._inflight[job.job_id] = time.monotonic() + self.visibility_timeout
+
+    async def requeue_expired(self) -> int:
+        now = time.monotonic()
+        expired = [job_id for job_id, deadline in self._inflight.items() if deadline <= now]
+        for job_id in expired:
+            del self._inflight[job_id]
+            await self._pending.put(job_id)
+        return len(expired)
+
+    async def depth(self) -> int:
+        return self._pending.qsize()
+
+
+# 原子地从等待队列取出一个任务并登记到 inflight（score 为可见截止时间）
+_RESERVE_SCRIPT = """
+local job_id = redis.call('RPOP', KEYS[1])
+if not job_id then
+    return nil
+end
+redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+local deliveries = redis.call('HINCRBY', KEYS[4], job_id, 1)
+return {job_id, redis.call('HGET', KEYS[3], job_id), deliveries}
+"""
+
+# 将超时任务放回等待队列的消费端，使其优先被重新领取
+_REQUEUE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, job_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], job_id)
+    redis.call('RPUSH', KEYS[2], job_id)
+end
+return #expired
+"""
+
+
+class RedisExecutionQueue(ExecutionQueue):
+    """基于 Redis 的持久化队列
+
+    pending 列表保存等待中的任务ID，inflight 有序集合记录已领取任务的可见截止时间，
+    任务内容与投递次数分别保存在两个哈希中。
+    """
+
+    def __init__(self, redis=None, name: str = None, visibility_timeout: int = None, poll_interval: float = 0.5):
+        super().__init__(visibility_timeout)
+        if redis is None:
+            from ..core.redis_client import get_redis
+            redis = get_redis()
+        self.redis = redis
+        name = name or settings.EXECUTION_QUEUE_NAME
+        self.pending_key = f"{name}:pending"
+        self.inflight_key = f"{name}:inflight"
+        self.jobs_key = f"{name}:jobs"
+        self.deliveries_key = f"{name}:deliveries"
+        self.poll_interval = poll_interval
+        self._reserve = self.redis.register_script(_RESERVE_SCRIPT)
+        self._requeue = self.redis.register_script(_REQUEUE_SCRIPT)
+
+    async def enqueue(self, job: ExecutionJob):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.jobs_key, job.job_id, job.to_json())
+            pipe.lpush(self.pending_key, job.job_id)
+            await pipe.execute()
+
+    async def reserve(self, timeout: float = 1.0) -> Optional[ExecutionJob]:
+        deadline = time.monotonic() + timeout
+        while True:
+            result = await self._reserve(
+                keys=[self.pending_key, self.inflight_key, self.jobs_key, self.deliveries_key],
+                args=[time.time() + self.visibility_timeout]
+            )
+            if result:
+                job_id, payload, deliveries = result
+                if payload is None:
+                    # 任务内容已被确认删除，丢弃残留的ID
+                    await self.redis.zrem(self.inflight_key, job_id)
+                    continue
+                return ExecutionJob.from_json(payload, int(deliveries))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def ack(self, job: ExecutionJob):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.inflight_key, job.job_id)
+            pipe.hdel(self.jobs_key, job.job_id)
+            pipe.hdel(self.deliveries_key, job.job_id)
+            await pipe.execute()
+
+    async def extend(self, job: ExecutionJob):
+        await self.redis.zadd(
+            self.inflight_key,
+            {job.job_id: time.time() + self.visibility_timeout},
+            xx=True
+        )
+
+    async def requeue_expired(self) -> int:
+        count = await self._requeue(keys=[self.inflight_key, self.pending_key], args=[time.time()])
+        if count:
+            logger.warning(f"Requeued {count} execution job(s) whose visibility timeout expired")
+        return int(count)
+
+    async def depth(self) -> int:
+        return await self.redis.llen(self.pending_key)
+
+
+_queue: Optional[ExecutionQueue] = None
+
+
+def get_execution_queue() -> ExecutionQueue:
+    """按配置获取进程内共享的执行队列"""
+    global _queue
+    if _queue is None:
+        if settings.EXECUTION_QUEUE_BACKEND == "memory":
+            _queue = InMemoryExecutionQueue()
+        elif settings.EXECUTION_QUEUE_BACKEND == "redis":
+            _queue = RedisExecutionQueue()
+        else:
+            raise ValueError(f"Unknown execution queue backend: {settings.EXECUTION_QUEUE_BACKEND}")
+    return _queue
@@ -0,0 +1,726 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import zlib
+import numpy as np
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.knowledge import Document, DocumentChunk
+from .lexical_index import LocalLexicalStore, local_lexical_store, reciprocal_rank_fusion
+from .llm_service import LLMService, get_llm_service
+
+logger = logging.getLogger(__name__)
+
+# 向量统一按 float32 小端字节序存储
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+# 段落哈希对该值取模为 0 时强制断开片段，平均每 4 个段落一个切分点
+CUT_POINT_MODULUS = 4
+
+# 全文检索配置：simple 不做词干化和停用词过滤，编号、客户ID等按原样匹配
+TEXT_SEARCH_CONFIG = "simple"
+
+# 压缩任务的 advisory lock 类别，与知识库ID组成锁键
+COMPACTION_LOCK_CLASS = 7301
+# 文档增量索引的 advisory lock 类别，与文档ID组成锁键
+DOCUMENT_INDEX_LOCK_CLASS = 7302
+
+_PARAGRAPH_SEPARATOR = re.compile(r"\n\s*\n")
+
+
+def _window(content: str, chunk_size: int, overlap: int) -> List[str]:
+    """按字符长度切分，尽量在空白处断开，相邻片段保留 overlap 个字符的重叠"""
+    chunks = []
+    start = 0
+    length = len(content)
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            # 在片段后半段内找最后一个空白，避免截断单词或句子
+            boundary = max(content.rfind(sep, start + chunk_size // 2, end) for sep in ("\n", " ", "。"))
+            if boundary > start:
+                end = boundary + 1
+        chunk = content[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        next_start = max(end - overlap, start + 1)
+        if overlap and not content[next_start - 1].isspace():
+            # 重叠部分也从完整的单词开始
+            boundaries = [i for i in (content.find(sep, next_start, end) for sep in ("\n", " ")) if i != -1]
+            if boundaries:
+                next_start = min(boundaries) + 1
+        start = next_start
+    return chunks
+
+
+def _is_cut_point(paragraph: str) -> bool:
+    return zlib.crc32(paragraph.encode("utf-8")) % CUT_POINT_MODULUS == 0
+
+
+def chunk_text(content: str, chunk_size: int = None, overlap: int = None) -> List[str]:
+    """按段落切分文本，相邻的短段落合并为不超过 chunk_size 的片段
+
+    除长度上限外，片段还在内容决定的切分点处断开，因此编辑一个段落只会改变它附近的片段，
+    其余片段的内容和哈希保持不变；超过 chunk_size 的段落按窗口切分并保留重叠。
+    """
+    chunk_size = chunk_size or settings.KNOWLEDGE_CHUNK_SIZE
+    overlap = settings.KNOWLEDGE_CHUNK_OVERLAP if overlap is None else overlap
+    overlap = min(overlap, chunk_size // 2)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for paragraph in _PARAGRAPH_SEPARATOR.split(content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = _window(paragraph, chunk_size, overlap) if len(paragraph) > chunk_size else [paragraph]
+        for piece in pieces:
+            if current and size + len(piece) + 2 > chunk_size:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+            if _is_cut_point(piece):
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def hash_chunk(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def pack_embedding(vector: Sequence[float]) -> bytes:
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def unpack_embedding(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class VectorIndex:
+    """暴力检索的向量段：行归一化的 float32 矩阵和对应的片段ID
+
+    矩阵可以是内存数组，也可以是 np.load(mmap_mode="r") 映射的文件，
+    多个进程映射同一文件时共享页缓存。
+    """
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray):
+        self.ids = ids
+        self.vectors = vectors
+
+    @classmethod
+    def from_embeddings(cls, ids: Sequence[int], embeddings: Sequence[bytes], dimensions: int) -> "VectorIndex":
+        vectors = np.empty((len(ids), dimensions), dtype=EMBEDDING_DTYPE)
+        for row, data in enumerate(embeddings):
+            vectors[row] = unpack_embedding(data)
+        return cls(np.asarray(ids, dtype=np.int64), _normalize(vectors))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: Sequence[float], top_k: int) -> List[Tuple[int, float]]:
+        """返回余弦相似度最高的 top_k 个 (片段ID, 分数)"""
+        if not len(self.ids) or top_k <= 0:
+            return []
+        scores = self.vectors @ _normalize(np.asarray(query, dtype=EMBEDDING_DTYPE))
+        top_k = min(top_k, len(scores))
+        # argpartition 只做部分排序，再对候选排序
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(self.ids[i]), float(scores[i])) for i in candidates]
+
+    def save(self, path: str):
+        """写入 {path}.ids.npy 和 {path}.vectors.npy，先写临时文件再原子替换"""
+        for suffix, array in (("ids", self.ids), ("vectors", self.vectors)):
+            target = f"{path}.{suffix}.npy"
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, target)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["VectorIndex"]:
+        try:
+            ids = np.load(f"{path}.ids.npy")
+            vectors = np.load(f"{path}.vectors.npy", mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        if len(ids) != len(vectors):
+            return None
+        return cls(ids, vectors)
+
+
+@dataclass
+class SegmentedIndex:
+    """知识库的本地索引：压缩时生成的基础段、之后新增片段的增量段，以及基础段中的墓碑ID"""
+    base: VectorIndex
+    base_max_id: int
+    delta: VectorIndex
+    tombstones: frozenset
+
+    def search(self, query: Sequence[float], top_k: int) -> List[Tuple[int, float]]:
+        # 基础段多取墓碑数量的候选，过滤后仍能凑满 top_k
+        fetch = min(top_k + len(self.tombstones), len(self.base))
+        candidates = self.base.search(query, fetch) + self.delta.search(query, top_k)
+        candidates = [item for item in candidates if item[0] not in self.tombstones]
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:top_k]
+
+
+async def chunk_stats(db: AsyncSession, knowledge_base_id: int) -> Tuple[int, int, int]:
+    """返回知识库的 (有效片段数, 最大片段ID, 墓碑数)，片段的任何增删都会改变该值"""
+    live = DocumentChunk.deleted_at.is_(None)
+    stmt = select(
+        func.count(DocumentChunk.id).filter(live),
+        func.coalesce(func.max(DocumentChunk.id), 0),
+        func.count(DocumentChunk.id).filter(DocumentChunk.deleted_at.isnot(None))
+    ).where(DocumentChunk.knowledge_base_id == knowledge_base_id)
+    live_count, max_id, tombstones = (await db.execute(stmt)).one()
+    return (live_count, max_id, tombstones)
+
+
+class LocalVectorStore:
+    """没有 pgvector 时使用的本地分段索引
+
+    基础段在压缩时从有效片段构建，保存为 kb_{知识库ID}_{最大片段ID} 文件并以 mmap 加载；
+    之后新增的片段从数据库读入增量段，失效的片段只记为墓碑，检索时过滤。
+    查询时用一次聚合查询比对片段统计，变化后才重新读取增量段和墓碑。
+    """
+
+    def __init__(self, directory: str = None, maxsize: int = None):
+        self.directory = directory or settings.VECTOR_INDEX_DIR or os.path.join(
+            tempfile.gettempdir(), "bizbrain-vector-index"
+        )
+        self.maxsize = maxsize or settings.VECTOR_INDEX_CACHE_SIZE
+        self._indexes: "OrderedDict[int, Tuple[tuple, SegmentedIndex]]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _path(self, knowledge_base_id: int, max_id: int) -> str:
+        return os.path.join(self.directory, f"kb_{knowledge_base_id}_{max_id}")
+
+    def newest_segment(self, knowledge_base_id: int) -> Optional[int]:
+        """本机上最新基础段的最大片段ID，可能由其他进程压缩生成"""
+        pattern = re.compile(rf"kb_{knowledge_base_id}_(\d+)\.vectors\.npy$")
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return None
+        max_ids = [int(m.group(1)) for m in map(pattern.match, names) if m]
+        return max(max_ids) if max_ids else None
+
+    async def get_index(self, db: AsyncSession, knowledge_base_id: int) -> SegmentedIndex:
+        stats = await chunk_stats(db, knowledge_base_id)
+        cached = self._indexes.get(knowledge_base_id)
+        if cached and cached[0] == stats:
+            self._indexes.move_to_end(knowledge_base_id)
+            return cached[1]
+
+        lock = self._locks.setdefault(knowledge_base_id, asyncio.Lock())
+        async with lock:
+            cached = self._indexes.get(knowledge_base_id)
+            if cached and cached[0] == stats:
+                return cached[1]
+            base, base_max_id = await self._load_base(db, knowledge_base_id, cached[1] if cached else None)
+
+            delta_stmt = (
+                select(DocumentChunk.id, DocumentChunk.embedding)
+                .where(
+                    DocumentChunk.knowledge_base_id == knowledge_base_id,
+                    DocumentChunk.id > base_max_id,
+                    DocumentChunk.deleted_at.is_(None),
+                    DocumentChunk.embedding.isnot(None)
+                )
+                .order_by(DocumentChunk.id)
+            )
+            rows = (await db.execute(delta_stmt)).all()
+            tombstone_stmt = select(DocumentChunk.id).where(
+                DocumentChunk.knowledge_base_id == knowledge_base_id,
+                DocumentChunk.id <= base_max_id,
+                DocumentChunk.deleted_at.isnot(None)
+            )
+            tombstones = frozenset((await db.execute(tombstone_stmt)).scalars())
+
+            index = SegmentedIndex(
+                base=base,
+                base_max_id=base_max_id,
+                delta=VectorIndex.from_embeddings(
+                    [row[0] for row in rows], [row[1] for row in rows], base.vectors.shape[1]
+                ),
+                tombstones=tombstones
+            )
+            self._put(knowledge_base_id, stats, index)
+            return index
+
+    async def _load_base(
+        self,
+        db: AsyncSession,
+        knowledge_base_id: int,
+        cached: Optional[SegmentedIndex]
+    ) -> Tuple[VectorIndex, int]:
+        newest = self.newest_segment(knowledge_base_id)
+        if cached and (newest is None or newest <= cached.base_max_id):
+            return cached.base, cached.base_max_id
+        if newest is not None:
+            base = await asyncio.to_thread(VectorIndex.load, self._path(knowledge_base_id, newest))
+            if base is not None:
+                return base, newest
+        return await self.build_base(db, knowledge_base_id)
+
+    async def build_base(self, db: AsyncSession, knowledge_base_id: int) -> Tuple[VectorIndex, int]:
+        """从当前有效片段构建并保存新的基础段，返回 (基础段, 覆盖到的最大片段ID)"""
+        max_id_stmt = select(func.coalesce(func.max(DocumentChunk.id), 0)).where(
+            DocumentChunk.knowledge_base_id == knowledge_base_id
+        )
+        max_id = (await db.execute(max_id_stmt)).scalar()
+        stmt = (
+            select(DocumentChunk.id, DocumentChunk.embedding)
+            .where(
+                DocumentChunk.knowledge_base_id == knowledge_base_id,
+                DocumentChunk.id <= max_id,
+                DocumentChunk.deleted_at.is_(None),
+                DocumentChunk.embedding.isnot(None)
+            )
+            .order_by(DocumentChunk.id)
+        )
+        rows = (await db.execute(stmt)).all()
+        ids = [row[0] for row in rows]
+        embeddings = [row[1] for row in rows]
+        dimensions = len(embeddings[0]) // EMBEDDING_DTYPE.itemsize if embeddings else settings.EMBEDDING_DIMENSIONS
+        path = self._path(knowledge_base_id, max_id)
+
+        def build_and_save() -> VectorIndex:
+            index = VectorIndex.from_embeddings(ids, embeddings, dimensions)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                index.save(path)
+                self._remove_older_segments(knowledge_base_id, max_id)
+                return VectorIndex.load(path) or index
+            except OSError as e:
+                logger.warning(f"Failed to persist vector index for knowledge base {knowledge_base_id}: {str(e)}")
+                return index
+
+        base = await asyncio.to_thread(build_and_save)
+        return base, max_id
+
+    def _remove_older_segments(self, knowledge_base_id: int, max_id: int):
+        pattern = re.compile(rf"kb_{knowledge_base_id}_(\d+)\.")
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match and int(match.group(1)) < max_id:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _put(self, knowledge_base_id: int, stats: tuple, index: SegmentedIndex):
+        self._indexes[knowledge_base_id] = (stats, index)
+        self._indexes.move_to_end(knowledge_base_id)
+        while len(self._indexes) > self.maxsize:
+            self._indexes.popitem(last=False)
+
+    def invalidate(self, knowledge_base_id: int):
+        self._indexes.pop(knowledge_base_id, None)
+
+    def drop(self, knowledge_base_id: int):
+        """知识库删除后清除缓存和本机的段文件"""
+        self.invalidate(knowledge_base_id)
+        if os.path.isdir(self.directory):
+            self._remove_older_segments(knowledge_base_id, float("inf"))
+
+
+local_vector_store = LocalVectorStore()
+
+# 检测到的 pgvector 可用性，进程内只检测一次
+_pgvector_available: Optional[bool] = None
+
+
+def _vector_literal(vector: Iterable[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in vector) + "]"
+
+
+class KnowledgeIndexService:
+    """知识库文档的切分、嵌入和向量检索"""
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        llm_service: LLMService = None,
+        vector_store: LocalVectorStore = None,
+        lexical_store: LocalLexicalStore = None
+    ):
+        self.db = db
+        self.llm_service = llm_service or get_llm_service()
+        self.vector_store = vector_store or local_vector_store
+        self.lexical_store = lexical_store or local_lexical_store
+
+    async def use_pgvector(self) -> bool:
+        """VECTOR_INDEX_BACKEND 为 auto 时，迁移创建了 embedding_vector 列才使用 pgvector"""
+        global _pgvector_available
+        backend = settings.VECTOR_INDEX_BACKEND
+        if backend != "auto":
+            return backend == "pgvector"
+        if _pgvector_available is None:
+            stmt = text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'document_chunks' AND column_name = 'embedding_vector'"
+            )
+            _pgvector_available = (await self.db.execute(stmt)).first() is not None
+        return _pgvector_available
+
+    async def index_documents(self, document_ids: Sequence[int]) -> Dict[str, int]:
+        """增量更新文档的片段
+
+        内容哈希未变的片段保留原有行和向量（只更新位置），知识库中已有相同内容的片段直接复制向量，
+        其余片段合并成一次批量嵌入请求；不再出现的片段标记为墓碑，由压缩任务清除。
+        同一文档的并发更新按文档加锁，但调用嵌入接口期间不持有锁和事务：先在短事务中计算差异，
+        提交后请求嵌入，再重新加锁计算差异并写入；期间内容又有变化的片段重新请求嵌入，过期的向量丢弃。
+        """
+        embeddings: Dict[Tuple[int, str], bytes] = {}
+        while True:
+            await self._lock_documents(document_ids)
+            diff = await self._diff_documents(document_ids)
+            if diff is None:
+                await self.db.commit()
+                return {"chunks": 0, "embedded": 0, "tombstoned": 0}
+            indexed_ids, total, pieces, moved, stale_ids = diff
+            await self._reuse_embeddings(pieces, embeddings)
+            missing = {}
+            for _, knowledge_base_id, _, chunk, content_hash in pieces:
+                if (knowledge_base_id, content_hash) not in embeddings:
+                    missing.setdefault(content_hash, chunk)
+            if not missing:
+                break
+            # 释放锁和连接后再调用嵌入接口
+            await self.db.commit()
+            await self._embed_missing(missing, pieces, embeddings)
+
+        chunks = [
+            DocumentChunk(
+                document_id=document_id,
+                knowledge_base_id=knowledge_base_id,
+                chunk_index=chunk_index,
+                content=chunk,
+                content_hash=content_hash,
+                embedding=embeddings[(knowledge_base_id, content_hash)]
+            )
+            for document_id, knowledge_base_id, chunk_index, chunk, content_hash in pieces
+        ]
+        self.db.add_all(chunks)
+        if moved:
+            await self.db.execute(update(DocumentChunk), moved)
+        if stale_ids:
+            await self.db.execute(
+                update(DocumentChunk).where(DocumentChunk.id.in_(stale_ids)).values(deleted_at=datetime.utcnow())
+            )
+        await self.db.flush()
+
+        if chunks and await self.use_pgvector():
+            await self.db.execute(
+                text("UPDATE document_chunks SET embedding_vector = CAST(:vector AS vector) WHERE id = :id"),
+                [{"id": chunk.id, "vector": _vector_literal(unpack_embedding(chunk.embedding))} for chunk in chunks]
+            )
+        await self._update_search_vectors(indexed_ids)
+        await self.db.commit()
+        return {"chunks": total, "embedded": len(chunks), "tombstoned": len(stale_ids)}
+
+    async def _diff_documents(self, document_ids: Sequence[int]) -> Optional[tuple]:
+        """对比文档当前内容与已有片段，返回 (文档ID, 片段总数, 新片段, 位置变化, 墓碑ID)；文档都不存在时返回 None"""
+        stmt = select(Document.id, Document.knowledge_base_id, Document.content).where(Document.id.in_(document_ids))
+        documents = (await self.db.execute(stmt)).all()
+        if not documents:
+            return None
+
+        existing_stmt = select(
+            DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_index, DocumentChunk.content_hash
+        ).where(
+            DocumentChunk.document_id.in_([document[0] for document in documents]),
+            DocumentChunk.deleted_at.is_(None)
+        )
+        reusable: Dict[Tuple[int, str], List[Tuple[int, int]]] = {}
+        for chunk_id, document_id, chunk_index, content_hash in (await self.db.execute(existing_stmt)).all():
+            reusable.setdefault((document_id, content_hash), []).append((chunk_id, chunk_index))
+
+        moved = []
+        pieces = []
+        total = 0
+        for document_id, knowledge_base_id, content in documents:
+            for chunk_index, chunk in enumerate(chunk_text(content or "")):
+                total += 1
+                content_hash = hash_chunk(chunk)
+                candidates = reusable.get((document_id, content_hash))
+                if candidates:
+                    chunk_id, old_index = candidates.pop()
+                    if old_index != chunk_index:
+                        moved.append({"id": chunk_id, "chunk_index": chunk_index})
+                else:
+                    pieces.append((document_id, knowledge_base_id, chunk_index, chunk, content_hash))
+        stale_ids = [chunk_id for candidates in reusable.values() for chunk_id, _ in candidates]
+        return [document[0] for document in documents], total, pieces, moved, stale_ids
+
+    async def _lock_documents(self, document_ids: Sequence[int]):
+        """在当前事务中按文档ID顺序获取 advisory lock，事务结束时释放；固定顺序避免批量更新互相死锁"""
+        await self.db.execute(
+            text(
+                "SELECT pg_advisory_xact_lock(:lock_class, ids.id) "
+                "FROM (SELECT DISTINCT unnest(CAST(:document_ids AS integer[])) AS id ORDER BY 1) AS ids"
+            ),
+            {"lock_class": DOCUMENT_INDEX_LOCK_CLASS, "document_ids": list(document_ids)}
+        )
+
+    async def _update_search_vectors(self, document_ids: List[int]):
+        """刷新文档有效片段的全文检索向量：标题权重 A，片段内容权重 B
+
+        不依赖嵌入，标题变更时内容未变的片段也会随之更新。
+        """
+        await self.db.execute(
+            text(
+                "UPDATE document_chunks AS c SET search_vector = "
+                f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(d.title, '')), 'A') || "
+                f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', c.content), 'B') "
+                "FROM documents AS d "
+                "WHERE d.id = c.document_id AND c.document_id = ANY(:document_ids) AND c.deleted_at IS NULL"
+            ),
+            {"document_ids": document_ids}
+        )
+
+    async def _reuse_embeddings(self, pieces: List[tuple], embeddings: Dict[Tuple[int, str], bytes]):
+        """按 (知识库ID, 内容哈希) 填入知识库中已有的相同片段的向量"""
+        keys = {(piece[1], piece[4]) for piece in pieces} - embeddings.keys()
+        if not keys:
+            return
+        stmt = select(DocumentChunk.knowledge_base_id, DocumentChunk.content_hash, DocumentChunk.embedding).where(
+            DocumentChunk.knowledge_base_id.in_({key[0] for key in keys}),
+            DocumentChunk.content_hash.in_({key[1] for key in keys}),
+            DocumentChunk.deleted_at.is_(None),
+            DocumentChunk.embedding.isnot(None)
+        )
+        for knowledge_base_id, content_hash, embedding in (await self.db.execute(stmt)).all():
+            embeddings.setdefault((knowledge_base_id, content_hash), embedding)
+
+    async def _embed_missing(
+        self,
+        missing: Dict[str, str],
+        pieces: List[tuple],
+        embeddings: Dict[Tuple[int, str], bytes]
+    ):
+        """将缺少向量的片段合并成一次批量嵌入请求，调用时不应持有事务"""
+        vectors = await self.llm_service.generate_embeddings_batch(
+            list(missing.values()), model=settings.EMBEDDING_MODEL
+        )
+        by_hash = dict(zip(missing, vectors))
+        for _, knowledge_base_id, _, _, content_hash in pieces:
+            if content_hash in by_hash:
+                embeddings.setdefault((knowledge_base_id, content_hash), pack_embedding(by_hash[content_hash]))
+
+    async def tombstone_document(self, document_id: int) -> int:
+        """删除文档前调用：将其片段标记为墓碑，由调用方提交"""
+        result = await self.db.execute(
+            update(DocumentChunk)
+            .where(DocumentChunk.document_id == document_id, DocumentChunk.deleted_at.is_(None))
+            .values(deleted_at=datetime.utcnow())
+        )
+        return result.rowcount
+
+    async def reindex_knowledge_base(self, knowledge_base_id: int) -> Dict[str, int]:
+        """按批增量更新整个知识库的片段"""
+        stmt = select(Document.id).where(Document.knowledge_base_id == knowledge_base_id).order_by(Document.id)
+        document_ids = list((await self.db.execute(stmt)).scalars())
+        batch_size = settings.KNOWLEDGE_INGEST_BATCH_DOCUMENTS
+        totals = {"chunks": 0, "embedded": 0, "tombstoned": 0}
+        for start in range(0, len(document_ids), batch_size):
+            counts = await self.index_documents(document_ids[start:start + batch_size])
+            for key, value in counts.items():
+                totals[key] += value
+        return totals
+
+    async def needs_compaction(self, knowledge_base_id: int) -> bool:
+        """墓碑（本地索引还包括增量段）超过有效片段的一定比例时需要压缩"""
+        live_count, max_id, tombstones = await chunk_stats(self.db, knowledge_base_id)
+        garbage = tombstones
+        if not await self.use_pgvector():
+            base_max_id = self.vector_store.newest_segment(knowledge_base_id) or 0
+            garbage += await self.db.scalar(
+                select(func.count(DocumentChunk.id)).where(
+                    DocumentChunk.knowledge_base_id == knowledge_base_id,
+                    DocumentChunk.id > base_max_id,
+                    DocumentChunk.deleted_at.is_(None)
+                )
+            )
+        threshold = max(settings.VECTOR_INDEX_COMPACTION_MIN, settings.VECTOR_INDEX_COMPACTION_RATIO * live_count)
+        return garbage >= threshold
+
+    async def compact(self, knowledge_base_id: int) -> bool:
+        """重建基础段并物理删除已被覆盖的墓碑；同一知识库同时只有一个进程压缩"""
+        locked = await self.db.scalar(
+            text("SELECT pg_try_advisory_xact_lock(:lock_class, :knowledge_base_id)"),
+            {"lock_class": COMPACTION_LOCK_CLASS, "knowledge_base_id": knowledge_base_id}
+        )
+        if not locked:
+            await self.db.rollback()
+            return False
+
+        purge = delete(DocumentChunk).where(
+            DocumentChunk.knowledge_base_id == knowledge_base_id,
+            DocumentChunk.deleted_at.isnot(None)
+        )
+        if not await self.use_pgvector():
+            # 先写新的基础段再删除墓碑，其他进程看到墓碑减少时能在本机找到新段
+            _, base_max_id = await self.vector_store.build_base(self.db, knowledge_base_id)
+            self.vector_store.invalidate(knowledge_base_id)
+            purge = purge.where(DocumentChunk.id <= base_max_id)
+        result = await self.db.execute(purge)
+        await self.db.commit()
+        logger.info(f"Compacted knowledge base {knowledge_base_id}, purged {result.rowcount} tombstones")
+        return True
+
+    async def search(self, knowledge_base_id: int, query: str, top_k: int = 5, mode: str = "hybrid") -> List[dict]:
+        """检索最相关的 top_k 个片段
+
+        mode 为 vector 或 lexical 时只用单路结果；hybrid 时两路各召回 top_k 的若干倍，
+        按倒数排名融合，精确词项（编号、客户ID）命中的片段即使向量相似度不高也能排到前面。
+        """
+        limit = top_k if mode != "hybrid" else top_k * settings.KNOWLEDGE_HYBRID_CANDIDATES
+        rankings: Dict[str, List[Tuple[int, float]]] = {}
+        if mode in ("hybrid", "vector"):
+            rankings["vector"] = await self._vector_search(knowledge_base_id, query, limit)
+        if mode in ("hybrid", "lexical"):
+            rankings["lexical"] = await self._lexical_search(knowledge_base_id, query, limit)
+
+        if mode == "hybrid":
+            scored = reciprocal_rank_fusion(list(rankings.values()))
+        else:
+            scored = rankings[mode]
+        sources = {name: dict(ranking) for name, ranking in rankings.items()}
+        return (await self._load_results(scored[:top_k * 2], sources))[:top_k]
+
+    async def _vector_search(self, knowledge_base_id: int, query: str, limit: int) -> List[Tuple[int, float]]:
+        query_vector = await self.llm_service.generate_embeddings(query, model=settings.EMBEDDING_MODEL)
+        if await self.use_pgvector():
+            return await self._search_pgvector(knowledge_base_id, query_vector, limit)
+        index = await self.vector_store.get_index(self.db, knowledge_base_id)
+        return await asyncio.to_thread(index.search, query_vector, limit)
+
+    async def _lexical_search(self, knowledge_base_id: int, query: str, limit: int) -> List[Tuple[int, float]]:
+        if settings.LEXICAL_INDEX_BACKEND == "local":
+            index = await self.lexical_store.get_index(self.db, knowledge_base_id)
+            return await asyncio.to_thread(index.search, query, limit)
+
+        # search_vector @@ query 走 GIN 索引
+        stmt = text(
+            "SELECT c.id, ts_rank_cd(c.search_vector, q.query) AS score "
+            f"FROM document_chunks AS c, websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', :query) AS q(query) "
+            "WHERE c.knowledge_base_id = :knowledge_base_id AND c.deleted_at IS NULL "
+            "AND c.search_vector @@ q.query "
+            "ORDER BY score DESC "
+            "LIMIT :limit"
+        )
+        result = await self.db.execute(stmt, {"query": query, "knowledge_base_id": knowledge_base_id, "limit": limit})
+        return [(row[0], float(row[1])) for row in result]
+
+    async def _search_pgvector(self, knowledge_base_id: int, query_vector: List[float], top_k: int) -> List[Tuple[int, float]]:
+        stmt = text(
+            "SELECT id, 1 - (embedding_vector <=> CAST(:vector AS vector)) AS score "
+            "FROM document_chunks "
+            "WHERE knowledge_base_id = :knowledge_base_id AND embedding_vector IS NOT NULL AND deleted_at IS NULL "
+            "ORDER BY embedding_vector <=> CAST(:vector AS vector) "
+            "LIMIT :top_k"
+        )
+        result = await self.db.execute(
+            stmt,
+            {"vector": _vector_literal(query_vector), "knowledge_base_id": knowledge_base_id, "top_k": top_k}
+        )
+        return [(row[0], float(row[1])) for row in result]
+
+    async def _load_results(
+        self,
+        scored: List[Tuple[int, float]],
+        sources: Dict[str, Dict[int, float]] = None
+    ) -> List[dict]:
+        if not scored:
+            return []
+        stmt = (
+            select(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_index, DocumentChunk.content, Document.title)
+            .join(Document, Document.id == DocumentChunk.document_id)
+            .where(DocumentChunk.id.in_([chunk_id for chunk_id, _ in scored]), DocumentChunk.deleted_at.is_(None))
+        )
+        rows = {row[0]: row for row in (await self.db.execute(stmt)).all()}
+        sources = sources or {}
+        results = []
+        for chunk_id, score in scored:
+            row = rows.get(chunk_id)
+            # 索引构建后片段可能已被删除
+            if row is None:
+                continue
+            results.append({
+                "chunk_id": chunk_id,
+                "document_id": row[1],
+                "chunk_index": row[2],
+                "content": row[3],
+                "title": row[4],
+                "score": score,
+                "vector_score": sources.get("vector", {}).get(chunk_id),
+                "lexical_score": sources.get("lexical", {}).get(chunk_id)
+            })
+        return results
+
+
+async def compact_if_needed(knowledge_base_id: int):
+    """后台任务入口：墓碑或增量段过多时压缩知识库索引"""
+    async with AsyncSessionLocal() as db:
+        try:
+            service = KnowledgeIndexService(db)
+            if await service.needs_compaction(knowledge_base_id):
+                await service.compact(knowledge_base_id)
+        except Exception as e:
+            logger.error(f"Failed to compact knowledge base {knowledge_base_id}: {str(e)}")
+            await db.rollback()
+
+
+async def ingest_document(document_id: int):
+    """后台任务入口：使用独立会话增量更新文档的索引"""
+    async with AsyncSessionLocal() as db:
+        try:
+            service = KnowledgeIndexService(db)
+            counts = await service.index_documents([document_id])
+            logger.info(f"Indexed document {document_id}: {counts}")
+            knowledge_base_id = await db.scalar(select(Document.knowledge_base_id).where(Document.id == document_id))
+        except Exception as e:
+            logger.error(f"Failed to index document {document_id}: {str(e)}")
+            await db.rollback()
+            return
+    if knowledge_base_id is not None:
+        await compact_if_needed(knowledge_base_id)
+
+
+async def reindex_knowledge_base(knowledge_base_id: int):
+    """后台任务入口：增量更新整个知识库的索引"""
+    async with AsyncSessionLocal() as db:
+        try:
+            counts = await KnowledgeIndexService(db).reindex_knowledge_base(knowledge_base_id)
+            logger.info(f"Reindexed knowledge base {knowledge_base_id}: {counts}")
+        except Exception as e:
+            logger.error(f"Failed to reindex knowledge base {knowledge_base_id}: {str(e)}")
+            await db.rollback()
+            return
+    await compact_if_needed(knowledge_base_id)
@@ -0,0 +1,144 @@
+from collections import Counter, OrderedDict
+from typing import Dict, List, Sequence, Tuple
+import asyncio
+import math
+import re
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..models.knowledge import Document, DocumentChunk
+
+# 标题词在文档中按该倍数计入词频
+TITLE_WEIGHT = 2
+
+# 单词及由 - _ . / 连接的编号（如 SKU-1024、cust_889），编号整体和各部分都作为词项
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-_./]\w+)*")
+_TOKEN_PARTS = re.compile(r"[-_./]")
+
+
+def tokenize(content: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(content.lower()):
+        tokens.append(token)
+        parts = _TOKEN_PARTS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class BM25Index:
+    """进程内的 BM25 倒排索引
+
+    每个词项的倒排表保存为 (文档行号数组, 词频数组)，查询时按词项向量化累加分数。
+    """
+
+    def __init__(self, ids: Sequence[int], documents: Sequence[List[str]], k1: float = 1.2, b: float = 0.75):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.k1 = k1
+        self.b = b
+        self.lengths = np.asarray([len(tokens) for tokens in documents], dtype=np.float32)
+        self.avg_length = float(self.lengths.mean()) if len(documents) else 0.0
+
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for row, tokens in enumerate(documents):
+            for term, count in Counter(tokens).items():
+                rows, counts = postings.setdefault(term, ([], []))
+                rows.append(row)
+                counts.append(count)
+        self.postings = {
+            term: (np.asarray(rows, dtype=np.int64), np.asarray(counts, dtype=np.float32))
+            for term, (rows, counts) in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """返回 BM25 分数最高的 top_k 个 (片段ID, 分数)，不含未命中任何词项的片段"""
+        if not len(self.ids) or top_k <= 0:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        total = len(self.ids)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, counts = posting
+            idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[rows] / self.avg_length)
+            scores[rows] += idf * counts * (self.k1 + 1) / (counts + norm)
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        top_k = min(top_k, len(matched))
+        candidates = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(self.ids[i]), float(scores[i])) for i in candidates]
+
+
+class LocalLexicalStore:
+    """按知识库缓存 BM25 索引，片段或文档标题变化后重建"""
+
+    def __init__(self, maxsize: int = None):
+        self.maxsize = maxsize or settings.VECTOR_INDEX_CACHE_SIZE
+        self._indexes: "OrderedDict[int, Tuple[tuple, BM25Index]]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    async def _version(self, db: AsyncSession, knowledge_base_id: int) -> tuple:
+        chunks = select(
+            func.count(DocumentChunk.id).filter(DocumentChunk.deleted_at.is_(None)),
+            func.coalesce(func.max(DocumentChunk.id), 0)
+        ).where(DocumentChunk.knowledge_base_id == knowledge_base_id)
+        documents = select(func.max(Document.updated_at)).where(Document.knowledge_base_id == knowledge_base_id)
+        return tuple((await db.execute(chunks)).one()) + ((await db.execute(documents)).scalar(),)
+
+    async def get_index(self, db: AsyncSession, knowledge_base_id: int) -> BM25Index:
+        version = await self._version(db, knowledge_base_id)
+        cached = self._indexes.get(knowledge_base_id)
+        if cached and cached[0] == version:
+            self._indexes.move_to_end(knowledge_base_id)
+            return cached[1]
+
+        lock = self._locks.setdefault(knowledge_base_id, asyncio.Lock())
+        async with lock:
+            cached = self._indexes.get(knowledge_base_id)
+            if cached and cached[0] == version:
+                return cached[1]
+            stmt = (
+                select(DocumentChunk.id, Document.title, DocumentChunk.content)
+                .join(Document, Document.id == DocumentChunk.document_id)
+                .where(DocumentChunk.knowledge_base_id == knowledge_base_id, DocumentChunk.deleted_at.is_(None))
+                .order_by(DocumentChunk.id)
+            )
+            rows = (await db.execute(stmt)).all()
+
+            def build() -> BM25Index:
+                return BM25Index(
+                    [row[0] for row in rows],
+                    [tokenize(row[1] or "") * TITLE_WEIGHT + tokenize(row[2]) for row in rows]
+                )
+
+            index = await asyncio.to_thread(build)
+            self._indexes[knowledge_base_id] = (version, index)
+            self._indexes.move_to_end(knowledge_base_id)
+            while len(self._indexes) > self.maxsize:
+                self._indexes.popitem(last=False)
+            return index
+
+    def invalidate(self, knowledge_base_id: int):
+        self._indexes.pop(knowledge_base_id, None)
+
+
+local_lexical_store = LocalLexicalStore()
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Tuple[int, float]]], k: int = None) -> List[Tuple[int, float]]:
+    """倒数排名融合：每路结果按名次贡献 1 / (k + 名次)，不依赖各路分数的量纲"""
+    k = settings.KNOWLEDGE_RRF_K if k is None else k
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (chunk_id, _) in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -1,8 +1,30 @@
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional
+import asyncio
+import time
 import httpx
+from ..core.cache import TieredCache, make_cache_key
 from ..core.config import settings
+from ..core.http_clients import get_http_client
+from ..core.metrics import LLM_REQUEST_DURATION, LLM_TOKENS
+from ..core.redis_client import get_redis
+from .embedding_batcher import EmbeddingBatcher
+from .rate_limiter import (
+    AdaptiveRateLimiter,
+    RateLimitError,
+    estimate_tokens,
+    get_llm_rate_limiter,
+    retry_after_from_headers,
+)
 import json
 
+# 进程内共享的响应缓存；LLMService 由 get_llm_service 按进程单例提供，缓存放在模块级，
+# 监控接口和单独构造的 LLMService 实例（如测试中）读写的也是同一份缓存
+llm_response_cache = TieredCache(
+    "bizbrain:llm",
+    settings.LLM_CACHE_SIZE,
+    redis=get_redis if settings.LLM_CACHE_REDIS_ENABLED else None
+)
+
 
 class LLMService:
     """LLM服务类"""
@@ -11,19 +33,87 @@ class LLMService:
         """初始化LLM服务"""
         self.api_key = settings.OPENAI_API_KEY
         self.base_url = settings.OPENAI_API_BASE or "https://api.openai.com/v1"
-        self.client = httpx.AsyncClient(
+        # 复用进程内共享的连接池，避免每次请求重新建立 TLS 连接
+        self.client = get_http_client(
+            "llm",
             base_url=self.base_url,
             headers={
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
-            }
+            },
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            # 只访问一个上游，连接上限即单主机上限
+            max_connections_per_host=settings.LLM_MAX_CONNECTIONS
+        )
+        self.embedding_batcher = EmbeddingBatcher(
+            self._request_embeddings,
+            max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            max_delay=settings.EMBEDDING_COALESCE_WINDOW_MS / 1000
         )
 
+    def _use_cache(self, temperature: float, cache: Optional[bool]) -> bool:
+        """默认只缓存 temperature 为 0 的确定性请求，cache=True 时强制缓存，cache=False 时不缓存"""
+        if not settings.LLM_CACHE_ENABLED or cache is False:
+            return False
+        return cache is True or not temperature
+
+    async def _cached_post(
+        self,
+        operation: str,
+        endpoint: str,
+        data: Dict[str, Any],
+        use_cache: bool
+    ) -> Dict[str, Any]:
+        """发送请求，相同的规范化请求内容直接返回缓存的响应"""
+        if not use_cache:
+            return await self._post(endpoint, data)
+
+        key = make_cache_key(self.base_url, endpoint, data)
+        hit, cached = await llm_response_cache.get(key, namespace=operation)
+        if hit:
+            return cached
+        result = await self._post(endpoint, data)
+        await llm_response_cache.set(key, result, settings.LLM_CACHE_TTLS.get(operation, 0))
+        return result
+
+    async def _post(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """经限流器放行后发送请求，按响应中的实际 token 用量结算额度"""
+        model = data.get("model", "unknown")
+        limiter = get_llm_rate_limiter(model)
+        reservation = await limiter.acquire(estimate_tokens(data))
+        started = time.perf_counter()
+        outcome = "error"
+        # 上游未受理（连接失败、429、错误状态码）时退还全部预占额度，受理后按预估用量结算，直到读到实际用量
+        used_tokens = 0
+        try:
+            response = await self.client.post(endpoint, json=data)
+            self._check_rate_limit(response, limiter)
+            response.raise_for_status()
+            used_tokens = None
+            result = response.json()
+            usage = result.get("usage") or {}
+            used_tokens = usage.get("total_tokens")
+            outcome = "ok"
+        finally:
+            # 耗时不含在限流器中等待的时间
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - started, model, endpoint, outcome)
+            limiter.record_usage(reservation, used_tokens, succeeded=outcome == "ok")
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.inc(usage[kind], model, kind[:-len("_tokens")])
+        return result
+
+    def _check_rate_limit(self, response: httpx.Response, limiter: AdaptiveRateLimiter):
+        """根据响应头校准请求模型的限流器，429 时抛出带 retry_after 的 RateLimitError"""
+        limiter.update_from_headers(response.headers)
+        if response.status_code == 429:
+            retry_after = retry_after_from_headers(response.headers)
+            limiter.on_rate_limited(retry_after)
+            raise RateLimitError(f"LLM API rate limited, retry after {retry_after}s", retry_after)
+
     async def _make_request(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """发送请求到OpenAI API"""
-        response = await self.client.post(endpoint, json=data)
-        response.raise_for_status()
-        return response.json()
+        return await self._post(endpoint, data)
 
     async def completion(self, prompt: str, max_tokens: int = 100) -> str:
         """文本补全"""
@@ -57,8 +147,8 @@ class LLMService:
         return await self.completion(prompt)
 
     async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
+        """发出等待中的嵌入批次；HTTP 客户端为进程共享，由 close_http_clients 统一关闭"""
+        await self.embedding_batcher.close()
 
     async def generate_completion(
         self,
@@ -67,55 +157,168 @@ class LLMService:
         temperature: float = 0.7,
         max_tokens: int = 1000,
         stop: Optional[List[str]] = None,
+        cache: Optional[bool] = None,
+        cache_operation: str = "completion",
         **kwargs
     ) -> Dict[str, Any]:
-        """生成文本补全"""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
+        """生成文本补全
+
+        cache 为 None 时只缓存 temperature 为 0 的请求；cache_operation 决定缓存时间和统计分类。
+        """
+        data = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **kwargs
         }
         
+        if stop:
+            data["stop"] = stop
+        
+        try:
+            return await self._cached_post(
+                cache_operation,
+                "/chat/completions",
+                data,
+                self._use_cache(temperature, cache)
+            )
+        except RateLimitError:
+            raise
+        except Exception as e:
+            raise ValueError(f"LLM API request failed: {str(e)}")
+    
+    async def stream_completion(
+        self,
+        prompt: str,
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        stop: Optional[List[str]] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """流式生成文本补全，逐段返回模型输出的内容"""
         data = {
             "model": model,
             "messages": [{"role": "user", "content": prompt}],
             "temperature": temperature,
             "max_tokens": max_tokens,
+            "stream": True,
             **kwargs
         }
         
         if stop:
             data["stop"] = stop
         
+        limiter = get_llm_rate_limiter(model)
+        reservation = await limiter.acquire(estimate_tokens(data))
+        started = time.perf_counter()
+        outcome = "error"
+        # 同 _post：上游受理前失败退还全部额度；流式响应不含 usage，受理后（包括中途取消）按预估用量结算
+        used_tokens = 0
         try:
-            response = await self.client.post("/chat/completions", headers=headers, json=data)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
+            async with self.client.stream("POST", "/chat/completions", json=data) as response:
+                self._check_rate_limit(response, limiter)
+                response.raise_for_status()
+                used_tokens = None
+                async for line in response.aiter_lines():
+                    # 响应为 SSE 格式，每个 data 行是一个增量片段
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    chunk = json.loads(payload)
+                    if not chunk.get("choices"):
+                        continue
+                    content = chunk["choices"][0].get("delta", {}).get("content")
+                    if content:
+                        yield content
+            outcome = "ok"
+        except httpx.HTTPError as e:
             raise ValueError(f"LLM API request failed: {str(e)}")
+        finally:
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - started, model, "/chat/completions", outcome)
+            limiter.record_usage(reservation, used_tokens, succeeded=outcome == "ok")
     
     async def generate_embeddings(
         self,
         text: str,
         model: str = "text-embedding-ada-002"
     ) -> List[float]:
-        """生成文本嵌入"""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        """生成文本嵌入，并发的单条请求会被合并为批量请求"""
+        use_cache = self._use_cache(0, None)
+        key = self._embedding_cache_key(text, model)
+        if use_cache:
+            hit, cached = await llm_response_cache.get(key, namespace="embedding")
+            if hit:
+                return cached
         
-        data = {
-            "model": model,
-            "input": text
-        }
+        embedding = await self.embedding_batcher.submit(text, model)
+        if use_cache:
+            await llm_response_cache.set(key, embedding, settings.LLM_CACHE_TTLS.get("embedding", 0))
+        return embedding
+    
+    async def generate_embeddings_batch(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-ada-002"
+    ) -> List[List[float]]:
+        """批量生成文本嵌入，按输入顺序返回；已缓存的文本不再请求，重复文本只请求一次"""
+        if not texts:
+            return []
         
-        try:
-            response = await self.client.post("/embeddings", headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
-            return result["data"][0]["embedding"]
-        except Exception as e:
-            raise ValueError(f"Embeddings API request failed: {str(e)}")
+        use_cache = self._use_cache(0, None)
+        found: Dict[str, List[float]] = {}
+        if use_cache:
+            for text in set(texts):
+                hit, cached = await llm_response_cache.get(self._embedding_cache_key(text, model), namespace="embedding")
+                if hit:
+                    found[text] = cached
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+        
+        if missing:
+            embeddings = await self._request_embeddings(missing, model)
+            for text, embedding in zip(missing, embeddings):
+                found[text] = embedding
+                if use_cache:
+                    await llm_response_cache.set(
+                        self._embedding_cache_key(text, model),
+                        embedding,
+                        settings.LLM_CACHE_TTLS.get("embedding", 0)
+                    )
+        return [found[text] for text in texts]
+    
+    def _embedding_cache_key(self, text: str, model: str) -> str:
+        return make_cache_key(self.base_url, "/embeddings", {"model": model, "input": text})
+    
+    async def _request_embeddings(self, texts: List[str], model: str) -> List[List[float]]:
+        """按服务端限制（条数和总长度）分块请求嵌入，各块并发发送"""
+        chunks = []
+        chunk, chunk_chars = [], 0
+        for text in texts:
+            if chunk and (
+                len(chunk) >= settings.EMBEDDING_BATCH_SIZE
+                or chunk_chars + len(text) > settings.EMBEDDING_BATCH_MAX_CHARS
+            ):
+                chunks.append(chunk)
+                chunk, chunk_chars = [], 0
+            chunk.append(text)
+            chunk_chars += len(text)
+        if chunk:
+            chunks.append(chunk)
+        
+        async def request_chunk(chunk: List[str]) -> List[List[float]]:
+            try:
+                result = await self._post("/embeddings", {"model": model, "input": chunk})
+            except RateLimitError:
+                raise
+            except Exception as e:
+                raise ValueError(f"Embeddings API request failed: {str(e)}")
+            return [item["embedding"] for item in sorted(result["data"], key=lambda item: item["index"])]
+        
+        results = await asyncio.gather(*[request_chunk(chunk) for chunk in chunks])
+        return [embedding for chunk_result in results for embedding in chunk_result]
     
     async def analyze_sentiment(
         self,
@@ -135,7 +338,9 @@ class LLMService:
         response = await self.generate_completion(
             prompt=prompt,
             model=model,
-            temperature=0.3
+            temperature=0.3,
+            cache=True,
+            cache_operation="sentiment"
         )
         
         try:
@@ -163,7 +368,9 @@ class LLMService:
         response = await self.generate_completion(
             prompt=prompt,
             model=model,
-            temperature=0.3
+            temperature=0.3,
+            cache=True,
+            cache_operation="entities"
         )
         
         try:
@@ -191,11 +398,24 @@ class LLMService:
             prompt=prompt,
             model=model,
             temperature=0.3,
-            max_tokens=max_length * 2
+            max_tokens=max_length * 2,
+            cache=True,
+            cache_operation="summary"
         )
         
         try:
             result = json.loads(response["choices"][0]["message"]["content"])
             return result
         except Exception as e:
-            raise ValueError(f"Failed to parse summary result: {str(e)}") 
\ No newline at end of file
+            raise ValueError(f"Failed to parse summary result: {str(e)}") 
+
+
+_llm_service: Optional[LLMService] = None
+
+
+def get_llm_service() -> LLMService:
+    """获取进程内共享的 LLMService，使并发请求的嵌入合并跨越不同的执行"""
+    global _llm_service
+    if _llm_service is None:
+        _llm_service = LLMService()
+    return _llm_service
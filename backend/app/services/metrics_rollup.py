@@ -0,0 +1,263 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from uuid import UUID
+import logging
+from sqlalchemy import delete, func, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..models.metrics_rollup import ExecutionMetricRollup
+
+logger = logging.getLogger(__name__)
+
+# 时长直方图各区间的上界（秒），最后一个区间无上界
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+GRANULARITIES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+# 累加时合并直方图数组：逐元素相加
+_MERGE_HISTOGRAM = literal_column(
+    "ARRAY(SELECT a + b FROM unnest(execution_metric_rollups.duration_histogram, "
+    "excluded.duration_histogram) AS h(a, b))"
+)
+
+
+@dataclass(frozen=True)
+class TaskSample:
+    """一次任务运行的结果，由引擎在执行期间收集"""
+    task_type: Optional[str]
+    status: str
+    duration: Optional[float]
+
+
+def _as_utc(ts: datetime) -> datetime:
+    # 库中 naive 时间按 UTC 写入
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def truncate(ts: datetime, granularity: str) -> datetime:
+    """按粒度截断到桶的起点（UTC）"""
+    ts = _as_utc(ts).replace(second=0, microsecond=0)
+    if granularity in ("hour", "day"):
+        ts = ts.replace(minute=0)
+    if granularity == "day":
+        ts = ts.replace(hour=0)
+    return ts
+
+
+def histogram_index(duration: float) -> int:
+    return bisect_left(DURATION_BUCKETS, duration)
+
+
+def estimate_percentile(histogram: Sequence[int], q: float, maximum: Optional[float] = None) -> Optional[float]:
+    """从直方图估算分位数，在命中的区间内线性插值"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            lower = DURATION_BUCKETS[index - 1] if index else 0.0
+            upper = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else (maximum or lower)
+            if maximum is not None:
+                upper = min(upper, maximum)
+            return lower + (max(upper, lower) - lower) * (rank - cumulative) / count
+        cumulative += count
+    return maximum
+
+
+class RollupAccumulator:
+    """在内存中按主键累加样本，最后用一条 INSERT ... ON CONFLICT 写入所有粒度的桶"""
+
+    def __init__(self):
+        self.rows: Dict[tuple, Dict[str, Any]] = {}
+
+    def add(
+        self,
+        created_at: datetime,
+        kind: str,
+        task_type: Optional[str],
+        status: str,
+        workflow_id: UUID,
+        user_id: UUID,
+        duration: Optional[float]
+    ):
+        for granularity in GRANULARITIES:
+            key = (granularity, truncate(created_at, granularity), kind, task_type or "", status, workflow_id, user_id)
+            row = self.rows.get(key)
+            if row is None:
+                row = self.rows[key] = {
+                    "granularity": key[0],
+                    "bucket_start": key[1],
+                    "kind": kind,
+                    "task_type": key[3],
+                    "status": status,
+                    "workflow_id": workflow_id,
+                    "user_id": user_id,
+                    "count": 0,
+                    "duration_count": 0,
+                    "duration_sum": 0.0,
+                    "duration_max": None,
+                    "duration_histogram": [0] * (len(DURATION_BUCKETS) + 1),
+                }
+            row["count"] += 1
+            if duration is not None and duration >= 0:
+                row["duration_count"] += 1
+                row["duration_sum"] += duration
+                row["duration_max"] = duration if row["duration_max"] is None else max(row["duration_max"], duration)
+                row["duration_histogram"][histogram_index(duration)] += 1
+
+    def add_execution(self, execution, task_samples: Iterable[TaskSample]):
+        """累加一次已结束的工作流执行及其任务"""
+        duration = None
+        if execution.started_at and execution.completed_at:
+            duration = (_as_utc(execution.completed_at) - _as_utc(execution.started_at)).total_seconds()
+        status = execution.status.value
+        self.add(execution.created_at, "workflow", None, status, execution.workflow_id, execution.user_id, duration)
+        for sample in task_samples:
+            self.add(
+                execution.created_at, "task", sample.task_type, sample.status,
+                execution.workflow_id, execution.user_id, sample.duration
+            )
+
+    async def flush(self, db: AsyncSession):
+        if not self.rows:
+            return
+        table = ExecutionMetricRollup.__table__
+        stmt = pg_insert(table).values(list(self.rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key.columns],
+            set_={
+                "count": table.c.count + stmt.excluded.count,
+                "duration_count": table.c.duration_count + stmt.excluded.duration_count,
+                "duration_sum": table.c.duration_sum + stmt.excluded.duration_sum,
+                "duration_max": func.greatest(table.c.duration_max, stmt.excluded.duration_max),
+                "duration_histogram": _MERGE_HISTOGRAM,
+            }
+        )
+        await db.execute(stmt)
+        self.rows.clear()
+
+
+async def record_execution(db: AsyncSession, execution, task_samples: Iterable[TaskSample]):
+    """执行结束时累加到各粒度的桶，由调用方与执行状态一起提交"""
+    accumulator = RollupAccumulator()
+    accumulator.add_execution(execution, task_samples)
+    await accumulator.flush(db)
+
+
+def _retention(granularity: str) -> Optional[timedelta]:
+    days = settings.METRICS_ROLLUP_RETENTION_DAYS.get(granularity)
+    return timedelta(days=days) if days else None
+
+
+def rollup_granularity(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    now: Optional[datetime] = None
+) -> Optional[str]:
+    """选择能精确覆盖时间范围的最粗粒度
+
+    范围的起止必须落在桶边界上（结束时间视为开区间），且起点仍在该粒度的保留期内；
+    不满足时返回 None，由调用方回退到明细表。
+    """
+    now = _as_utc(now or datetime.now(timezone.utc))
+    for granularity in ("day", "hour", "minute"):
+        if any(ts is not None and truncate(ts, granularity) != _as_utc(ts) for ts in (start, end)):
+            continue
+        retention = _retention(granularity)
+        if retention and (start is None or _as_utc(start) < now - retention):
+            continue
+        return granularity
+    return None
+
+
+@dataclass
+class RollupSummary:
+    """若干桶合并后的统计"""
+    count: int = 0
+    duration_count: int = 0
+    duration_sum: float = 0.0
+    duration_max: Optional[float] = None
+    histogram: List[int] = None
+
+    def merge(self, row):
+        self.count += row.count
+        self.duration_count += row.duration_count
+        self.duration_sum += row.duration_sum
+        if row.duration_max is not None:
+            self.duration_max = row.duration_max if self.duration_max is None else max(self.duration_max, row.duration_max)
+        if self.histogram is None:
+            self.histogram = list(row.duration_histogram)
+        else:
+            self.histogram = [a + b for a, b in zip(self.histogram, row.duration_histogram)]
+
+    @property
+    def average_duration(self) -> Optional[float]:
+        return self.duration_sum / self.duration_count if self.duration_count else None
+
+    def percentile(self, q: float) -> Optional[float]:
+        return estimate_percentile(self.histogram or [], q, self.duration_max)
+
+
+async def load_rollups(
+    db: AsyncSession,
+    kind: str,
+    granularity: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    workflow_id: Optional[UUID] = None,
+    user_id: Optional[UUID] = None,
+    task_type: Optional[str] = None
+) -> List:
+    """读取时间范围内的桶，行数与桶数和维度组合数成正比，与明细行数无关"""
+    model = ExecutionMetricRollup
+    stmt = select(
+        model.bucket_start, model.task_type, model.status, model.workflow_id, model.user_id,
+        model.count, model.duration_count, model.duration_sum, model.duration_max, model.duration_histogram
+    ).where(model.granularity == granularity, model.kind == kind)
+    if start is not None:
+        stmt = stmt.where(model.bucket_start >= _as_utc(start))
+    if end is not None:
+        stmt = stmt.where(model.bucket_start < _as_utc(end))
+    if workflow_id is not None:
+        stmt = stmt.where(model.workflow_id == workflow_id)
+    if user_id is not None:
+        stmt = stmt.where(model.user_id == user_id)
+    if task_type is not None:
+        stmt = stmt.where(model.task_type == task_type)
+    return (await db.execute(stmt.order_by(model.bucket_start))).all()
+
+
+def summarize(rows: Iterable, key=lambda row: None) -> Dict[Any, RollupSummary]:
+    """按 key 合并桶"""
+    summaries: Dict[Any, RollupSummary] = {}
+    for row in rows:
+        summaries.setdefault(key(row), RollupSummary()).merge(row)
+    return summaries
+
+
+async def purge_expired_rollups(db: AsyncSession) -> int:
+    """删除超过保留期的分钟/小时桶"""
+    now = datetime.now(timezone.utc)
+    purged = 0
+    for granularity in GRANULARITIES:
+        retention = _retention(granularity)
+        if retention is None:
+            continue
+        result = await db.execute(
+            delete(ExecutionMetricRollup).where(
+                ExecutionMetricRollup.granularity == granularity,
+                ExecutionMetricRollup.bucket_start < truncate(now - retention, granularity)
+            )
+        )
+        purged += result.rowcount
+    await db.commit()
+    return purged
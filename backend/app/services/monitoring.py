@@ -1,5 +1,6 @@
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
+from uuid import UUID
 from sqlalchemy import func, desc, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -11,77 +12,97 @@ from app.schemas.monitoring import (
     TaskExecutionStats,
     TaskTypeStats,
     WorkflowExecutionStats,
+    ExecutionMetricsBucket,
     SystemStats,
     MonitoringStats
 )
+from app.models.metrics_rollup import ExecutionMetricRollup
+from app.services.metrics_rollup import RollupSummary, load_rollups, rollup_granularity, summarize, truncate
+from app.services.system_metrics import system_metrics_sampler
 from app.schemas.workflow_execution import WorkflowExecutionCreate, WorkflowExecutionUpdate
 
+
+def _duration(model):
+    """执行时长（秒），未开始或未结束时为 NULL，不参与平均值和分位数"""
+    return func.extract("epoch", model.completed_at - model.started_at)
+
+
+def _status_counts(status_column, statuses) -> List:
+    """总数和各状态的数量，用 FILTER 在同一次扫描中计算"""
+    return [func.count().label("total")] + [
+        func.count().filter(status_column == status).label(status.value)
+        for status in statuses
+    ]
+
+
+def _duration_stats(duration) -> List:
+    return [
+        func.avg(duration).label("average_duration"),
+        func.percentile_cont(0.5).within_group(duration).label("p50_duration"),
+        func.percentile_cont(0.95).within_group(duration).label("p95_duration")
+    ]
+
+
 class MonitoringService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
     async def get_task_execution_stats(
         self,
-        task_id: Optional[int] = None,
-        execution_id: Optional[int] = None,
+        task_id: Optional[UUID] = None,
+        execution_id: Optional[UUID] = None,
         start_time: Optional[datetime] = None,
         end_time: Optional[datetime] = None
     ) -> TaskExecutionStats:
-        query = select(WorkflowTask)
-        
+        # ROLLUP 在各任务类型的分组之外再给出一行总计，grouping(type) = 1 的是总计行
+        duration = _duration(WorkflowTask)
+        query = select(
+            WorkflowTask.type,
+            func.grouping(WorkflowTask.type).label("is_total"),
+            *_status_counts(WorkflowTask.status, TaskStatus),
+            *_duration_stats(duration)
+        ).group_by(func.rollup(WorkflowTask.type))
+
         if task_id:
             query = query.where(WorkflowTask.id == task_id)
         if execution_id:
-            query = query.where(WorkflowTask.execution_id == execution_id)
+            # 任务本身不记录执行ID，通过任务日志找出该次执行涉及的任务
+            query = query.where(
+                WorkflowTask.id.in_(select(TaskLog.task_id).where(TaskLog.execution_id == execution_id))
+            )
         if start_time:
             query = query.where(WorkflowTask.created_at >= start_time)
         if end_time:
             query = query.where(WorkflowTask.created_at <= end_time)
 
-        result = await self.db.execute(query)
-        tasks = result.scalars().all()
-        
-        total_tasks = len(tasks)
-        completed_tasks = sum(1 for t in tasks if t.status == TaskStatus.COMPLETED)
-        failed_tasks = sum(1 for t in tasks if t.status == TaskStatus.FAILED)
-        pending_tasks = sum(1 for t in tasks if t.status == TaskStatus.PENDING)
-        running_tasks = sum(1 for t in tasks if t.status == TaskStatus.RUNNING)
-        
+        rows = (await self.db.execute(query)).all()
+        total = next((row for row in rows if row.is_total), None)
+
         # 计算每种任务类型的统计信息
-        task_type_stats = {}
-        for task_type in TaskType:
-            type_tasks = [t for t in tasks if t.task_type == task_type]
-            if type_tasks:
-                durations = [
-                    (t.completed_at - t.started_at).total_seconds()
-                    for t in type_tasks
-                    if t.completed_at and t.started_at
-                ]
-                avg_duration = sum(durations) / len(durations) if durations else None
-                task_type_stats[task_type] = TaskTypeStats(
-                    task_type=task_type.value,
-                    total_count=len(type_tasks),
-                    success_count=sum(1 for t in type_tasks if t.status == TaskStatus.COMPLETED),
-                    failure_count=sum(1 for t in type_tasks if t.status == TaskStatus.FAILED),
-                    average_duration=avg_duration
-                )
-
-        # 计算总体平均执行时间
-        all_durations = [
-            (t.completed_at - t.started_at).total_seconds()
-            for t in tasks
-            if t.completed_at and t.started_at
+        by_type = [
+            TaskTypeStats(
+                task_type=row.type.value,
+                total_count=row.total,
+                success_count=row.completed,
+                failure_count=row.failed,
+                average_duration=row.average_duration,
+                p50_duration=row.p50_duration,
+                p95_duration=row.p95_duration
+            )
+            for row in rows
+            if not row.is_total and row.type is not None
         ]
-        average_duration = sum(all_durations) / len(all_durations) if all_durations else None
 
         return TaskExecutionStats(
-            total_tasks=total_tasks,
-            completed_tasks=completed_tasks,
-            failed_tasks=failed_tasks,
-            pending_tasks=pending_tasks,
-            running_tasks=running_tasks,
-            average_duration=average_duration,
-            by_type=list(task_type_stats.values())
+            total_tasks=total.total if total else 0,
+            completed_tasks=total.completed if total else 0,
+            failed_tasks=total.failed if total else 0,
+            pending_tasks=total.pending if total else 0,
+            running_tasks=total.running if total else 0,
+            average_duration=total.average_duration if total else None,
+            p50_duration=total.p50_duration if total else None,
+            p95_duration=total.p95_duration if total else None,
+            by_type=by_type
         )
 
     async def get_workflow_execution_stats(
@@ -89,48 +110,147 @@ class MonitoringService:
         start_time: Optional[datetime] = None,
         end_time: Optional[datetime] = None
     ) -> WorkflowExecutionStats:
-        query = select(WorkflowExecution)
+        # 时间范围与汇总桶对齐时读汇总表，代价与桶数成正比
+        granularity = rollup_granularity(start_time, end_time)
+        if granularity:
+            return await self._workflow_stats_from_rollups(granularity, start_time, end_time)
+
+        query = select(
+            *_status_counts(WorkflowExecution.status, ExecutionStatus),
+            *_duration_stats(_duration(WorkflowExecution))
+        )
         
         if start_time:
             query = query.where(WorkflowExecution.created_at >= start_time)
         if end_time:
-            query = query.where(WorkflowExecution.created_at <= end_time)
+            # 与汇总表一致按左闭右开区间过滤，end_time 是否落在桶边界不影响结果
+            query = query.where(WorkflowExecution.created_at < end_time)
 
-        result = await self.db.execute(query)
-        executions = result.scalars().all()
-        
-        total_executions = len(executions)
-        completed_executions = sum(1 for e in executions if e.status == ExecutionStatus.COMPLETED)
-        failed_executions = sum(1 for e in executions if e.status == ExecutionStatus.FAILED)
-        pending_executions = sum(1 for e in executions if e.status == ExecutionStatus.PENDING)
-        running_executions = sum(1 for e in executions if e.status == ExecutionStatus.RUNNING)
-        
-        # 计算平均执行时间
-        durations = [
-            (e.completed_at - e.started_at).total_seconds()
-            for e in executions
-            if e.completed_at and e.started_at
-        ]
-        average_duration = sum(durations) / len(durations) if durations else None
+        row = (await self.db.execute(query)).one()
 
         return WorkflowExecutionStats(
-            total_executions=total_executions,
-            completed_executions=completed_executions,
-            failed_executions=failed_executions,
-            pending_executions=pending_executions,
-            running_executions=running_executions,
-            average_duration=average_duration
+            total_executions=row.total,
+            completed_executions=row.completed,
+            failed_executions=row.failed,
+            pending_executions=row.pending,
+            running_executions=row.running,
+            average_duration=row.average_duration,
+            p50_duration=row.p50_duration,
+            p95_duration=row.p95_duration
         )
 
-    async def get_system_stats(self) -> SystemStats:
-        # 这里应该使用实际的系统监控工具来获取这些指标
-        # 这里只是返回示例数据
-        return SystemStats(
-            cpu_usage=50.0,
-            memory_usage=60.0,
-            disk_usage=40.0,
-            uptime=3600.0  # 1小时
+    async def _workflow_stats_from_rollups(
+        self,
+        granularity: str,
+        start_time: Optional[datetime],
+        end_time: Optional[datetime]
+    ) -> WorkflowExecutionStats:
+        rows = await load_rollups(self.db, "workflow", granularity, start_time, end_time)
+        overall = summarize(rows).get(None, RollupSummary())
+        by_status = summarize(rows, key=lambda row: row.status)
+
+        # 汇总表只记录已结束的执行，未结束的执行走部分索引单独计数
+        active_query = (
+            select(WorkflowExecution.status, func.count())
+            .where(WorkflowExecution.status.in_([ExecutionStatus.PENDING, ExecutionStatus.RUNNING]))
+            .group_by(WorkflowExecution.status)
         )
+        if start_time:
+            active_query = active_query.where(WorkflowExecution.created_at >= start_time)
+        if end_time:
+            active_query = active_query.where(WorkflowExecution.created_at < end_time)
+        active = dict((await self.db.execute(active_query)).all())
+
+        def finished(status: ExecutionStatus) -> int:
+            summary = by_status.get(status.value)
+            return summary.count if summary else 0
+
+        return WorkflowExecutionStats(
+            total_executions=overall.count + sum(active.values()),
+            completed_executions=finished(ExecutionStatus.COMPLETED),
+            failed_executions=finished(ExecutionStatus.FAILED),
+            pending_executions=active.get(ExecutionStatus.PENDING, 0),
+            running_executions=active.get(ExecutionStatus.RUNNING, 0),
+            average_duration=overall.average_duration,
+            p50_duration=overall.percentile(0.5),
+            p95_duration=overall.percentile(0.95)
+        )
+
+    async def get_execution_timeseries(
+        self,
+        granularity: str,
+        kind: str = "workflow",
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        workflow_id: Optional[UUID] = None,
+        user_id: Optional[UUID] = None,
+        task_type: Optional[str] = None
+    ) -> List[ExecutionMetricsBucket]:
+        """按桶返回已结束的执行数量和耗时，数据来自汇总表"""
+        rows = await load_rollups(
+            self.db, kind, granularity, start_time, end_time,
+            workflow_id=workflow_id, user_id=user_id, task_type=task_type
+        )
+        buckets = summarize(rows, key=lambda row: row.bucket_start)
+        failures = summarize(
+            (row for row in rows if row.status == ExecutionStatus.FAILED.value),
+            key=lambda row: row.bucket_start
+        )
+        return [
+            ExecutionMetricsBucket(
+                bucket_start=bucket_start,
+                count=summary.count,
+                failed=failures[bucket_start].count if bucket_start in failures else 0,
+                average_duration=summary.average_duration,
+                p95_duration=summary.percentile(0.95)
+            )
+            for bucket_start, summary in buckets.items()
+        ]
+
+    async def get_dashboard_stats(self, hours: int = 24) -> Dict[str, int]:
+        """仪表盘计数，一条语句完成
+
+        任务计数用 FILTER 在 workflow_tasks 的一次扫描中得出；最近若干小时已结束的
+        执行和任务运行数从小时桶读取，两部分各聚合为一行后交叉连接。
+        """
+        tasks = select(
+            func.count().label("total_tasks"),
+            func.count().filter(WorkflowTask.status == TaskStatus.RUNNING).label("running_tasks"),
+            func.count().filter(WorkflowTask.status == TaskStatus.COMPLETED).label("completed_tasks"),
+            func.count().filter(WorkflowTask.status == TaskStatus.FAILED).label("failed_tasks"),
+            func.count().filter(WorkflowTask.type == TaskType.LOOP).label("scheduled_tasks"),
+            func.count().filter(WorkflowTask.type == TaskType.LLM).label("llm_tasks")
+        ).subquery()
+
+        rollup = ExecutionMetricRollup
+        failed = rollup.status == ExecutionStatus.FAILED.value
+        recent_columns = []
+        for kind, name in (("workflow", "executions"), ("task", "task_runs")):
+            recent_columns += [
+                func.coalesce(func.sum(rollup.count).filter(rollup.kind == kind), 0).label(f"{name}_{hours}h"),
+                func.coalesce(
+                    func.sum(rollup.count).filter(rollup.kind == kind, failed), 0
+                ).label(f"failed_{name}_{hours}h")
+            ]
+        recent = select(*recent_columns).where(
+            rollup.granularity == "hour",
+            rollup.bucket_start >= truncate(datetime.utcnow() - timedelta(hours=hours), "hour")
+        ).subquery()
+
+        row = (await self.db.execute(select(tasks, recent))).one()
+        return {key: int(value) for key, value in row._mapping.items()}
+
+    @staticmethod
+    async def get_system_stats() -> SystemStats:
+        # 来自后台采样器的内存缓冲区，不查询数据库
+        return SystemStats.model_validate(system_metrics_sampler.latest(), from_attributes=True)
+
+    @staticmethod
+    def get_system_stats_history(limit: Optional[int] = None) -> List[SystemStats]:
+        return [
+            SystemStats.model_validate(sample, from_attributes=True)
+            for sample in system_metrics_sampler.history(limit)
+        ]
 
     async def get_monitoring_stats(self) -> MonitoringStats:
         task_stats = await self.get_task_execution_stats()
@@ -0,0 +1,254 @@
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Mapping, Optional
+import asyncio
+import logging
+import re
+import time
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 当前调用方（通常为用户ID），同一限流器下按调用方轮流放行
+rate_limit_key: ContextVar[str] = ContextVar("rate_limit_key", default="anonymous")
+
+
+class RateLimitError(ValueError):
+    """上游返回 429，retry_after 为建议的等待秒数"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """解析 "1s"、"6m0s"、"20ms" 或纯数字形式的时长，返回秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+@dataclass
+class Reservation:
+    """一次放行占用的额度，响应返回后按实际用量结算"""
+    tokens: int
+
+
+class AdaptiveRateLimiter:
+    """同时按每分钟请求数（RPM）和每分钟 token 数（TPM）限流的令牌桶
+
+    - 额度不足时调用方排队，不同调用方之间轮流放行，单个用户的突发请求不会饿死其他用户；
+    - 请求前按估算的 token 数预占额度，响应后按 usage 中的实际用量多退少补；
+    - 根据上游返回的 x-ratelimit-* 头校准剩余额度；收到 429 时按 Retry-After 暂停放行，
+      并将放行速率减半，之后每次成功请求逐步恢复。
+    rpm 或 tpm 为 0 表示不限制该维度。
+    """
+
+    MIN_RATE_FACTOR = 0.1
+    RECOVERY_STEP = 0.05
+
+    def __init__(self, rpm: int, tpm: int, clock: Callable[[], float] = time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.clock = clock
+        self.rate_factor = 1.0
+        self.blocked_until = 0.0
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated_at = clock()
+        self._waiters: "OrderedDict[str, Deque[tuple]]" = OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats: Dict[str, int] = {"granted": 0, "queued": 0, "rate_limited": 0}
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if elapsed <= 0:
+            return
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60 * self.rate_factor)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60 * self.rate_factor)
+
+    def _wait_time(self, tokens: int) -> float:
+        """当前额度下放行该请求还需等待的秒数"""
+        wait = max(0.0, self.blocked_until - self.clock())
+        if self.rpm and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / (self.rpm * self.rate_factor))
+        # 单个请求超过整个 TPM 时，额度满即放行，避免永远等待
+        tokens = min(tokens, self.tpm)
+        if self.tpm and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / (self.tpm * self.rate_factor))
+        return wait
+
+    def _take(self, tokens: int) -> Reservation:
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= tokens
+        self.stats["granted"] += 1
+        return Reservation(tokens=tokens)
+
+    async def acquire(self, tokens: int = 0, key: Optional[str] = None) -> Reservation:
+        """等待额度并预占 tokens 个 token"""
+        if not self.rpm and not self.tpm:
+            return Reservation(tokens=0)
+        key = key or rate_limit_key.get()
+        self._refill()
+        if not self._waiters and self._wait_time(tokens) == 0:
+            return self._take(tokens)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append((tokens, future))
+        self.stats["queued"] += 1
+        self._ensure_dispatcher()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._discard(key, future)
+            raise
+
+    def _discard(self, key: str, future: asyncio.Future):
+        queue = self._waiters.get(key)
+        if queue is None:
+            return
+        for item in list(queue):
+            if item[1] is future:
+                queue.remove(item)
+        if not queue:
+            self._waiters.pop(key, None)
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        else:
+            self._wakeup.set()
+
+    async def _dispatch(self):
+        """按调用方轮流放行排队的请求"""
+        while self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            tokens, future = queue[0]
+            if future.done():
+                queue.popleft()
+            else:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait > 0:
+                    self._wakeup.clear()
+                    try:
+                        # 额度变化（如响应头校准、退还额度）时提前唤醒
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                queue.popleft()
+                future.set_result(self._take(tokens))
+            # 当前调用方移到队尾，下一个调用方先放行
+            self._waiters.move_to_end(key)
+            if not queue:
+                self._waiters.pop(key, None)
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def record_usage(self, reservation: Reservation, used_tokens: Optional[int], succeeded: bool = True):
+        """按实际用量结算预占的 token（None 表示按预估用量），并唤醒排队的调用方
+
+        请求失败时同样需要结算，used_tokens 为 0 表示退还全部预占额度；只有成功的请求才逐步恢复放行速率。
+        """
+        if used_tokens is not None and self.tpm:
+            self._refill()
+            self._tokens = min(self.tpm, self._tokens + reservation.tokens - used_tokens)
+        if succeeded and self.rate_factor < 1.0:
+            self.rate_factor = min(1.0, self.rate_factor + self.RECOVERY_STEP)
+        self._notify()
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """根据上游的 x-ratelimit-* 响应头校准限额和剩余额度"""
+        self._refill()
+        limit_requests = headers.get("x-ratelimit-limit-requests")
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        try:
+            if limit_requests and self.rpm:
+                self.rpm = int(limit_requests)
+            if limit_tokens and self.tpm:
+                self.tpm = int(limit_tokens)
+            if remaining_requests is not None and self.rpm:
+                self._requests = min(self._requests, float(remaining_requests))
+            if remaining_tokens is not None and self.tpm:
+                self._tokens = min(self._tokens, float(remaining_tokens))
+        except ValueError:
+            logger.debug(f"Ignoring malformed rate limit headers: {dict(headers)}")
+        self._notify()
+
+    def on_rate_limited(self, retry_after: Optional[float]):
+        """收到 429：暂停放行直到 Retry-After，并将放行速率减半"""
+        delay = retry_after if retry_after is not None else settings.LLM_RATE_LIMIT_DEFAULT_BACKOFF
+        self.blocked_until = max(self.blocked_until, self.clock() + delay)
+        self.rate_factor = max(self.MIN_RATE_FACTOR, self.rate_factor / 2)
+        self.stats["rate_limited"] += 1
+        logger.warning(f"Rate limited by upstream, pausing for {delay:.1f}s (rate factor {self.rate_factor:.2f})")
+
+
+def retry_after_from_headers(headers: Mapping[str, str]) -> Optional[float]:
+    """从 429 响应头中读取建议的等待时间"""
+    for name in ("retry-after-ms", "retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        value = headers.get(name)
+        if not value:
+            continue
+        if name == "retry-after-ms":
+            try:
+                return float(value) / 1000
+            except ValueError:
+                continue
+        seconds = parse_duration(value)
+        if seconds is not None:
+            return seconds
+    return None
+
+
+def estimate_tokens(data: Mapping[str, Any]) -> int:
+    """粗略估算请求消耗的 token 数（约 4 个字符一个 token，加上输出上限）"""
+    chars = 0
+    for message in data.get("messages", []):
+        chars += len(str(message.get("content", "")))
+    request_input = data.get("input")
+    if isinstance(request_input, list):
+        chars += sum(len(str(text)) for text in request_input)
+    elif request_input:
+        chars += len(str(request_input))
+    return chars // 4 + 1 + int(data.get("max_tokens") or 0)
+
+
+# 上游的 RPM/TPM 按模型分别计算，每个模型使用独立的限流器，互不影响额度、校准和 429 降速
+llm_rate_limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+
+def get_llm_rate_limiter(model: str) -> AdaptiveRateLimiter:
+    """返回模型对应的限流器，首次使用时按默认限额创建，之后由该模型的响应头校准"""
+    limiter = llm_rate_limiters.get(model)
+    if limiter is None:
+        limiter = AdaptiveRateLimiter(settings.LLM_RATE_LIMIT_RPM, settings.LLM_RATE_LIMIT_TPM)
+        llm_rate_limiters[model] = limiter
+    return limiter
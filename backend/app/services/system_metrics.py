@@ -0,0 +1,198 @@
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import shutil
+import time
+from ..core.config import settings
+from ..core.database import engine
+from ..core.metrics import (
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_OVERFLOW,
+    EVENT_LOOP_LAG,
+    EXECUTIONS_IN_PROGRESS,
+    PROCESS_CPU,
+    PROCESS_OPEN_FDS,
+    PROCESS_RSS,
+)
+
+logger = logging.getLogger(__name__)
+
+_PROCESS_STARTED = time.monotonic()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# 本进程内正在运行的工作流执行数
+_inflight_executions = 0
+
+
+@contextmanager
+def track_execution():
+    """在执行期间计入进行中的执行数"""
+    global _inflight_executions
+    _inflight_executions += 1
+    EXECUTIONS_IN_PROGRESS.inc()
+    try:
+        yield
+    finally:
+        _inflight_executions -= 1
+        EXECUTIONS_IN_PROGRESS.dec()
+
+
+def inflight_executions() -> int:
+    return _inflight_executions
+
+
+@dataclass(frozen=True)
+class SystemSample:
+    """一次采样，CPU 使用率为两次采样间本进程占用单核的百分比"""
+    sampled_at: datetime
+    uptime: float
+    cpu_usage: float
+    memory_usage: Optional[float]
+    rss_bytes: Optional[int]
+    open_fds: Optional[int]
+    disk_usage: Optional[float]
+    event_loop_lag: float
+    db_pool_size: Optional[int]
+    db_pool_checked_out: Optional[int]
+    db_pool_overflow: Optional[int]
+    inflight_executions: int
+
+
+def _read_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _read_mem_total() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _count_open_fds() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def _disk_usage(path: str = "/") -> Optional[float]:
+    try:
+        usage = shutil.disk_usage(path)
+    except OSError:
+        return None
+    return usage.used / usage.total * 100 if usage.total else None
+
+
+def _pool_stats() -> Dict[str, Optional[int]]:
+    """连接池状态，只读取池对象的计数器，不建立连接"""
+    pool = engine.sync_engine.pool
+    try:
+        return {
+            "db_pool_size": pool.size(),
+            "db_pool_checked_out": pool.checkedout(),
+            "db_pool_overflow": max(pool.overflow(), 0),
+        }
+    except AttributeError:
+        # NullPool 等没有计数器的连接池
+        return {"db_pool_size": None, "db_pool_checked_out": None, "db_pool_overflow": None}
+
+
+class SystemMetricsSampler:
+    """后台定期采样本进程的资源使用，最近的样本保存在固定长度的环形缓冲区中
+
+    采样只读取 /proc 和进程内的计数器，读取样本不访问数据库。
+    事件循环延迟为采样协程实际醒来时间比预期晚的秒数。
+    """
+
+    def __init__(self, interval: float = None, size: int = None):
+        self.interval = interval or settings.SYSTEM_METRICS_INTERVAL
+        self.samples: "deque[SystemSample]" = deque(maxlen=size or settings.SYSTEM_METRICS_BUFFER_SIZE)
+        self._mem_total = _read_mem_total()
+        self._last_cpu = time.process_time()
+        self._last_wall = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self, event_loop_lag: float = 0.0) -> SystemSample:
+        """立即采样一次并放入缓冲区"""
+        cpu, wall = time.process_time(), time.monotonic()
+        elapsed = wall - self._last_wall
+        cpu_usage = (cpu - self._last_cpu) / elapsed * 100 if elapsed > 0 else 0.0
+        self._last_cpu, self._last_wall = cpu, wall
+
+        rss = _read_rss()
+        sample = SystemSample(
+            sampled_at=datetime.now(timezone.utc),
+            uptime=wall - _PROCESS_STARTED,
+            cpu_usage=cpu_usage,
+            memory_usage=rss / self._mem_total * 100 if rss is not None and self._mem_total else None,
+            rss_bytes=rss,
+            open_fds=_count_open_fds(),
+            disk_usage=_disk_usage(),
+            event_loop_lag=event_loop_lag,
+            inflight_executions=inflight_executions(),
+            **_pool_stats()
+        )
+        self.samples.append(sample)
+        self._export(sample)
+        return sample
+
+    @staticmethod
+    def _export(sample: SystemSample):
+        PROCESS_CPU.set(sample.cpu_usage)
+        EVENT_LOOP_LAG.set(sample.event_loop_lag)
+        for gauge, value in (
+            (PROCESS_RSS, sample.rss_bytes),
+            (PROCESS_OPEN_FDS, sample.open_fds),
+            (DB_POOL_CHECKED_OUT, sample.db_pool_checked_out),
+            (DB_POOL_OVERFLOW, sample.db_pool_overflow),
+        ):
+            if value is not None:
+                gauge.set(value)
+
+    def latest(self) -> SystemSample:
+        """最近一次样本，尚未采样时立即采样"""
+        return self.samples[-1] if self.samples else self.sample()
+
+    def history(self, limit: Optional[int] = None) -> List[SystemSample]:
+        samples = list(self.samples)
+        return samples[-limit:] if limit else samples
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - expected, 0.0)
+            if lag > settings.SYSTEM_METRICS_LAG_WARNING:
+                logger.warning(f"Event loop lagged {lag:.3f}s behind schedule")
+            try:
+                # 读取 /proc 很快，直接在事件循环中执行
+                self.sample(lag)
+            except Exception as e:
+                logger.warning(f"Failed to sample system metrics: {str(e)}")
+
+
+system_metrics_sampler = SystemMetricsSampler()
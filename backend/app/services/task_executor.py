@@ -1,36 +1,120 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Awaitable, Callable, List, Mapping, Optional, Sequence
 from datetime import datetime, timedelta
 import asyncio
 import logging
-from sqlalchemy.orm import Session
+import random
+import time
+from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.workflow_task import WorkflowTask, TaskStatus
-from ..models.task_log import TaskLog
-from ..schemas.task_log import TaskLogCreate
+from ..models.task_log import TaskLogStatus
+from ..core.config import settings
+from ..core.metrics import TASK_DURATION, TASK_RETRIES, TASKS_IN_PROGRESS
+from .task_log_sink import TaskLogSink
 
 logger = logging.getLogger(__name__)
 
+
+class PartialBatchError(Exception):
+    """批量执行中部分输入失败：results 为已成功输入的 {位置: 结果}，error 为首个失败的异常"""
+
+    def __init__(self, results: Dict[int, Any], error: BaseException):
+        super().__init__(str(error))
+        self.results = results
+        self.error = error
+        self.retry_after = getattr(error, "retry_after", None)
+
+
 class TaskExecutor:
+    """任务执行器基类
+
+    每个执行器绑定一个任务独占的 AsyncSession（由调用方按任务创建和关闭），
+    所有数据库读取都通过 await 完成；日志和状态变更经 log_sink 写入，不占用该会话。
+    """
+
     def __init__(
         self,
-        db: Session,
+        db: AsyncSession,
+        log_sink: Optional[TaskLogSink] = None,
         max_retries: int = 3,
         retry_delay: int = 5,
         timeout: int = 300
     ):
         self.db = db
+        # 日志和状态变更写入缓冲区，由 sink 批量刷新；单独使用执行器时每条记录立即写入
+        self.log_sink = log_sink or TaskLogSink(max_batch_size=1)
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         self.timeout = timeout
+        self.execution_id: Optional[UUID] = None
+
+    @classmethod
+    def validate_config(cls, config: Mapping[str, Any]) -> Dict[str, Any]:
+        """校验任务配置并返回规范化后的配置，编译执行计划时调用一次"""
+        return dict(config or {})
 
     async def execute_task(
         self,
         task: WorkflowTask,
         input_data: Dict[str, Any],
-        execution_id: int
+        execution_id: UUID
     ) -> Dict[str, Any]:
         """执行任务，包含重试和超时机制"""
+        return await self._run_with_retries(
+            task, execution_id, lambda: self._execute_task_internal(task, input_data)
+        )
+
+    async def execute_batch(
+        self,
+        task: WorkflowTask,
+        inputs: List[Dict[str, Any]],
+        execution_id: UUID
+    ) -> List[Dict[str, Any]]:
+        """以同一任务处理一批输入，整批只记录一次日志；重试时只重新执行尚未成功的输入"""
+        completed: Dict[int, Any] = {}
+
+        async def run() -> List[Dict[str, Any]]:
+            pending = [index for index in range(len(inputs)) if index not in completed]
+            try:
+                results = await self._execute_batch_internal(task, [inputs[index] for index in pending])
+            except PartialBatchError as e:
+                completed.update((pending[position], result) for position, result in e.results.items())
+                raise e.error
+            completed.update(zip(pending, results))
+            return [completed[index] for index in range(len(inputs))]
+
+        return await self._run_with_retries(task, execution_id, run)
+
+    async def _run_with_retries(
+        self,
+        task: WorkflowTask,
+        execution_id: UUID,
+        run: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        task_type = task.type.value if task.type else "unknown"
+        started = time.perf_counter()
+        status = TaskStatus.FAILED
+        TASKS_IN_PROGRESS.inc(1, task_type)
+        try:
+            result = await self._run_attempts(task, task_type, execution_id, run)
+            status = TaskStatus.COMPLETED
+            return result
+        finally:
+            TASKS_IN_PROGRESS.dec(1, task_type)
+            TASK_DURATION.observe(time.perf_counter() - started, task_type, status.value)
+
+    async def _run_attempts(
+        self,
+        task: WorkflowTask,
+        task_type: str,
+        execution_id: UUID,
+        run: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        self.execution_id = execution_id
         retry_count = 0
         last_error = None
+        retry_after = None
 
         while retry_count <= self.max_retries:
             try:
@@ -40,18 +124,22 @@ class TaskExecutor:
                 # 设置超时
                 async with asyncio.timeout(self.timeout):
                     # 更新任务状态
-                    task.status = TaskStatus.RUNNING
-                    task.started_at = datetime.utcnow()
-                    self.db.commit()
+                    self._update_task(
+                        task,
+                        status=TaskStatus.RUNNING,
+                        started_at=datetime.utcnow()
+                    )
 
                     # 执行任务
-                    result = await self._execute_task_internal(task, input_data)
+                    result = await run()
 
                     # 更新任务状态
-                    task.status = TaskStatus.COMPLETED
-                    task.completed_at = datetime.utcnow()
-                    task.result = result
-                    self.db.commit()
+                    self._update_task(
+                        task,
+                        status=TaskStatus.COMPLETED,
+                        completed_at=datetime.utcnow(),
+                        result=result
+                    )
 
                     # 记录任务完成
                     self._log_task_complete(task, execution_id, result)
@@ -67,21 +155,27 @@ class TaskExecutor:
                 error_msg = str(e)
                 logger.error(f"Task {task.id} failed: {error_msg}")
                 last_error = error_msg
+                retry_after = getattr(e, "retry_after", None)
                 self._log_task_error(task, execution_id, error_msg)
 
             # 重试逻辑
             if retry_count < self.max_retries:
                 retry_count += 1
-                logger.info(f"Retrying task {task.id} (attempt {retry_count}/{self.max_retries})")
-                await asyncio.sleep(self.retry_delay)
+                TASK_RETRIES.inc(1, task_type)
+                delay = self._retry_delay(retry_count, retry_after)
+                logger.info(f"Retrying task {task.id} in {delay:.1f}s (attempt {retry_count}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                retry_after = None
             else:
                 break
 
         # 所有重试都失败
-        task.status = TaskStatus.FAILED
-        task.error_message = last_error
-        task.completed_at = datetime.utcnow()
-        self.db.commit()
+        self._update_task(
+            task,
+            status=TaskStatus.FAILED,
+            error_message=last_error[:500],
+            completed_at=datetime.utcnow()
+        )
         raise Exception(f"Task {task.id} failed after {self.max_retries} retries: {last_error}")
 
     async def _execute_task_internal(
@@ -94,47 +188,105 @@ class TaskExecutor:
         # 例如：LLM任务、API任务等
         raise NotImplementedError("Task execution not implemented")
 
-    def _log_task_start(self, task: WorkflowTask, execution_id: int):
+    async def _execute_batch_internal(
+        self,
+        task: WorkflowTask,
+        inputs: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """批量执行的具体实现，默认逐条执行；能一次处理整批输入的执行器应覆盖此方法
+
+        部分输入失败时抛出 PartialBatchError 带回已成功的结果，重试时跳过这些输入。
+        """
+        results: Dict[int, Any] = {}
+        for position, input_data in enumerate(inputs):
+            try:
+                results[position] = await self._execute_task_internal(task, input_data)
+            except Exception as e:
+                raise PartialBatchError(results, e) from e
+        return [results[position] for position in range(len(inputs))]
+
+    async def _execute_concurrently(
+        self,
+        task: WorkflowTask,
+        inputs: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """并发执行各输入，任一失败时取消其余未完成的调用，已完成的结果随 PartialBatchError 带回"""
+        results: Dict[int, Any] = {}
+
+        async def run_one(position: int, input_data: Dict[str, Any]):
+            results[position] = await self._execute_task_internal(task, input_data)
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for position, input_data in enumerate(inputs):
+                    group.create_task(run_one(position, input_data))
+        except ExceptionGroup as e:
+            raise PartialBatchError(results, e.exceptions[0]) from e
+        return [results[position] for position in range(len(inputs))]
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """重试等待时间：上游给出 Retry-After 时按其等待，否则指数退避并加随机抖动，避免重试同时涌向上游"""
+        if retry_after is not None:
+            return min(retry_after, settings.TASK_RETRY_MAX_DELAY)
+        delay = min(self.retry_delay * 2 ** (attempt - 1), settings.TASK_RETRY_MAX_DELAY)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _get_task(self, task_id: UUID) -> WorkflowTask:
+        """按ID加载任务"""
+        task = await self.db.get(WorkflowTask, UUID(str(task_id)))
+        if not task:
+            raise ValueError(f"Task {task_id} not found")
+        return task
+
+    async def _get_tasks(self, task_ids: Sequence[UUID]) -> List[WorkflowTask]:
+        """一次查询加载多个任务，按 task_ids 的顺序返回"""
+        task_ids = [UUID(str(task_id)) for task_id in task_ids]
+        result = await self.db.execute(select(WorkflowTask).where(WorkflowTask.id.in_(task_ids)))
+        tasks = {task.id: task for task in result.scalars()}
+        missing = [str(task_id) for task_id in task_ids if task_id not in tasks]
+        if missing:
+            raise ValueError(f"Tasks not found: {', '.join(missing)}")
+        return [tasks[task_id] for task_id in task_ids]
+
+    def _update_task(self, task: WorkflowTask, **values):
+        """缓冲任务状态字段更新，task 可以是 ORM 对象或只读的 TaskNode"""
+        self.log_sink.update_task(task.id, **values)
+
+    def _log_task_start(self, task: WorkflowTask, execution_id: UUID):
         """记录任务开始"""
-        log = TaskLog(
+        self.log_sink.add_log(
             task_id=task.id,
             execution_id=execution_id,
-            status=TaskStatus.RUNNING,
-            message="Task started"
+            status=TaskLogStatus.RUNNING,
+            started_at=datetime.utcnow()
         )
-        self.db.add(log)
-        self.db.commit()
 
     def _log_task_complete(
         self,
         task: WorkflowTask,
-        execution_id: int,
+        execution_id: UUID,
         result: Dict[str, Any]
     ):
         """记录任务完成"""
-        log = TaskLog(
+        self.log_sink.add_log(
             task_id=task.id,
             execution_id=execution_id,
-            status=TaskStatus.COMPLETED,
-            message="Task completed successfully",
-            result=result
+            status=TaskLogStatus.COMPLETED,
+            result=result,
+            completed_at=datetime.utcnow()
         )
-        self.db.add(log)
-        self.db.commit()
 
     def _log_task_error(
         self,
         task: WorkflowTask,
-        execution_id: int,
+        execution_id: UUID,
         error_message: str
     ):
         """记录任务错误"""
-        log = TaskLog(
+        self.log_sink.add_log(
             task_id=task.id,
             execution_id=execution_id,
-            status=TaskStatus.FAILED,
-            message=error_message,
-            error_message=error_message
+            status=TaskLogStatus.FAILED,
+            error_message=error_message[:500],
+            completed_at=datetime.utcnow()
         )
-        self.db.add(log)
-        self.db.commit() 
\ No newline at end of file
@@ -1,14 +1,40 @@
-from typing import Dict, Any
-import httpx
+from typing import Dict, Any, Callable, List, Mapping, Type
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.http_clients import get_http_client
+from .dag_scheduler import FailurePolicy, fan_out
 from .task_executor import TaskExecutor
+from .task_log_sink import TaskLogSink
 from .llm_service import LLMService
+from .rate_limiter import RateLimitError
 from ..models.workflow_task import WorkflowTask, TaskType
 
+LLM_OPERATIONS = ("completion", "embedding", "sentiment", "entities", "summary")
+
+
 class LLMTaskExecutor(TaskExecutor):
-    def __init__(self, db, llm_service: LLMService, **kwargs):
+    def __init__(self, db: AsyncSession, llm_service: LLMService, **kwargs):
         super().__init__(db, **kwargs)
         self.llm_service = llm_service
 
+    @classmethod
+    def validate_config(cls, config: Mapping[str, Any]) -> Dict[str, Any]:
+        """校验LLM任务配置并补全默认值"""
+        config = dict(config or {})
+        operation = config.get("operation")
+        if not operation:
+            raise ValueError("LLM operation is required")
+        if operation not in LLM_OPERATIONS:
+            raise ValueError(f"Unknown LLM operation: {operation}")
+        config.setdefault("model", "gpt-3.5-turbo")
+        config["temperature"] = float(config.get("temperature", 0.7))
+        config["max_tokens"] = int(config.get("max_tokens", 1000))
+        if operation == "summary":
+            config["max_length"] = int(config.get("max_length", 200))
+        config.setdefault("input_key", "text")
+        return config
+
     async def _execute_task_internal(self, task: WorkflowTask, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """执行LLM任务"""
         config = task.config or {}
@@ -21,9 +47,7 @@ class LLMTaskExecutor(TaskExecutor):
             raise ValueError("LLM operation is required")
         
         # 获取输入文本
-        input_text = input_data.get("text", "")
-        if not input_text:
-            raise ValueError("Input text is required")
+        input_text = self._get_input_text(config, input_data)
         
         try:
             # 根据操作类型执行不同的LLM任务
@@ -32,7 +56,9 @@ class LLMTaskExecutor(TaskExecutor):
                     prompt=input_text,
                     model=model,
                     temperature=temperature,
-                    max_tokens=max_tokens
+                    max_tokens=max_tokens,
+                    # temperature 大于 0 时默认不缓存，配置 cache: true 可强制复用相同请求的结果
+                    cache=config.get("cache")
                 )
             elif operation == "embedding":
                 result = await self.llm_service.generate_embeddings(
@@ -65,13 +91,56 @@ class LLMTaskExecutor(TaskExecutor):
                 "result": result
             }
             
+        except RateLimitError:
+            # 保留 retry_after，由重试逻辑按上游建议的时间等待
+            raise
         except Exception as e:
             raise ValueError(f"LLM task execution failed: {str(e)}")
 
+    async def _execute_batch_internal(self, task: WorkflowTask, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量执行LLM任务：嵌入合并为一次请求，其他操作并发请求，一条失败时取消其余请求"""
+        config = task.config or {}
+        operation = config.get("operation")
+        if operation != "embedding":
+            return await self._execute_concurrently(task, inputs)
+        
+        model = config.get("model", "gpt-3.5-turbo")
+        texts = [self._get_input_text(config, d) for d in inputs]
+        try:
+            embeddings = await self.llm_service.generate_embeddings_batch(texts=texts, model=model)
+        except RateLimitError:
+            # 保留 retry_after，由重试逻辑按上游建议的时间等待
+            raise
+        except Exception as e:
+            raise ValueError(f"LLM task execution failed: {str(e)}")
+        return [
+            {"operation": operation, "model": model, "result": embedding}
+            for embedding in embeddings
+        ]
+
+    @staticmethod
+    def _get_input_text(config: Mapping[str, Any], input_data: Dict[str, Any]) -> str:
+        """按配置的 input_key 取输入文本，循环体可设为 "item" 直接处理循环项"""
+        input_text = input_data.get(config.get("input_key", "text"), "")
+        if not input_text:
+            raise ValueError("Input text is required")
+        return str(input_text)
+
 class APITaskExecutor(TaskExecutor):
-    def __init__(self, db, **kwargs):
+    def __init__(self, db: AsyncSession, **kwargs):
         super().__init__(db, **kwargs)
-        self.http_client = httpx.AsyncClient()
+        self.http_client = get_http_client()
+
+    @classmethod
+    def validate_config(cls, config: Mapping[str, Any]) -> Dict[str, Any]:
+        """校验API任务配置并补全默认值"""
+        config = dict(config or {})
+        if not config.get("url"):
+            raise ValueError("API URL is required")
+        config["method"] = str(config.get("method", "GET")).upper()
+        config.setdefault("headers", {})
+        config.setdefault("body", {})
+        return config
 
     async def _execute_task_internal(self, task: WorkflowTask, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """执行API任务"""
@@ -97,6 +166,19 @@ class APITaskExecutor(TaskExecutor):
             raise ValueError(f"API request failed: {str(e)}")
 
 class ConditionTaskExecutor(TaskExecutor):
+    @classmethod
+    def validate_config(cls, config: Mapping[str, Any]) -> Dict[str, Any]:
+        """校验条件任务配置，提前检查表达式语法"""
+        config = dict(config or {})
+        condition = config.get("condition")
+        if not condition:
+            raise ValueError("Condition is required")
+        try:
+            compile(condition, "<condition>", "eval")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid condition expression: {str(e)}")
+        return config
+
     async def _execute_task_internal(self, task: WorkflowTask, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """执行条件任务"""
         config = task.config or {}
@@ -119,72 +201,176 @@ class ConditionTaskExecutor(TaskExecutor):
             "branch": true_branch if result else false_branch
         }
 
-class LoopTaskExecutor(TaskExecutor):
+class CompositeTaskExecutor(TaskExecutor):
+    """编排其他任务的执行器基类，子任务由各自类型的执行器执行"""
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        llm_service: LLMService = None,
+        session_factory: Callable = AsyncSessionLocal,
+        **kwargs
+    ):
+        super().__init__(db, **kwargs)
+        self.llm_service = llm_service
+        self.session_factory = session_factory
+
+    def _create_child_executor(self, task: WorkflowTask, db: AsyncSession = None) -> TaskExecutor:
+        """为子任务创建执行器，共享本次执行的日志缓冲"""
+        return get_task_executor(task.type, db or self.db, self.llm_service, self.log_sink)
+
+class LoopTaskExecutor(CompositeTaskExecutor):
+    @classmethod
+    def validate_config(cls, config: Mapping[str, Any]) -> Dict[str, Any]:
+        """校验循环任务配置并补全分块大小和并发上限"""
+        config = dict(config or {})
+        if not config.get("loop_task_id"):
+            raise ValueError("Loop task ID is required")
+        if not isinstance(config.get("items", []), list):
+            raise ValueError("Loop items must be a list")
+        config.setdefault("items", [])
+        config["batch_size"] = int(config.get("batch_size", settings.LOOP_BATCH_SIZE))
+        config["max_concurrency"] = int(config.get("max_concurrency", settings.PARALLEL_MAX_CONCURRENCY))
+        if config["batch_size"] < 1 or config["max_concurrency"] < 1:
+            raise ValueError("batch_size and max_concurrency must be at least 1")
+        return config
+
     async def _execute_task_internal(self, task: WorkflowTask, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """执行循环任务"""
+        """执行循环任务：循环体只加载一次，循环项分块后并发执行"""
         config = task.config or {}
         items = config.get("items", [])
         loop_task_id = config.get("loop_task_id")
+        batch_size = config.get("batch_size", settings.LOOP_BATCH_SIZE)
+        max_concurrency = config.get("max_concurrency", settings.PARALLEL_MAX_CONCURRENCY)
         
         if not loop_task_id:
             raise ValueError("Loop task ID is required")
         
-        results = []
-        for item in items:
-            # 获取循环任务
-            loop_task = self.db.query(WorkflowTask).filter(WorkflowTask.id == loop_task_id).first()
-            if not loop_task:
-                raise ValueError(f"Loop task {loop_task_id} not found")
-            
-            # 执行循环任务
-            result = await self.execute_task(loop_task, {**input_data, "item": item}, task.execution_id)
-            results.append(result)
+        # 获取循环任务
+        loop_task = await self._get_task(loop_task_id)
+        chunks = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
         
+        def branch(chunk: List[Any]):
+            async def run():
+                # 每个分块使用独立的会话，整块交给循环体执行器批量处理
+                async with self.session_factory() as session:
+                    executor = self._create_child_executor(loop_task, session)
+                    return await executor.execute_batch(
+                        loop_task,
+                        [{**input_data, "item": item} for item in chunk],
+                        self.execution_id
+                    )
+            return run
+        
+        try:
+            chunk_results = await fan_out(
+                {index: branch(chunk) for index, chunk in enumerate(chunks)},
+                max_concurrency=max_concurrency,
+                failure_policy=FailurePolicy.FAIL_FAST
+            )
+        except Exception as e:
+            raise ValueError(f"Loop chunk failed: {str(e)}")
+        
+        results = [result for index in range(len(chunks)) for result in chunk_results[index]]
         return {"results": results}
 
-class ParallelTaskExecutor(TaskExecutor):
+class ParallelTaskExecutor(CompositeTaskExecutor):
+    @classmethod
+    def validate_config(cls, config: Mapping[str, Any]) -> Dict[str, Any]:
+        """校验并行任务配置并补全并发上限和失败策略"""
+        config = dict(config or {})
+        if not config.get("task_ids"):
+            raise ValueError("Task IDs are required")
+        max_concurrency = int(config.get("max_concurrency", settings.PARALLEL_MAX_CONCURRENCY))
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        config["max_concurrency"] = max_concurrency
+        try:
+            config["failure_policy"] = FailurePolicy(config.get("failure_policy", FailurePolicy.COLLECT_ALL)).value
+        except ValueError:
+            raise ValueError(f"Unknown failure policy: {config.get('failure_policy')}")
+        return config
+
     async def _execute_task_internal(self, task: WorkflowTask, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """执行并行任务"""
+        """执行并行任务，每个分支使用独立的会话和执行器"""
         config = task.config or {}
         task_ids = config.get("task_ids", [])
+        max_concurrency = config.get("max_concurrency", settings.PARALLEL_MAX_CONCURRENCY)
+        failure_policy = FailurePolicy(config.get("failure_policy", FailurePolicy.COLLECT_ALL))
         
         if not task_ids:
             raise ValueError("Task IDs are required")
         
-        # 获取所有任务
-        tasks = self.db.query(WorkflowTask).filter(WorkflowTask.id.in_(task_ids)).all()
-        if len(tasks) != len(task_ids):
-            raise ValueError("Some tasks not found")
+        # 一次查询获取所有任务
+        tasks = await self._get_tasks(task_ids)
         
-        # 并行执行任务
-        results = await asyncio.gather(
-            *[self.execute_task(t, input_data, task.execution_id) for t in tasks],
-            return_exceptions=True
-        )
+        def branch(child: WorkflowTask):
+            async def run():
+                # AsyncSession 不支持并发操作，每个分支使用独立的会话
+                async with self.session_factory() as session:
+                    executor = self._create_child_executor(child, session)
+                    return await executor.execute_task(child, input_data, self.execution_id)
+            return run
+        
+        try:
+            results = await fan_out(
+                {str(child.id): branch(child) for child in tasks},
+                max_concurrency=max_concurrency,
+                failure_policy=failure_policy
+            )
+        except Exception as e:
+            raise ValueError(f"Parallel branch failed: {str(e)}")
         
         # 处理结果
         task_results = {}
-        for task_id, result in zip(task_ids, results):
+        failed = []
+        for task_id, result in results.items():
             if isinstance(result, Exception):
                 task_results[task_id] = {"error": str(result)}
+                failed.append(task_id)
             else:
                 task_results[task_id] = result
         
-        return {"results": task_results}
+        return {"results": task_results, "failed": failed}
 
-def get_task_executor(task_type: TaskType, db, llm_service: LLMService = None) -> TaskExecutor:
-    """获取任务执行器"""
-    if task_type == TaskType.LLM:
+TASK_EXECUTORS: Dict[TaskType, Type[TaskExecutor]] = {
+    TaskType.LLM: LLMTaskExecutor,
+    TaskType.API: APITaskExecutor,
+    TaskType.CONDITION: ConditionTaskExecutor,
+    TaskType.LOOP: LoopTaskExecutor,
+    TaskType.PARALLEL: ParallelTaskExecutor,
+}
+
+
+def get_task_executor_class(task_type: TaskType) -> Type[TaskExecutor]:
+    """获取任务类型对应的执行器类"""
+    executor_class = TASK_EXECUTORS.get(task_type)
+    if executor_class is None:
+        raise ValueError(f"Unknown task type: {task_type}")
+    return executor_class
+
+
+def create_task_executor(
+    executor_class: Type[TaskExecutor],
+    db: AsyncSession,
+    llm_service: LLMService = None,
+    log_sink: TaskLogSink = None
+) -> TaskExecutor:
+    """实例化任务执行器"""
+    if issubclass(executor_class, LLMTaskExecutor):
         if not llm_service:
             raise ValueError("LLM service is required for LLM tasks")
-        return LLMTaskExecutor(db, llm_service)
-    elif task_type == TaskType.API:
-        return APITaskExecutor(db)
-    elif task_type == TaskType.CONDITION:
-        return ConditionTaskExecutor(db)
-    elif task_type == TaskType.LOOP:
-        return LoopTaskExecutor(db)
-    elif task_type == TaskType.PARALLEL:
-        return ParallelTaskExecutor(db)
-    else:
-        raise ValueError(f"Unknown task type: {task_type}") 
\ No newline at end of file
+        return executor_class(db, llm_service, log_sink=log_sink)
+    if issubclass(executor_class, CompositeTaskExecutor):
+        return executor_class(db, llm_service, log_sink=log_sink)
+    return executor_class(db, log_sink=log_sink)
+
+
+def get_task_executor(
+    task_type: TaskType,
+    db: AsyncSession,
+    llm_service: LLMService = None,
+    log_sink: TaskLogSink = None
+) -> TaskExecutor:
+    """获取任务执行器"""
+    return create_task_executor(get_task_executor_class(task_type), db, llm_service, log_sink)
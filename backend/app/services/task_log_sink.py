@@ -0,0 +1,120 @@
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+import asyncio
+import logging
+from sqlalchemy import insert, update
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.task_log import TaskLog
+from ..models.workflow_task import WorkflowTask
+
+logger = logging.getLogger(__name__)
+
+
+class TaskLogSink:
+    """缓冲 TaskLog 写入和任务状态变更，批量刷新到数据库
+
+    缓冲条数达到 max_batch_size 或距第一条未刷新记录超过 flush_interval 秒时刷新；
+    同一任务的多次状态变更合并为一次 UPDATE。执行结束时必须调用 close 强制刷新。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = AsyncSessionLocal,
+        max_batch_size: int = None,
+        flush_interval: float = None,
+        on_log: Optional[Callable[[Dict[str, Any]], None]] = None
+    ):
+        self.session_factory = session_factory
+        # 每条日志缓冲时同步回调，用于流式推送任务进度
+        self.on_log = on_log
+        self.max_batch_size = max_batch_size or settings.TASK_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else settings.TASK_LOG_FLUSH_INTERVAL
+        self._logs: List[Dict[str, Any]] = []
+        self._task_updates: Dict[UUID, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._background: set = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._logs) + len(self._task_updates)
+
+    def add_log(self, **values):
+        """缓冲一条 TaskLog 记录"""
+        self._logs.append(values)
+        self._schedule()
+        if self.on_log:
+            try:
+                self.on_log(values)
+            except Exception as e:
+                logger.warning(f"Task log listener failed: {str(e)}")
+
+    def update_task(self, task_id: UUID, **values):
+        """缓冲任务状态字段更新，同一任务的后续更新覆盖之前的同名字段"""
+        self._task_updates.setdefault(task_id, {}).update(values)
+        self._schedule()
+
+    def _schedule(self):
+        if self.pending >= self.max_batch_size:
+            self._spawn(self._flush_later(0))
+        elif self._timer is None or self._timer.done():
+            self._timer = self._spawn(self._flush_later(self.flush_interval))
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush task logs: {str(e)}")
+
+    async def flush(self):
+        """将缓冲的记录写入数据库：状态变更按字段分组 executemany UPDATE，日志一条多行 INSERT"""
+        async with self._flush_lock:
+            logs, self._logs = self._logs, []
+            task_updates, self._task_updates = self._task_updates, {}
+            if not logs and not task_updates:
+                return
+
+            # 补齐字段，使所有日志行可以合并为同一条多行 INSERT
+            log_fields = set().union(*logs) if logs else set()
+            log_rows = [{field: log.get(field) for field in log_fields} for log in logs]
+
+            update_groups: Dict[tuple, List[Dict[str, Any]]] = {}
+            for task_id, values in task_updates.items():
+                update_groups.setdefault(tuple(sorted(values)), []).append({"id": task_id, **values})
+
+            try:
+                async with self.session_factory() as session:
+                    for rows in update_groups.values():
+                        await session.execute(update(WorkflowTask), rows)
+                    if log_rows:
+                        await session.execute(insert(TaskLog), log_rows)
+                    await session.commit()
+            except Exception:
+                self._restore(logs, task_updates)
+                raise
+
+    def _restore(self, logs: List[Dict[str, Any]], task_updates: Dict[UUID, Dict[str, Any]]):
+        """刷新失败时放回缓冲区，新到的更新优先"""
+        for task_id, values in task_updates.items():
+            self._task_updates[task_id] = {**values, **self._task_updates.get(task_id, {})}
+        self._logs = logs + self._logs
+        limit = self.max_batch_size * 10
+        if len(self._logs) > limit:
+            logger.warning(f"Dropping {len(self._logs) - limit} buffered task logs")
+            self._logs = self._logs[-limit:]
+
+    async def close(self):
+        """停止定时刷新并写入剩余记录"""
+        for task in list(self._background):
+            if task is self._timer:
+                task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        await self.flush()
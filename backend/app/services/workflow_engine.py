@@ -1,4 +1,4 @@
-from typing import Dict, Any, List
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ..models.workflow import Workflow
@@ -7,109 +7,223 @@ from ..models.workflow_task import WorkflowTask, TaskType, TaskStatus
 from ..schemas.workflow import WorkflowCreate, WorkflowUpdate
 from ..core.database import AsyncSessionLocal
 from ..core.config import settings
-from .llm_service import LLMService
-from .task_executors import get_task_executor
+from .llm_service import get_llm_service
+from .rate_limiter import rate_limit_key
+from .dag_scheduler import DAGScheduler
+from .workflow_graph import load_workflow_graph
+from .task_log_sink import TaskLogSink
+from ..models.task_log import TaskLogStatus
+from .workflow_plan import CompiledPlan, compile_plan, get_workflow_version, workflow_plan_cache
+from .metrics_rollup import TaskSample, record_execution
+from .system_metrics import track_execution
 import asyncio
 import json
+import time
 from datetime import datetime
 import logging
 from uuid import UUID
 
+logger = logging.getLogger(__name__)
+
+# 事件回调：(事件名, 事件数据)，用于向客户端流式推送执行进度
+EventListener = Callable[[str, Dict[str, Any]], None]
+
+# 流式执行的后台任务，保持引用直到执行结束
+_background_runs: set = set()
+
 
 class WorkflowEngine:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, on_event: Optional[EventListener] = None):
         self.db = db
-        self.llm_service = LLMService()
+        self.llm_service = get_llm_service()
+        self.on_event = on_event
     
-    async def execute_workflow(self, workflow_id: UUID, user_id: UUID, input_data: Dict[str, Any] = None) -> WorkflowExecution:
-        """执行工作流"""
-        # 创建工作流执行记录
+    async def create_execution(
+        self,
+        workflow_id: UUID,
+        user_id: UUID,
+        input_data: Dict[str, Any] = None
+    ) -> WorkflowExecution:
+        """创建待执行的工作流执行记录"""
         execution = WorkflowExecution(
             workflow_id=workflow_id,
             user_id=user_id,
-            status=ExecutionStatus.RUNNING,
-            started_at=datetime.utcnow()
+            status=ExecutionStatus.PENDING,
+            input_data=input_data
         )
         self.db.add(execution)
         await self.db.commit()
         await self.db.refresh(execution)
+        return execution
+    
+    async def run_execution(self, execution_id: UUID) -> WorkflowExecution:
+        """执行已创建的工作流执行记录
+
+        队列至少投递一次，同一执行可能被重复领取：已结束的执行直接返回，
+        运行中断（如 worker 崩溃）的执行会从头重新运行。
+        """
+        execution = await self.db.get(WorkflowExecution, execution_id)
+        if not execution:
+            raise ValueError(f"Execution {execution_id} not found")
+        if execution.status in (ExecutionStatus.COMPLETED, ExecutionStatus.FAILED):
+            return execution
         
-        try:
-            # 获取工作流及其任务
-            stmt = select(Workflow).where(Workflow.id == workflow_id)
-            result = await self.db.execute(stmt)
-            workflow = result.scalar_one_or_none()
-            
-            if not workflow:
-                raise ValueError("Workflow not found")
-            
-            # 获取所有任务
-            stmt = select(WorkflowTask).where(WorkflowTask.workflow_id == workflow_id)
-            result = await self.db.execute(stmt)
-            tasks = result.scalars().all()
-            
-            # 构建任务依赖图
-            task_graph = self._build_task_graph(tasks)
+        # 同一用户的 LLM 请求在限流器中排在同一队列，与其他用户轮流放行
+        rate_limit_key.set(str(execution.user_id))
+        
+        execution.status = ExecutionStatus.RUNNING
+        execution.started_at = datetime.utcnow()
+        await self.db.commit()
+        self._emit("execution_started", execution_id=execution.id, workflow_id=execution.workflow_id)
+        
+        task_samples: List[TaskSample] = []
+        with track_execution():
+            try:
+                # 获取执行计划，工作流版本未变时直接复用缓存
+                plan = await self._get_plan(execution.workflow_id)
             
-            # 执行任务
-            results = await self._execute_tasks(task_graph, input_data, execution.id)
+                # 执行任务
+                results = await self._execute_tasks(plan, execution.input_data or {}, execution.id, task_samples)
             
-            # 更新执行状态
-            execution.status = ExecutionStatus.COMPLETED
-            execution.result = results
-            execution.completed_at = datetime.utcnow()
+                # 更新执行状态
+                execution.status = ExecutionStatus.COMPLETED
+                execution.result = results
+                execution.completed_at = datetime.utcnow()
             
-        except Exception as e:
-            execution.status = ExecutionStatus.FAILED
-            execution.error_message = str(e)
-            execution.completed_at = datetime.utcnow()
+            except Exception as e:
+                execution.status = ExecutionStatus.FAILED
+                execution.error_message = str(e)[:500]
+                execution.completed_at = datetime.utcnow()
         
+            await self._record_metrics(execution, task_samples)
+            await self.db.commit()
+        if execution.status == ExecutionStatus.COMPLETED:
+            self._emit("execution_completed", execution_id=execution.id, result=execution.result)
+        else:
+            self._emit("execution_failed", execution_id=execution.id, error=execution.error_message)
+        return execution
+    
+    async def execute_workflow(self, workflow_id: UUID, user_id: UUID, input_data: Dict[str, Any] = None) -> WorkflowExecution:
+        """在当前协程内同步执行工作流"""
+        execution = await self.create_execution(workflow_id, user_id, input_data)
+        return await self.run_execution(execution.id)
+    
+    async def fail_execution(self, execution: WorkflowExecution, error_message: str) -> WorkflowExecution:
+        """将未运行完的执行标记为失败，并与指标汇总在同一事务中提交"""
+        execution.status = ExecutionStatus.FAILED
+        execution.error_message = error_message[:500]
+        execution.completed_at = datetime.utcnow()
+        await self._record_metrics(execution, [])
         await self.db.commit()
         return execution
     
-    def _build_task_graph(self, tasks: List[WorkflowTask]) -> Dict[int, List[int]]:
-        """构建任务依赖图"""
-        graph = {}
-        for task in tasks:
-            graph[task.id] = [dep.dependency_id for dep in task.dependencies]
-        return graph
+    async def _record_metrics(self, execution: WorkflowExecution, task_samples: List[TaskSample]):
+        """将执行结果累加到指标汇总表，与执行状态在同一事务中提交，重复投递的执行不会重复计数
+
+        写入失败只回滚保存点，不影响执行状态的提交。
+        """
+        try:
+            async with self.db.begin_nested():
+                await record_execution(self.db, execution, task_samples)
+        except Exception as e:
+            logger.warning(f"Failed to record metrics for execution {execution.id}: {str(e)}")
+    
+    async def _get_plan(self, workflow_id: UUID) -> CompiledPlan:
+        """获取工作流的编译执行计划"""
+        version = await get_workflow_version(self.db, workflow_id)
+        plan = workflow_plan_cache.get(workflow_id, version)
+        if plan is None:
+            # 一次性加载工作流、任务及依赖关系，编译后缓存
+            graph = await load_workflow_graph(self.db, workflow_id)
+            plan = compile_plan(graph, version)
+            workflow_plan_cache.put(plan)
+        return plan
     
     async def _execute_tasks(
         self,
-        task_graph: Dict[int, List[int]],
+        plan: CompiledPlan,
         input_data: Dict[str, Any],
-        execution_id: int
+        execution_id: UUID,
+        task_samples: Optional[List[TaskSample]] = None
     ) -> Dict[str, Any]:
-        """执行任务图"""
-        results = {}
-        visited = set()
-        
-        async def execute_task(task_id: int):
-            if task_id in visited:
-                return
-            
-            # 获取任务
-            stmt = select(WorkflowTask).where(WorkflowTask.id == task_id)
-            result = await self.db.execute(stmt)
-            task = result.scalar_one_or_none()
-            
-            if not task:
-                raise ValueError(f"Task {task_id} not found")
-            
-            # 执行依赖任务
-            for dep_id in task_graph[task_id]:
-                await execute_task(dep_id)
-            
-            # 获取任务执行器
-            executor = get_task_executor(task.task_type, self.db, self.llm_service)
-            
-            # 执行任务
-            result = await executor.execute_task(task, input_data, execution_id)
-            results[task_id] = result
-            visited.add(task_id)
+        """按依赖关系并发执行任务图，每个任务的结果和耗时追加到 task_samples"""
+        graph = plan.graph
+        max_concurrency = graph.workflow_config.get("max_concurrency")
+        scheduler = DAGScheduler(max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY)
+        # 本次执行的所有任务日志和状态变更批量写入，执行结束时强制刷新
+        log_sink = TaskLogSink(on_log=self._on_task_log if self.on_event else None)
         
-        # 执行所有任务
-        for task_id in task_graph:
-            await execute_task(task_id)
+        async def execute_task(task_id: UUID):
+            task = graph.get_task(task_id)
+            # AsyncSession 不支持并发操作，每个任务使用独立的会话
+            async with AsyncSessionLocal() as session:
+                # 获取任务执行器
+                executor = plan.create_executor(task_id, session, self.llm_service, log_sink)
+                
+                # 执行任务
+                started = time.monotonic()
+                status = TaskStatus.FAILED
+                try:
+                    result = await executor.execute_task(task, input_data, execution_id)
+                    status = TaskStatus.COMPLETED
+                    return result
+                finally:
+                    if task_samples is not None:
+                        task_samples.append(TaskSample(
+                            task_type=task.type.value if task.type else None,
+                            status=status.value,
+                            duration=time.monotonic() - started
+                        ))
         
-        return results 
\ No newline at end of file
+        try:
+            results = await scheduler.run(graph.dependencies, execute_task, levels=plan.levels)
+        finally:
+            await log_sink.close()
+        return {str(task_id): result for task_id, result in results.items()}
+
+    def _emit(self, event: str, **data):
+        if self.on_event:
+            self.on_event(event, data)
+    
+    def _on_task_log(self, values: Dict[str, Any]):
+        """将任务日志转换为进度事件"""
+        status = values.get("status")
+        data = {"task_id": values.get("task_id")}
+        if status == TaskLogStatus.COMPLETED:
+            data["result"] = values.get("result")
+        elif status == TaskLogStatus.FAILED:
+            data["error"] = values.get("error_message")
+        self._emit(f"task_{status.value}", **data)
+
+
+async def stream_execution(execution_id: UUID) -> AsyncIterator[Dict[str, Any]]:
+    """在当前进程运行执行并逐个返回进度事件
+
+    执行在独立的会话和后台任务中运行，客户端断开连接不会中断执行，
+    结果仍可通过 GET /executions/{id} 查询。
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    
+    async def run():
+        try:
+            async with AsyncSessionLocal() as db:
+                engine = WorkflowEngine(
+                    db,
+                    on_event=lambda event, data: events.put_nowait({"event": event, "data": data})
+                )
+                await engine.run_execution(execution_id)
+        except Exception as e:
+            logger.error(f"Streaming execution {execution_id} failed: {str(e)}")
+            events.put_nowait({"event": "error", "data": {"execution_id": execution_id, "error": str(e)}})
+        finally:
+            events.put_nowait(None)
+    
+    runner = asyncio.create_task(run())
+    _background_runs.add(runner)
+    runner.add_done_callback(_background_runs.discard)
+    
+    while True:
+        event = await events.get()
+        if event is None:
+            break
+        yield event
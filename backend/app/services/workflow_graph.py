@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+from ..models.workflow import Workflow
+from ..models.workflow_task import WorkflowTask, TaskType, task_dependencies
+from .dag_scheduler import topological_levels
+
+
+@dataclass(frozen=True)
+class TaskNode:
+    """工作流任务的只读快照，执行期间代替 ORM 对象在各任务会话间传递"""
+    id: UUID
+    workflow_id: UUID
+    name: Optional[str]
+    type: Optional[TaskType]
+    config: Mapping[str, Any]
+    order: int
+    dependencies: Tuple[UUID, ...]
+
+
+@dataclass(frozen=True)
+class WorkflowGraph:
+    """不可变的工作流任务DAG，一次执行内复用"""
+    workflow_id: UUID
+    workflow_config: Mapping[str, Any]
+    tasks: Mapping[UUID, TaskNode]
+    levels: Tuple[Tuple[UUID, ...], ...]
+
+    @property
+    def dependencies(self) -> Dict[UUID, Tuple[UUID, ...]]:
+        """{任务ID: 依赖任务ID}，供调度器使用"""
+        return {task_id: node.dependencies for task_id, node in self.tasks.items()}
+
+    def get_task(self, task_id: UUID) -> TaskNode:
+        try:
+            return self.tasks[task_id]
+        except KeyError:
+            raise ValueError(f"Task {task_id} not found in workflow {self.workflow_id}")
+
+
+async def load_workflow_graph(db: AsyncSession, workflow_id: UUID) -> WorkflowGraph:
+    """用两条查询加载工作流、全部任务及依赖边，构建任务DAG"""
+    # Workflow 上的 tasks/executions 默认 selectin 加载，这里只需要工作流本身
+    stmt = (
+        select(Workflow)
+        .where(Workflow.id == workflow_id)
+        .options(noload(Workflow.tasks), noload(Workflow.executions))
+    )
+    result = await db.execute(stmt)
+    workflow = result.scalar_one_or_none()
+    if not workflow:
+        raise ValueError("Workflow not found")
+
+    # 任务与依赖边一次取回：按任务分组聚合依赖ID
+    dependency_ids = func.array_agg(task_dependencies.c.dependency_id).filter(
+        task_dependencies.c.dependency_id.isnot(None)
+    )
+    stmt = (
+        select(
+            WorkflowTask.id,
+            WorkflowTask.workflow_id,
+            WorkflowTask.name,
+            WorkflowTask.type,
+            WorkflowTask.config,
+            WorkflowTask.order,
+            dependency_ids
+        )
+        .outerjoin(task_dependencies, task_dependencies.c.task_id == WorkflowTask.id)
+        .where(WorkflowTask.workflow_id == workflow_id)
+        .group_by(WorkflowTask.id)
+        .order_by(WorkflowTask.order)
+    )
+    result = await db.execute(stmt)
+
+    tasks = {}
+    for row in result.all():
+        tasks[row.id] = TaskNode(
+            id=row.id,
+            workflow_id=row.workflow_id,
+            name=row.name,
+            type=row.type,
+            config=MappingProxyType(dict(row.config or {})),
+            order=row.order,
+            dependencies=tuple(row[6] or ())
+        )
+
+    dependencies = {task_id: node.dependencies for task_id, node in tasks.items()}
+    levels = tuple(tuple(level) for level in topological_levels(dependencies))
+
+    return WorkflowGraph(
+        workflow_id=workflow.id,
+        workflow_config=MappingProxyType(dict(workflow.config or {})),
+        tasks=MappingProxyType(tasks),
+        levels=levels
+    )
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import datetime
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple, Type
+from uuid import UUID
+import logging
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..models.workflow import Workflow
+from .llm_service import LLMService
+from .task_executor import TaskExecutor
+from .task_executors import get_task_executor_class, create_task_executor
+from .task_log_sink import TaskLogSink
+from .workflow_graph import WorkflowGraph
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CompiledPlan:
+    """编译后的工作流执行计划：拓扑分层、执行器绑定和已校验的任务配置"""
+    workflow_id: UUID
+    version: Optional[datetime]
+    graph: WorkflowGraph
+    executors: Mapping[UUID, Type[TaskExecutor]]
+
+    @property
+    def levels(self) -> Tuple[Tuple[UUID, ...], ...]:
+        return self.graph.levels
+
+    def create_executor(
+        self,
+        task_id: UUID,
+        db: AsyncSession,
+        llm_service: LLMService = None,
+        log_sink: TaskLogSink = None
+    ) -> TaskExecutor:
+        """为任务实例化已绑定的执行器"""
+        return create_task_executor(self.executors[task_id], db, llm_service, log_sink)
+
+
+def compile_plan(graph: WorkflowGraph, version: Optional[datetime]) -> CompiledPlan:
+    """解析每个任务的执行器并校验其配置"""
+    tasks = {}
+    executors = {}
+    for task_id, node in graph.tasks.items():
+        executor_class = get_task_executor_class(node.type)
+        try:
+            config = executor_class.validate_config(node.config)
+        except ValueError as e:
+            raise ValueError(f"Invalid config for task {node.name or task_id}: {str(e)}")
+        tasks[task_id] = replace(node, config=MappingProxyType(config))
+        executors[task_id] = executor_class
+
+    return CompiledPlan(
+        workflow_id=graph.workflow_id,
+        version=version,
+        graph=replace(graph, tasks=MappingProxyType(tasks)),
+        executors=MappingProxyType(executors)
+    )
+
+
+class WorkflowPlanCache:
+    """按 (工作流ID, 版本) 缓存编译后的执行计划，超出容量时淘汰最久未使用的计划"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._plans: "OrderedDict[UUID, CompiledPlan]" = OrderedDict()
+
+    def get(self, workflow_id: UUID, version: Optional[datetime]) -> Optional[CompiledPlan]:
+        plan = self._plans.get(workflow_id)
+        if plan is None:
+            return None
+        if plan.version != version:
+            # 工作流已变更，旧计划作废
+            del self._plans[workflow_id]
+            return None
+        self._plans.move_to_end(workflow_id)
+        return plan
+
+    def put(self, plan: CompiledPlan):
+        self._plans[plan.workflow_id] = plan
+        self._plans.move_to_end(plan.workflow_id)
+        while len(self._plans) > self.maxsize:
+            self._plans.popitem(last=False)
+
+    def invalidate(self, workflow_id: UUID):
+        self._plans.pop(workflow_id, None)
+
+    def clear(self):
+        self._plans.clear()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+
+workflow_plan_cache = WorkflowPlanCache(settings.WORKFLOW_PLAN_CACHE_SIZE)
+
+
+async def get_workflow_version(db: AsyncSession, workflow_id: UUID) -> Optional[datetime]:
+    """读取工作流的版本戳（updated_at，从未更新过时为 created_at）"""
+    stmt = select(func.coalesce(Workflow.updated_at, Workflow.created_at), Workflow.id).where(
+        Workflow.id == workflow_id
+    )
+    result = await db.execute(stmt)
+    row = result.first()
+    if row is None:
+        raise ValueError("Workflow not found")
+    return row[0]
+
+
+async def mark_workflow_changed(db: AsyncSession, workflow_id: UUID):
+    """任务或依赖关系变更时调用：推进工作流版本戳并清除本进程的计划缓存
+
+    版本戳随调用方的事务一起提交，其他进程在下次执行时通过版本比对感知变更。
+    """
+    stmt = update(Workflow).where(Workflow.id == workflow_id).values(updated_at=func.now())
+    await db.execute(stmt)
+    workflow_plan_cache.invalidate(workflow_id)
@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+from app.services.agent_service import AgentService, agent_executor_cache
+
+
+def test_agent_executor_is_reused_until_config_changes(monkeypatch):
+    """测试相同配置复用执行器，配置变更或失效后重新构建"""
+    built = []
+
+    def build(self, agent, streaming=False):
+        built.append(agent.id)
+        return object()
+
+    monkeypatch.setattr(AgentService, "_build_agent_executor", build)
+    agent_executor_cache.clear()
+    service = AgentService(db=None)
+    agent = SimpleNamespace(id=1, config={"model": "gpt-3.5-turbo", "temperature": 0})
+
+    first = service.create_agent_executor(agent)
+    assert service.create_agent_executor(agent) is first
+
+    agent.config = {"model": "gpt-4", "temperature": 0}
+    assert service.create_agent_executor(agent) is not first
+
+    agent_executor_cache.invalidate(1)
+    assert len(agent_executor_cache) == 0
+    assert built == [1, 1]
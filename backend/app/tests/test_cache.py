@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from app.core.cache import TTLCache, TieredCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_ignores_field_order():
+    """测试字段顺序不影响缓存键"""
+    assert make_cache_key({"a": 1, "b": [1, 2]}) == make_cache_key({"b": [1, 2], "a": 1})
+    assert make_cache_key({"a": 1}) != make_cache_key({"a": 2})
+
+
+def test_ttl_cache_expires_and_evicts():
+    """测试条目过期和 LRU 淘汰"""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, clock=clock)
+    cache.set("a", 1, ttl=10)
+    cache.set("b", 2, ttl=100)
+    assert cache.get("a") == (True, 1)
+
+    # b 最久未使用，被淘汰
+    cache.set("c", 3, ttl=100)
+    assert cache.get("b") == (False, None)
+
+    clock.now = 11
+    assert cache.get("a") == (False, None)
+    assert cache.get("c") == (True, 3)
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_counts_hits_by_namespace():
+    """测试按 namespace 统计命中"""
+    cache = TieredCache("test", maxsize=10)
+    assert await cache.get("k", namespace="completion") == (False, None)
+    await cache.set("k", {"v": 1}, ttl=60)
+    assert await cache.get("k", namespace="completion") == (True, {"v": 1})
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["namespaces"]["completion"] == {"hits": 1, "misses": 1, "redis_hits": 0}
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_coalesces_concurrent_misses():
+    """测试并发未命中只调用一次 loader，之后直接命中缓存"""
+    cache = TieredCache("test", maxsize=10)
+    calls = 0
+    release = asyncio.Event()
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"total": 3}
+
+    waiters = [asyncio.create_task(cache.get_or_load("stats", loader, ttl=60)) for _ in range(5)]
+    await asyncio.sleep(0)
+    # 发起加载的请求被取消，其余等待者仍拿到结果
+    waiters[0].cancel()
+    release.set()
+    results = await asyncio.gather(*waiters[1:])
+
+    assert results == [{"total": 3}] * 4
+    assert await cache.get_or_load("stats", loader, ttl=60) == {"total": 3}
+    assert calls == 1
+    assert cache.stats()["coalesced"] == 4
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from app.services.conversation_memory import ConversationMemoryStore, MemoryWindow
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """返回固定会话和消息（按 id 倒序）的假会话"""
+
+    def __init__(self, conversation, rows):
+        self.conversation = conversation
+        self.rows = rows
+        self.statements = []
+
+    async def get(self, model, key):
+        return self.conversation
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        return FakeResult(self.rows)
+
+
+@pytest.mark.asyncio
+async def test_load_keeps_summary_and_newest_messages_within_token_window():
+    """测试读取时附带摘要，并从最新消息起截断到 token 上限"""
+    conversation = SimpleNamespace(summary="用户在咨询报价", summarized_until_id=40)
+    rows = [("ai", "第三轮回答", 30), ("human", "第三轮问题", 30), ("ai", "第二轮回答", 50)]
+    db = FakeSession(conversation, rows)
+
+    messages = await ConversationMemoryStore(db).load(1, "s1", MemoryWindow(max_turns=5, max_tokens=70))
+
+    assert isinstance(messages[0], SystemMessage)
+    assert "用户在咨询报价" in messages[0].content
+    assert messages[1:] == [HumanMessage(content="第三轮问题"), AIMessage(content="第三轮回答")]
+    (stmt,) = db.statements
+    assert stmt._limit_clause.value == 10
+
+
+class SummarySession:
+    """记录 get 参数和执行语句的假会话，UPDATE 返回预设的影响行数"""
+
+    def __init__(self, log, conversation, messages, rowcount):
+        self.log = log
+        self.conversation = conversation
+        self.messages = messages
+        self.rowcount = rowcount
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get(self, model, key, **kwargs):
+        self.log.append(("get", kwargs))
+        return self.conversation
+
+    async def execute(self, stmt):
+        self.log.append(("execute", stmt))
+        return SimpleNamespace(all=lambda: self.messages, rowcount=self.rowcount)
+
+    async def commit(self):
+        self.log.append(("commit", None))
+
+    async def rollback(self):
+        self.log.append(("rollback", None))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("rowcount, last", [(1, "commit"), (0, "rollback")])
+async def test_summarize_calls_llm_outside_transaction(monkeypatch, rowcount, last):
+    """测试调用模型前已提交读取事务，写入以 summarized_until_id 未变为条件"""
+    log = []
+    conversation = SimpleNamespace(summary=None, summarized_until_id=7)
+    messages = [SimpleNamespace(id=i, role="human", content=f"m{i}") for i in range(8, 14)]
+
+    class FakeLLM:
+        async def generate_completion(self, **kwargs):
+            log.append(("llm", None))
+            return {"choices": [{"message": {"content": "摘要"}}]}
+
+    monkeypatch.setattr("app.services.conversation_memory.get_llm_service", lambda: FakeLLM())
+    store = ConversationMemoryStore(
+        None, session_factory=lambda: SummarySession(log, conversation, messages, rowcount)
+    )
+
+    await store._summarize(1, "s1", MemoryWindow(max_turns=1, max_tokens=100))
+
+    events = [event for event, _ in log]
+    assert events == ["get", "execute", "commit", "llm", "execute", last]
+    assert log[0][1] == {}
+    update_sql = str(log[4][1])
+    assert "agent_conversations.summarized_until_id = :summarized_until_id_1" in update_sql
+    assert log[4][1].compile().params["summarized_until_id_1"] == 7
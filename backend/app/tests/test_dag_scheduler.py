@@ -0,0 +1,154 @@
+import asyncio
+import pytest
+from app.services.dag_scheduler import (
+    DAGScheduler, CyclicDependencyError, FailurePolicy, fan_out, topological_levels
+)
+
+
+def test_topological_levels():
+    """测试依赖图分层"""
+    graph = {
+        "a": [],
+        "b": [],
+        "c": ["a", "b"],
+        "d": ["c"],
+        "e": ["a"]
+    }
+    levels = topological_levels(graph)
+
+    assert [sorted(level) for level in levels] == [["a", "b"], ["c", "e"], ["d"]]
+
+
+def test_topological_levels_detects_cycle():
+    """测试环路检测"""
+    graph = {
+        "a": ["c"],
+        "b": ["a"],
+        "c": ["b"],
+        "d": []
+    }
+    with pytest.raises(CyclicDependencyError) as exc_info:
+        topological_levels(graph)
+
+    assert sorted(exc_info.value.task_ids) == ["a", "b", "c"]
+
+
+def test_topological_levels_unknown_dependency():
+    """测试依赖不存在的任务"""
+    with pytest.raises(ValueError):
+        topological_levels({"a": ["missing"]})
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_independent_tasks_concurrently():
+    """测试相互独立的任务并发执行"""
+    graph = {"a": [], "b": [], "c": ["a", "b"]}
+    running = 0
+    peak = 0
+    order = []
+
+    async def run_task(task_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        order.append(task_id)
+        return task_id.upper()
+
+    results = await DAGScheduler(max_concurrency=4).run(graph, run_task)
+
+    assert results == {"a": "A", "b": "B", "c": "C"}
+    assert peak == 2
+    assert order[-1] == "c"
+
+
+@pytest.mark.asyncio
+async def test_scheduler_respects_concurrency_cap():
+    """测试并发上限"""
+    graph = {str(i): [] for i in range(6)}
+    running = 0
+    peak = 0
+
+    async def run_task(task_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await DAGScheduler(max_concurrency=2).run(graph, run_task)
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancels_running_tasks_on_failure():
+    """测试任务失败时取消其余任务"""
+    graph = {"slow": [], "bad": [], "after": ["bad"]}
+    cancelled = []
+
+    async def run_task(task_id):
+        if task_id == "bad":
+            raise RuntimeError("boom")
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(task_id)
+            raise
+
+    with pytest.raises(RuntimeError):
+        await DAGScheduler().run(graph, run_task)
+
+    assert cancelled == ["slow"]
+
+
+@pytest.mark.asyncio
+async def test_fan_out_collect_all_returns_errors():
+    """测试 collect_all 策略下返回失败分支的异常且并发数受限"""
+    running = 0
+    peak = 0
+
+    def branch(value):
+        async def run():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if value is None:
+                raise ValueError("bad item")
+            return value
+        return run
+
+    results = await fan_out(
+        {i: branch(value) for i, value in enumerate([1, None, 3, 4])},
+        max_concurrency=2,
+        failure_policy=FailurePolicy.COLLECT_ALL
+    )
+
+    assert list(results) == [0, 1, 2, 3]
+    assert isinstance(results[1], ValueError)
+    assert [results[i] for i in (0, 2, 3)] == [1, 3, 4]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_fan_out_fail_fast_cancels_siblings():
+    """测试 fail_fast 策略下任一分支失败即取消其余分支"""
+    cancelled = []
+
+    async def bad():
+        raise RuntimeError("boom")
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    with pytest.raises(RuntimeError):
+        await fan_out({"bad": bad, "slow": slow}, failure_policy="fail_fast")
+
+    assert cancelled == ["slow"]
@@ -0,0 +1,57 @@
+import pytest
+from app.services.execution_queue import ExecutionJob, InMemoryExecutionQueue
+
+
+def make_job(execution_id="exec-1"):
+    return ExecutionJob(
+        execution_id=execution_id,
+        workflow_id="wf-1",
+        user_id="user-1",
+        input_data={"text": "hello"}
+    )
+
+
+@pytest.mark.asyncio
+async def test_reserve_and_ack():
+    """测试领取和确认任务"""
+    queue = InMemoryExecutionQueue(visibility_timeout=60)
+    await queue.enqueue(make_job())
+
+    job = await queue.reserve(timeout=0.1)
+    assert job.execution_id == "exec-1"
+    assert job.input_data == {"text": "hello"}
+    assert job.deliveries == 1
+    assert await queue.depth() == 0
+
+    await queue.ack(job)
+    assert await queue.requeue_expired() == 0
+    assert await queue.reserve(timeout=0.01) is None
+
+
+@pytest.mark.asyncio
+async def test_unacked_job_is_redelivered_after_visibility_timeout():
+    """测试未确认的任务超时后重新投递"""
+    queue = InMemoryExecutionQueue(visibility_timeout=60)
+    await queue.enqueue(make_job())
+    job = await queue.reserve(timeout=0.1)
+
+    # 未超时不重新投递
+    assert await queue.requeue_expired() == 0
+
+    queue.visibility_timeout = 0
+    await queue.extend(job)
+    assert await queue.requeue_expired() == 1
+
+    redelivered = await queue.reserve(timeout=0.1)
+    assert redelivered.execution_id == job.execution_id
+    assert redelivered.deliveries == 2
+
+
+def test_job_json_round_trip():
+    """测试任务序列化"""
+    job = make_job()
+    restored = ExecutionJob.from_json(job.to_json(), deliveries=3)
+
+    assert restored.execution_id == job.execution_id
+    assert restored.input_data == job.input_data
+    assert restored.deliveries == 3
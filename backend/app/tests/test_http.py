@@ -0,0 +1,54 @@
+import asyncio
+import httpx
+import pytest
+from app.core.config import settings
+from app.core.http_clients import PerHostLimitTransport, close_http_clients, get_http_client
+
+
+@pytest.mark.asyncio
+async def test_named_clients_are_shared_until_closed():
+    """测试同名客户端复用同一个连接池，关闭后重新创建"""
+    llm_client = get_http_client("llm", base_url="https://llm.test/v1", max_connections=5, max_connections_per_host=5)
+    assert get_http_client("llm") is llm_client
+    assert get_http_client() is not llm_client
+    assert llm_client._transport._pool._max_connections == 5
+
+    default_client = get_http_client()
+    assert isinstance(default_client._transport, PerHostLimitTransport)
+    assert default_client._transport.max_per_host == settings.HTTP_MAX_CONNECTIONS_PER_HOST
+
+    await close_http_clients()
+    assert llm_client.is_closed
+    assert get_http_client("llm") is not llm_client
+    await close_http_clients()
+
+
+@pytest.mark.asyncio
+async def test_slow_host_cannot_take_every_connection():
+    """测试单个主机的并发请求数受限，其他主机的请求不被阻塞"""
+    active = {}
+    peak = {}
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        active[host] = active.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), active[host])
+        if host == "slow.test":
+            await release.wait()
+        active[host] -= 1
+        # 与真实传输层一样返回未读取的响应体，读完关闭时才释放名额
+        return httpx.Response(200, stream=httpx.ByteStream(b"ok"))
+
+    client = httpx.AsyncClient(transport=PerHostLimitTransport(httpx.MockTransport(handler), 2))
+    slow = [asyncio.create_task(client.get("https://slow.test/")) for _ in range(5)]
+    await asyncio.sleep(0.01)
+
+    response = await asyncio.wait_for(client.get("https://fast.test/"), 1)
+    assert response.status_code == 200
+    assert active["slow.test"] == 2
+
+    release.set()
+    assert all(response.status_code == 200 for response in await asyncio.gather(*slow))
+    assert peak["slow.test"] == 2
+    await client.aclose()
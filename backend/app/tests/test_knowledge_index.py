@@ -0,0 +1,225 @@
+import asyncio
+import numpy as np
+import pytest
+from app.services.knowledge_index import (
+    KnowledgeIndexService,
+    SegmentedIndex,
+    VectorIndex,
+    chunk_text,
+    hash_chunk,
+    pack_embedding,
+    unpack_embedding,
+)
+
+
+def test_chunk_text_overlaps_and_breaks_on_whitespace():
+    """测试切分片段长度受限、在空白处断开且相邻片段有重叠"""
+    words = [f"word{i}" for i in range(300)]
+    content = " ".join(words)
+
+    chunks = chunk_text(content, chunk_size=200, overlap=50)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    # 每个片段都由完整的单词组成
+    assert all(set(chunk.split()) <= set(words) for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.split()[0] in previous.split()
+    assert chunks[-1].endswith("word299")
+
+
+def test_chunk_text_short_and_empty():
+    assert chunk_text("hello world", chunk_size=100, overlap=10) == ["hello world"]
+    assert chunk_text("   ", chunk_size=100, overlap=10) == []
+
+
+def test_vector_index_returns_top_k_by_cosine_similarity():
+    """测试按余弦相似度返回 top_k"""
+    vectors = [[1, 0, 0], [0, 1, 0], [0.9, 0.1, 0], [0, 0, 5]]
+    index = VectorIndex.from_embeddings([10, 11, 12, 13], [pack_embedding(v) for v in vectors], 3)
+
+    results = index.search([1, 0, 0], top_k=2)
+
+    assert [chunk_id for chunk_id, _ in results] == [10, 12]
+    assert results[0][1] == np.float32(1.0)
+    assert len(index.search([0, 0, 1], top_k=10)) == 4
+
+
+def test_vector_index_save_and_mmap_load(tmp_path):
+    """测试索引文件保存后以 mmap 方式加载"""
+    embeddings = [pack_embedding([i, 1.0]) for i in range(5)]
+    index = VectorIndex.from_embeddings(list(range(5)), embeddings, 2)
+    path = str(tmp_path / "kb_1_5_4")
+
+    index.save(path)
+    loaded = VectorIndex.load(path)
+
+    assert isinstance(loaded.vectors, np.memmap)
+    assert loaded.ids.tolist() == list(range(5))
+    assert loaded.search([4, 1], top_k=1)[0][0] == 4
+    assert VectorIndex.load(str(tmp_path / "missing")) is None
+
+
+def test_embedding_round_trip():
+    assert unpack_embedding(pack_embedding([0.5, -1.25])).tolist() == [0.5, -1.25]
+
+
+def test_chunk_text_edit_only_changes_nearby_chunks():
+    """测试修改一个段落只改变它附近的片段"""
+    paragraphs = [f"Paragraph {i} " + " ".join(f"token{i}_{j}" for j in range(20)) for i in range(60)]
+    original = chunk_text("\n\n".join(paragraphs), chunk_size=1000, overlap=100)
+
+    paragraphs[30] += " appended sentence"
+    edited = chunk_text("\n\n".join(paragraphs), chunk_size=1000, overlap=100)
+
+    changed = set(edited) - set(original)
+    assert 1 <= len(changed) <= 3
+    assert len(set(original) - set(edited)) <= 3
+
+
+def test_segmented_index_merges_delta_and_skips_tombstones():
+    """测试分段索引合并增量段并过滤墓碑"""
+    base = VectorIndex.from_embeddings(
+        [1, 2, 3], [pack_embedding(v) for v in ([1, 0], [0.9, 0.1], [0, 1])], 2
+    )
+    delta = VectorIndex.from_embeddings([4], [pack_embedding([0.95, 0.05])], 2)
+    index = SegmentedIndex(base=base, base_max_id=3, delta=delta, tombstones=frozenset({1}))
+
+    results = index.search([1, 0], top_k=2)
+
+    assert [chunk_id for chunk_id, _ in results] == [4, 2]
+
+
+class FakeIndexDatabase:
+    """只实现增量索引用到的语句的内存数据库，advisory lock 持有到事务结束"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.chunks = []
+        self.locks = {}
+
+    def session(self):
+        return FakeIndexSession(self)
+
+
+class FakeIndexSession:
+    def __init__(self, database):
+        self.database = database
+        self.pending = []
+        self.held = []
+
+    async def execute(self, stmt, params=None):
+        database = self.database
+        sql = str(stmt)
+        if "pg_advisory_xact_lock" in sql:
+            for document_id in sorted(set(params["document_ids"])):
+                lock = database.locks.setdefault((params["lock_class"], document_id), asyncio.Lock())
+                await lock.acquire()
+                self.held.append(lock)
+            return None
+        if sql.startswith("SELECT documents.id"):
+            return FakeRows([(1, 1, database.documents[1])])
+        if sql.startswith("SELECT document_chunks.id, document_chunks.document_id"):
+            return FakeRows([
+                (chunk["id"], chunk["document_id"], chunk["chunk_index"], chunk["content_hash"])
+                for chunk in database.chunks if chunk["deleted_at"] is None
+            ])
+        if sql.startswith("SELECT document_chunks.knowledge_base_id"):
+            # 知识库中没有可复用向量的其他片段
+            return FakeRows([])
+        if sql.startswith("UPDATE document_chunks SET chunk_index"):
+            for values in params:
+                next(chunk for chunk in database.chunks if chunk["id"] == values["id"]).update(values)
+            return None
+        if sql.startswith("UPDATE document_chunks SET deleted_at"):
+            stale = set(stmt.compile().params["id_1"])
+            for chunk in database.chunks:
+                if chunk["id"] in stale:
+                    chunk["deleted_at"] = "now"
+            return None
+        # 全文检索向量等与片段行数无关的语句
+        return None
+
+    def add_all(self, chunks):
+        self.pending.extend(chunks)
+
+    async def flush(self):
+        for chunk in self.pending:
+            chunk.id = len(self.database.chunks) + 1
+            self.database.chunks.append({
+                "id": chunk.id, "document_id": chunk.document_id, "chunk_index": chunk.chunk_index,
+                "content_hash": chunk.content_hash, "deleted_at": None
+            })
+        self.pending = []
+
+    async def commit(self):
+        for lock in self.held:
+            lock.release()
+        self.held = []
+
+
+class FakeRows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeEmbeddingService:
+    """记录每次批量嵌入的输入，并检查调用时没有持有文档锁"""
+
+    def __init__(self, database, on_call=None):
+        self.database = database
+        self.on_call = on_call
+        self.calls = []
+
+    async def generate_embeddings_batch(self, texts, model=None):
+        assert not any(lock.locked() for lock in self.database.locks.values())
+        self.calls.append(list(texts))
+        # 嵌入请求期间让另一次索引有机会开始
+        await asyncio.sleep(0.01)
+        if self.on_call:
+            self.on_call()
+        return [[1.0, 0.0] for _ in texts]
+
+
+async def no_pgvector(self):
+    return False
+
+
+@pytest.mark.asyncio
+async def test_overlapping_reindexes_of_one_document_do_not_duplicate_chunks(monkeypatch):
+    """测试同一文档的两次增量索引重叠时不重复插入片段，嵌入请求期间不持有锁"""
+    database = FakeIndexDatabase({1: "\n\n".join(f"段落 {i} " + "内容" * 200 for i in range(6))})
+    monkeypatch.setattr(KnowledgeIndexService, "use_pgvector", no_pgvector)
+
+    results = await asyncio.gather(*[
+        KnowledgeIndexService(database.session(), llm_service=FakeEmbeddingService(database)).index_documents([1])
+        for _ in range(2)
+    ])
+
+    live = [chunk for chunk in database.chunks if chunk["deleted_at"] is None]
+    assert sorted(result["embedded"] for result in results) == [0, len(live)]
+    assert all(result["chunks"] == len(live) for result in results)
+    assert len({chunk["chunk_index"] for chunk in live}) == len(live)
+
+
+@pytest.mark.asyncio
+async def test_reindex_discards_embeddings_of_content_changed_during_the_call(monkeypatch):
+    """测试嵌入请求期间文档被修改时，只写入仍与当前内容一致的片段，新内容重新请求嵌入"""
+    old = "\n\n".join(f"段落 {i} " + "内容" * 200 for i in range(6))
+    new = "\n\n".join(f"修改后的段落 {i} " + "内容" * 200 for i in range(6))
+    database = FakeIndexDatabase({1: old})
+    monkeypatch.setattr(KnowledgeIndexService, "use_pgvector", no_pgvector)
+
+    def edit_once():
+        database.documents[1] = new
+
+    llm_service = FakeEmbeddingService(database, on_call=edit_once)
+    counts = await KnowledgeIndexService(database.session(), llm_service=llm_service).index_documents([1])
+
+    live = [chunk for chunk in database.chunks if chunk["deleted_at"] is None]
+    assert len(llm_service.calls) == 2
+    assert {chunk["content_hash"] for chunk in live} == {hash_chunk(chunk) for chunk in chunk_text(new)}
+    assert counts["embedded"] == len(live) == len(database.chunks)
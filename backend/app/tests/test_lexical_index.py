@@ -0,0 +1,37 @@
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_identifiers_and_parts():
+    """测试编号整体及各部分都作为词项"""
+    assert tokenize("Order SKU-1024 for cust_889") == [
+        "order", "sku-1024", "sku", "1024", "for", "cust_889", "cust", "889"
+    ]
+
+
+def test_bm25_ranks_exact_term_matches():
+    """测试精确词项命中的片段排在前面，未命中的片段不返回"""
+    documents = [
+        "shipping policy for international orders",
+        "product SKU-1024 is a wireless keyboard",
+        "wireless mouse and wireless keyboard bundle",
+        "refund policy",
+    ]
+    index = BM25Index([10, 11, 12, 13], [tokenize(doc) for doc in documents])
+
+    results = index.search("SKU-1024", top_k=3)
+    assert [chunk_id for chunk_id, _ in results] == [11]
+
+    results = index.search("wireless keyboard", top_k=5)
+    assert [chunk_id for chunk_id, _ in results][:2] == [12, 11]
+    assert index.search("nonexistent", top_k=5) == []
+
+
+def test_reciprocal_rank_fusion():
+    """测试两路都靠前的结果融合后排第一"""
+    vector = [(1, 0.9), (2, 0.8), (3, 0.7)]
+    lexical = [(2, 12.0), (4, 3.0)]
+
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+
+    assert [chunk_id for chunk_id, _ in fused] == [2, 1, 4, 3]
+    assert fused[0][1] == 1 / 62 + 1 / 61
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.core.config import settings
+from app.services.llm_service import LLMService, llm_response_cache
+from app.services.rate_limiter import RateLimitError, get_llm_rate_limiter
+
+
+def sse_body(*chunks):
+    lines = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks]
+    return "".join(lines) + "data: [DONE]\n\n"
+
+
+@pytest.mark.asyncio
+async def test_stream_completion_yields_deltas():
+    """测试流式补全按到达顺序返回增量内容"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        body = sse_body(
+            {"choices": [{"delta": {"role": "assistant"}}]},
+            {"choices": [{"delta": {"content": "你"}}]},
+            {"choices": [{"delta": {"content": "好"}}]}
+        )
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    service = LLMService()
+    service.client = httpx.AsyncClient(base_url="https://llm.test/v1", transport=httpx.MockTransport(handler))
+
+    tokens = [token async for token in service.stream_completion("hi")]
+
+    assert tokens == ["你", "好"]
+    assert requests[0]["stream"] is True
+    await service.close()
+    await service.client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_completion_cache_only_for_deterministic_requests():
+    """测试 temperature 为 0 的相同请求命中缓存，temperature 大于 0 时默认不缓存"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    llm_response_cache.local.clear()
+    service = LLMService()
+    service.client = httpx.AsyncClient(base_url="https://llm.test/v1", transport=httpx.MockTransport(handler))
+
+    for _ in range(2):
+        await service.generate_completion("cached prompt", temperature=0)
+    assert len(calls) == 1
+
+    for _ in range(2):
+        await service.generate_completion("cached prompt", temperature=0.7)
+    assert len(calls) == 3
+
+    await service.generate_completion("cached prompt", temperature=0.7, cache=True)
+    await service.generate_completion("cached prompt", temperature=0.7, cache=True)
+    assert len(calls) == 4
+    await service.close()
+    await service.client.aclose()
+
+
+def embeddings_handler(calls):
+    def handler(request: httpx.Request) -> httpx.Response:
+        inputs = json.loads(request.content)["input"]
+        calls.append(inputs)
+        # 乱序返回，验证按 index 还原顺序
+        data = [{"index": i, "embedding": [float(len(text))]} for i, text in enumerate(inputs)]
+        return httpx.Response(200, json={"data": data[::-1]})
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_concurrent_embeddings_are_coalesced():
+    """测试并发的单条嵌入请求合并为一次请求，相同文本只请求一次"""
+    calls = []
+    llm_response_cache.local.clear()
+    service = LLMService()
+    service.client = httpx.AsyncClient(
+        base_url="https://llm.test/v1", transport=httpx.MockTransport(embeddings_handler(calls))
+    )
+
+    results = await asyncio.gather(*[service.generate_embeddings(text) for text in ["a", "bb", "a", "ccc"]])
+
+    assert results == [[1.0], [2.0], [1.0], [3.0]]
+    assert calls == [["a", "bb", "ccc"]]
+    await service.close()
+    await service.client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_embedding_batch_is_chunked_to_provider_limits(monkeypatch):
+    """测试批量嵌入按条数上限分块"""
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_SIZE", 2)
+    calls = []
+    llm_response_cache.local.clear()
+    service = LLMService()
+    service.client = httpx.AsyncClient(
+        base_url="https://llm.test/v1", transport=httpx.MockTransport(embeddings_handler(calls))
+    )
+
+    results = await service.generate_embeddings_batch(["x", "yy", "zzz", "x"])
+
+    assert results == [[1.0], [2.0], [3.0], [1.0]]
+    assert sorted(map(len, calls)) == [1, 2]
+    await service.close()
+    await service.client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_failed_requests_return_reserved_tokens():
+    """测试 429 和错误状态码的请求退还预占的额度，且不恢复放行速率"""
+    statuses = iter([429, 500])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), headers={"retry-after": "0"})
+
+    limiter = get_llm_rate_limiter("test-failing-model")
+    service = LLMService()
+    service.client = httpx.AsyncClient(base_url="https://llm.test/v1", transport=httpx.MockTransport(handler))
+
+    with pytest.raises(RateLimitError):
+        await service.generate_completion("hi", model="test-failing-model", cache=False)
+    assert limiter._tokens == pytest.approx(limiter.tpm)
+    assert limiter.rate_factor == 0.5
+
+    with pytest.raises(ValueError):
+        await anext(service.stream_completion("hi", model="test-failing-model"))
+    assert limiter._tokens == pytest.approx(limiter.tpm)
+    assert limiter.rate_factor == 0.5
+    await service.close()
+    await service.client.aclose()
@@ -0,0 +1,62 @@
+import json
+import os
+from app.core.metrics import MetricsRegistry, MultiprocessWriter, merge_snapshots, render
+
+
+def make_registry():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    in_progress = registry.gauge("in_progress", "In progress")
+    return registry, requests, latency, in_progress
+
+
+def test_render_histogram_is_cumulative():
+    """测试直方图按区间累计输出，并转义标签值"""
+    registry, requests, latency, _ = make_registry()
+    requests.inc(1, '/a"b')
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, "/items/{id}")
+
+    text = render(merge_snapshots([registry.snapshot()]))
+
+    assert 'requests_total{route="/a\\"b"} 1' in text
+    assert 'latency_seconds_bucket{route="/items/{id}",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="/items/{id}",le="1"} 3' in text
+    assert 'latency_seconds_bucket{route="/items/{id}",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{route="/items/{id}"} 4' in text
+    assert 'latency_seconds_sum{route="/items/{id}"} 3.65' in text
+    assert "# TYPE latency_seconds histogram" in text
+
+
+def test_merge_keeps_counters_of_exited_processes_but_not_gauges():
+    """测试合并多进程快照：计数累加，已退出进程的 Gauge 不计入"""
+    snapshots = []
+    for pid in (101, 102):
+        registry, requests, latency, in_progress = make_registry()
+        requests.inc(2, "/")
+        latency.observe(0.5, "/")
+        in_progress.set(3)
+        snapshots.append({**registry.snapshot(), "pid": pid})
+
+    merged = merge_snapshots(snapshots, live_pids={101})
+
+    assert merged["requests_total"]["samples"][("/",)] == 4
+    assert merged["latency_seconds"]["samples"][("/",)] == [0, 2, 0, 1.0]
+    assert merged["in_progress"]["samples"][()] == 3
+
+
+def test_writer_merges_snapshot_files(tmp_path):
+    """测试 /metrics 合并目录中其他进程写入的快照"""
+    other, requests, _, _ = make_registry()
+    requests.inc(5, "/")
+    snapshot = {**other.snapshot(), "pid": os.getpid() + 100000}
+    (tmp_path / f"{snapshot['pid']}.json").write_text(json.dumps(snapshot))
+
+    registry, requests, _, _ = make_registry()
+    requests.inc(1, "/")
+    writer = MultiprocessWriter(registry, str(tmp_path))
+    writer.write()
+
+    assert os.path.exists(tmp_path / f"{os.getpid()}.json")
+    assert 'requests_total{route="/"} 6' in writer.collect()
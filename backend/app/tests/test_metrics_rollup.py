@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+from app.models.workflow_execution import ExecutionStatus
+from app.services.metrics_rollup import (
+    DURATION_BUCKETS,
+    RollupAccumulator,
+    TaskSample,
+    estimate_percentile,
+    rollup_granularity,
+    summarize,
+    truncate,
+)
+
+NOW = datetime(2024, 5, 20, 12, 30, tzinfo=timezone.utc)
+
+
+def test_truncate_to_bucket_start():
+    """测试按粒度截断，naive 时间视为 UTC"""
+    ts = datetime(2024, 5, 20, 10, 42, 17, 500)
+    assert truncate(ts, "minute") == datetime(2024, 5, 20, 10, 42, tzinfo=timezone.utc)
+    assert truncate(ts, "hour") == datetime(2024, 5, 20, 10, tzinfo=timezone.utc)
+    assert truncate(ts, "day") == datetime(2024, 5, 20, tzinfo=timezone.utc)
+
+
+def test_rollup_granularity_requires_aligned_range_within_retention():
+    """测试只有起止对齐且在保留期内的范围才走汇总表"""
+    day = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    assert rollup_granularity(day, datetime(2024, 5, 20, tzinfo=timezone.utc), NOW) == "day"
+    assert rollup_granularity(datetime(2024, 5, 20, 9, tzinfo=timezone.utc), None, NOW) == "hour"
+    assert rollup_granularity(datetime(2024, 5, 20, 9, 15, tzinfo=timezone.utc), None, NOW) == "minute"
+    # 分钟桶已过保留期
+    assert rollup_granularity(datetime(2024, 5, 1, 9, 15, tzinfo=timezone.utc), None, NOW) is None
+    assert rollup_granularity(datetime(2024, 5, 20, 9, 15, 30, tzinfo=timezone.utc), None, NOW) is None
+
+
+def test_estimate_percentile_interpolates_within_bucket():
+    """测试分位数在命中的区间内插值且不超过最大值"""
+    histogram = [0] * (len(DURATION_BUCKETS) + 1)
+    histogram[3] = 10  # (0.5, 1.0]
+    assert estimate_percentile(histogram, 0.5) == 0.75
+    assert estimate_percentile(histogram, 1.0, maximum=0.8) == 0.8
+    assert estimate_percentile([0] * len(histogram), 0.5) is None
+
+
+def test_accumulator_merges_samples_per_bucket():
+    """测试同一桶内的样本合并为一行，每个粒度各一行"""
+    workflow_id, user_id = uuid4(), uuid4()
+    accumulator = RollupAccumulator()
+    for seconds in (2, 4):
+        execution = SimpleNamespace(
+            status=ExecutionStatus.COMPLETED, workflow_id=workflow_id, user_id=user_id,
+            created_at=NOW, started_at=datetime(2024, 5, 20, 12, 30, tzinfo=timezone.utc),
+            completed_at=datetime(2024, 5, 20, 12, 30, seconds, tzinfo=timezone.utc)
+        )
+        accumulator.add_execution(execution, [TaskSample("llm", "completed", 0.3), TaskSample("api", "failed", None)])
+
+    rows = list(accumulator.rows.values())
+    assert len(rows) == 3 * 3
+    minute = [row for row in rows if row["granularity"] == "minute"]
+    workflow = next(row for row in minute if row["kind"] == "workflow")
+    assert (workflow["count"], workflow["duration_sum"], workflow["duration_max"]) == (2, 6.0, 4.0)
+    failed = next(row for row in minute if row["task_type"] == "api")
+    assert (failed["count"], failed["duration_count"]) == (2, 0)
+
+    summary = summarize(
+        [SimpleNamespace(**row) for row in minute if row["kind"] == "task"],
+        key=lambda row: row.status
+    )
+    assert summary["completed"].average_duration == 0.3
+    assert summary["failed"].average_duration is None
@@ -0,0 +1,68 @@
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from sqlalchemy.dialects import postgresql
+from app.models.workflow_task import TaskType
+from app.services.monitoring import MonitoringService
+
+
+def make_row(task_type, is_total, total, completed=0, failed=0, average=None):
+    return SimpleNamespace(
+        type=task_type, is_total=is_total, total=total, completed=completed, failed=failed,
+        pending=total - completed - failed, running=0,
+        average_duration=average, p50_duration=average, p95_duration=average
+    )
+
+
+class FakeSession:
+    """记录语句并返回预设行的假会话"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    async def execute(self, stmt):
+        self.statements.append(str(stmt.compile(dialect=postgresql.dialect())))
+        return SimpleNamespace(all=lambda: self.rows, one=lambda: self.rows[0])
+
+
+@pytest.mark.asyncio
+async def test_task_stats_use_single_rollup_query():
+    """测试任务统计由一条 GROUP BY ROLLUP 查询得出"""
+    db = FakeSession([
+        make_row(TaskType.LLM, 0, 3, completed=2, failed=1, average=1.5),
+        make_row(None, 0, 1),
+        make_row(None, 1, 4, completed=2, failed=1, average=1.5),
+    ])
+
+    stats = await MonitoringService(db).get_task_execution_stats()
+
+    assert len(db.statements) == 1
+    assert "GROUP BY ROLLUP(workflow_tasks.type)" in db.statements[0]
+    assert "percentile_cont" in db.statements[0]
+    assert (stats.total_tasks, stats.completed_tasks, stats.failed_tasks, stats.pending_tasks) == (4, 2, 1, 1)
+    assert [(t.task_type, t.total_count, t.success_count) for t in stats.by_type] == [("llm", 3, 2)]
+
+
+@pytest.mark.asyncio
+async def test_workflow_stats_on_empty_table():
+    db = FakeSession([make_row(None, 1, 0)])
+
+    # 未对齐桶边界的范围回退到明细表
+    stats = await MonitoringService(db).get_workflow_execution_stats(start_time=datetime(2024, 5, 20, 9, 15, 30))
+
+    assert stats.total_executions == 0
+    assert stats.average_duration is None
+    assert "GROUP BY" not in db.statements[0]
+
+
+@pytest.mark.asyncio
+async def test_workflow_stats_fallback_excludes_end_time():
+    """测试明细表回退路径与汇总表一样不包含 end_time"""
+    db = FakeSession([make_row(None, 1, 0)])
+
+    await MonitoringService(db).get_workflow_execution_stats(
+        start_time=datetime(2024, 5, 20, 9, 15, 30), end_time=datetime(2024, 5, 20, 10, 15, 30)
+    )
+
+    assert "workflow_executions.created_at < " in db.statements[0]
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.rate_limiter import AdaptiveRateLimiter, get_llm_rate_limiter, parse_duration, retry_after_from_headers
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_round_robin_per_key():
+    """测试额度不足时不同调用方轮流放行"""
+    limiter = AdaptiveRateLimiter(rpm=6000, tpm=0)
+    limiter._requests = 0
+    order = []
+
+    async def call(key):
+        await limiter.acquire(key=key)
+        order.append(key)
+
+    calls = [asyncio.create_task(call(key)) for key in ["a", "a", "a", "b"]]
+    await asyncio.gather(*calls)
+
+    assert order == ["a", "b", "a", "a"]
+
+
+@pytest.mark.asyncio
+async def test_token_usage_is_settled_after_response():
+    """测试按实际用量多退少补"""
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(rpm=0, tpm=1000, clock=clock)
+
+    reservation = await limiter.acquire(tokens=600)
+    assert limiter._tokens == 400
+    limiter.record_usage(reservation, 100)
+    assert limiter._tokens == 900
+
+
+def test_rate_limited_response_pauses_and_slows_down():
+    """测试 429 后按 Retry-After 暂停并降低放行速率，成功后逐步恢复"""
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(rpm=60, tpm=0, clock=clock)
+
+    limiter.on_rate_limited(retry_after_from_headers({"retry-after": "2"}))
+    assert limiter._wait_time(0) == 2
+    assert limiter.rate_factor == 0.5
+
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "0"})
+    clock.now = 2
+    # 剩余额度为 0，放行速率减半后每 2 秒恢复一个请求
+    limiter._refill()
+    assert limiter._requests == pytest.approx(1)
+    assert limiter._wait_time(0) == 0
+    limiter.record_usage(limiter._take(0), None)
+    assert limiter.rate_factor == pytest.approx(0.55)
+
+
+def test_each_model_has_its_own_limiter():
+    """测试不同模型的响应头校准和 429 降速互不影响"""
+    chat = get_llm_rate_limiter("test-chat-model")
+    embedding = get_llm_rate_limiter("test-embedding-model")
+    assert get_llm_rate_limiter("test-chat-model") is chat
+    assert chat is not embedding
+
+    embedding.update_from_headers({"x-ratelimit-limit-requests": "5", "x-ratelimit-limit-tokens": "1000"})
+    embedding.on_rate_limited(1)
+
+    assert (embedding.rpm, embedding.tpm) == (5, 1000)
+    assert (chat.rpm, chat.tpm, chat.rate_factor) == (
+        settings.LLM_RATE_LIMIT_RPM, settings.LLM_RATE_LIMIT_TPM, 1.0
+    )
+
+
+def test_parse_duration():
+    """测试解析限流响应头中的时长"""
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1.5") == 1.5
+    assert parse_duration("soon") is None
@@ -0,0 +1,42 @@
+import asyncio
+import time
+import pytest
+from app.services.system_metrics import SystemMetricsSampler, inflight_executions, track_execution
+
+
+def test_sampler_keeps_fixed_number_of_samples():
+    """测试环形缓冲区只保留最近的样本"""
+    sampler = SystemMetricsSampler(interval=1, size=3)
+    samples = [sampler.sample() for _ in range(5)]
+
+    assert sampler.history() == samples[-3:]
+    assert sampler.history(limit=1) == samples[-1:]
+    assert sampler.latest() is samples[-1]
+    assert samples[-1].cpu_usage >= 0
+    assert samples[-1].db_pool_checked_out == 0
+
+
+def test_track_execution_counts_inflight():
+    """测试进行中的执行数在退出时恢复，异常退出也一样"""
+    before = inflight_executions()
+    with pytest.raises(RuntimeError):
+        with track_execution():
+            assert inflight_executions() == before + 1
+            assert SystemMetricsSampler(size=1).sample().inflight_executions == before + 1
+            raise RuntimeError()
+    assert inflight_executions() == before
+
+
+@pytest.mark.asyncio
+async def test_background_sampler_measures_loop_lag():
+    """测试后台采样记录事件循环的延迟"""
+    sampler = SystemMetricsSampler(interval=0.01, size=10)
+    sampler.start()
+    await asyncio.sleep(0.005)
+    # 阻塞事件循环，采样协程会晚于预期醒来
+    time.sleep(0.05)
+    await asyncio.sleep(0.02)
+    await sampler.stop()
+
+    assert sampler.history()
+    assert max(sample.event_loop_lag for sample in sampler.history()) >= 0.03
@@ -0,0 +1,132 @@
+import asyncio
+import uuid
+import pytest
+from app.models.workflow_task import TaskType
+from app.services.task_executors import LLMTaskExecutor, LoopTaskExecutor
+from app.services.workflow_graph import TaskNode
+
+
+class FakeSession:
+    """按ID返回任务的假异步会话"""
+
+    def __init__(self, tasks):
+        self.tasks = {task.id: task for task in tasks}
+        self.gets = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get(self, model, task_id):
+        self.gets += 1
+        return self.tasks.get(task_id)
+
+
+class NullSink:
+    def add_log(self, **values):
+        pass
+
+    def update_task(self, task_id, **values):
+        pass
+
+
+def make_task(task_type, config):
+    return TaskNode(
+        id=uuid.uuid4(),
+        workflow_id=uuid.uuid4(),
+        name=task_type.value,
+        type=task_type,
+        config=config,
+        order=0,
+        dependencies=()
+    )
+
+
+@pytest.mark.asyncio
+async def test_loop_runs_body_with_its_own_executor():
+    """测试循环体只加载一次，循环项分块后由循环体类型对应的执行器执行"""
+    body = make_task(TaskType.CONDITION, {"condition": "input['item'] > 1"})
+    loop = make_task(
+        TaskType.LOOP,
+        {"loop_task_id": str(body.id), "items": [1, 2, 3, 0, 5], "batch_size": 2, "max_concurrency": 2}
+    )
+    db = FakeSession([body])
+
+    executor = LoopTaskExecutor(db, log_sink=NullSink(), session_factory=lambda: db)
+    result = await executor.execute_task(loop, {}, uuid.uuid4())
+
+    assert [r["result"] for r in result["results"]] == [False, True, True, False, True]
+    assert db.gets == 1
+
+
+@pytest.mark.asyncio
+async def test_loop_reports_missing_body_task():
+    """测试循环体任务不存在时报错"""
+    loop = make_task(TaskType.LOOP, {"loop_task_id": str(uuid.uuid4()), "items": [1]})
+    executor = LoopTaskExecutor(FakeSession([]), log_sink=NullSink(), max_retries=0)
+
+    with pytest.raises(Exception, match="not found"):
+        await executor.execute_task(loop, {}, uuid.uuid4())
+
+
+class FakeLLMService:
+    def __init__(self):
+        self.batches = []
+
+    async def generate_embeddings_batch(self, texts, model):
+        self.batches.append(texts)
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_embedding_batch_uses_one_request():
+    """测试嵌入任务批量执行时合并为一次请求"""
+    llm_service = FakeLLMService()
+    task = make_task(TaskType.LLM, {"operation": "embedding", "input_key": "item"})
+    executor = LLMTaskExecutor(FakeSession([]), llm_service, log_sink=NullSink())
+
+    results = await executor.execute_batch(task, [{"item": "a"}, {"item": "bbb"}], uuid.uuid4())
+
+    assert llm_service.batches == [["a", "bbb"]]
+    assert [r["result"] for r in results] == [[1.0], [3.0]]
+
+
+class FlakyLLMService:
+    """第一次调用 bad 时失败；slow 在失败时仍在等待"""
+
+    def __init__(self):
+        self.calls = []
+        self.cancelled = []
+        self.failed = False
+
+    async def analyze_sentiment(self, text, model):
+        self.calls.append(text)
+        if text == "bad" and not self.failed:
+            self.failed = True
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream error")
+        if text == "slow" and len(self.calls) <= 3:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled.append(text)
+                raise
+        return {"positive": 1.0}
+
+
+@pytest.mark.asyncio
+async def test_batch_cancels_siblings_and_retries_only_failed_items():
+    """测试一条失败时取消其余请求，重试只执行未成功的输入"""
+    llm_service = FlakyLLMService()
+    task = make_task(TaskType.LLM, {"operation": "sentiment", "input_key": "item"})
+    executor = LLMTaskExecutor(FakeSession([]), llm_service, log_sink=NullSink(), retry_delay=0)
+
+    results = await executor.execute_batch(
+        task, [{"item": "ok"}, {"item": "bad"}, {"item": "slow"}], uuid.uuid4()
+    )
+
+    assert len(results) == 3
+    assert llm_service.cancelled == ["slow"]
+    assert sorted(llm_service.calls) == ["bad", "bad", "ok", "slow", "slow"]
@@ -0,0 +1,82 @@
+import asyncio
+import uuid
+import pytest
+from app.models.task_log import TaskLogStatus
+from app.models.workflow_task import TaskStatus
+from app.services.task_log_sink import TaskLogSink
+
+
+class RecordingSession:
+    """记录执行语句的假会话"""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt, params=None):
+        self.calls.append((stmt.table.name, params))
+
+    async def commit(self):
+        self.calls.append(("commit", None))
+
+
+def make_sink(calls, **kwargs):
+    return TaskLogSink(session_factory=lambda: RecordingSession(calls), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_in_one_transaction():
+    """测试执行结束时一次性写入缓冲的日志和状态"""
+    calls = []
+    sink = make_sink(calls, max_batch_size=100, flush_interval=60)
+    task_id = uuid.uuid4()
+    execution_id = uuid.uuid4()
+
+    sink.add_log(task_id=task_id, execution_id=execution_id, status=TaskLogStatus.RUNNING)
+    sink.update_task(task_id, status=TaskStatus.RUNNING, started_at="t0")
+    sink.update_task(task_id, status=TaskStatus.COMPLETED, completed_at="t1")
+    sink.add_log(task_id=task_id, execution_id=execution_id, status=TaskLogStatus.COMPLETED, result={"ok": True})
+    assert calls == []
+
+    await sink.close()
+
+    assert [name for name, _ in calls] == ["workflow_tasks", "task_logs", "commit"]
+    (updates,) = [params for name, params in calls if name == "workflow_tasks"]
+    assert updates == [{"id": task_id, "status": TaskStatus.COMPLETED, "started_at": "t0", "completed_at": "t1"}]
+    (logs,) = [params for name, params in calls if name == "task_logs"]
+    assert len(logs) == 2
+    assert all(set(row) == {"task_id", "execution_id", "status", "result"} for row in logs)
+
+
+@pytest.mark.asyncio
+async def test_flushes_when_batch_is_full():
+    """测试缓冲达到上限时自动刷新"""
+    calls = []
+    sink = make_sink(calls, max_batch_size=2, flush_interval=60)
+
+    sink.add_log(task_id=uuid.uuid4(), status=TaskLogStatus.RUNNING)
+    sink.add_log(task_id=uuid.uuid4(), status=TaskLogStatus.RUNNING)
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert [name for name, _ in calls] == ["task_logs", "commit"]
+    await sink.close()
+    assert sink.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_flushes_after_interval():
+    """测试超过缓冲时间后自动刷新"""
+    calls = []
+    sink = make_sink(calls, max_batch_size=100, flush_interval=0.01)
+
+    sink.update_task(uuid.uuid4(), status=TaskStatus.RUNNING)
+    await asyncio.sleep(0.05)
+
+    assert [name for name, _ in calls] == ["workflow_tasks", "commit"]
+    await sink.close()
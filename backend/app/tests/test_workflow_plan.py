@@ -0,0 +1,74 @@
+import uuid
+from datetime import datetime, timedelta
+from types import MappingProxyType
+import pytest
+from app.models.workflow_task import TaskType
+from app.services.task_executors import LLMTaskExecutor, ConditionTaskExecutor
+from app.services.workflow_graph import TaskNode, WorkflowGraph
+from app.services.workflow_plan import WorkflowPlanCache, compile_plan
+
+
+def make_graph(*nodes):
+    workflow_id = uuid.uuid4()
+    tasks = {}
+    for name, task_type, config, deps in nodes:
+        task_id = uuid.uuid5(workflow_id, name)
+        tasks[task_id] = TaskNode(
+            id=task_id,
+            workflow_id=workflow_id,
+            name=name,
+            type=task_type,
+            config=MappingProxyType(config),
+            order=len(tasks),
+            dependencies=tuple(uuid.uuid5(workflow_id, dep) for dep in deps)
+        )
+    levels = (tuple(t for t, n in tasks.items() if not n.dependencies),)
+    return WorkflowGraph(
+        workflow_id=workflow_id,
+        workflow_config=MappingProxyType({}),
+        tasks=MappingProxyType(tasks),
+        levels=levels
+    )
+
+
+def test_compile_plan_binds_executors_and_normalizes_config():
+    """测试编译计划时绑定执行器并补全配置默认值"""
+    graph = make_graph(
+        ("sentiment", TaskType.LLM, {"operation": "sentiment"}, []),
+        ("check", TaskType.CONDITION, {"condition": "input['x'] > 1"}, [])
+    )
+    plan = compile_plan(graph, datetime.utcnow())
+
+    by_name = {node.name: task_id for task_id, node in plan.graph.tasks.items()}
+    assert plan.executors[by_name["sentiment"]] is LLMTaskExecutor
+    assert plan.executors[by_name["check"]] is ConditionTaskExecutor
+    config = plan.graph.tasks[by_name["sentiment"]].config
+    assert config["model"] == "gpt-3.5-turbo"
+    assert config["max_tokens"] == 1000
+
+
+def test_compile_plan_rejects_invalid_config():
+    """测试编译计划时拒绝无效配置"""
+    graph = make_graph(("broken", TaskType.CONDITION, {"condition": "input["}, []))
+
+    with pytest.raises(ValueError):
+        compile_plan(graph, None)
+
+
+def test_plan_cache_version_and_eviction():
+    """测试计划缓存的版本校验和容量淘汰"""
+    cache = WorkflowPlanCache(maxsize=2)
+    version = datetime.utcnow()
+    plans = [compile_plan(make_graph(), version) for _ in range(3)]
+    for plan in plans:
+        cache.put(plan)
+
+    assert len(cache) == 2
+    assert cache.get(plans[0].workflow_id, version) is None
+    assert cache.get(plans[2].workflow_id, version) is plans[2]
+    assert cache.get(plans[2].workflow_id, version + timedelta(seconds=1)) is None
+    assert cache.get(plans[2].workflow_id, version) is None
+
+    cache.put(plans[1])
+    cache.invalidate(plans[1].workflow_id)
+    assert cache.get(plans[1].workflow_id, version) is None
@@ -0,0 +1,182 @@
+"""工作流执行 worker
+
+从执行队列领取任务并运行工作流，与 API 进程分开部署和扩容：
+
+    python -m app.worker --processes 4 --concurrency 4
+"""
+from typing import Optional
+from uuid import UUID
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.http_clients import close_http_clients
+from app.core.metrics import metrics_writer
+from app.core.redis_client import close_redis
+from app.db import base  # noqa: F401 确保所有模型已注册
+from app.models.workflow_execution import WorkflowExecution, ExecutionStatus
+from app.services.execution_queue import ExecutionJob, ExecutionQueue, get_execution_queue
+from app.services.llm_service import get_llm_service
+from app.services.metrics_rollup import purge_expired_rollups
+from app.services.system_metrics import system_metrics_sampler
+from app.services.workflow_engine import WorkflowEngine
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionWorker:
+    """消费执行队列的 worker，单个进程内并发运行 concurrency 个工作流"""
+
+    def __init__(self, queue: ExecutionQueue, concurrency: int = None):
+        self.queue = queue
+        self.concurrency = concurrency or settings.WORKER_CONCURRENCY
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        """运行直到 stop 被调用，已领取的任务会执行完再退出"""
+        logger.info(f"Execution worker started with concurrency {self.concurrency}")
+        consumers = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+        maintenance = [asyncio.create_task(self._reap()), asyncio.create_task(self._purge_rollups())]
+        try:
+            await asyncio.gather(*consumers)
+        finally:
+            for task in maintenance:
+                task.cancel()
+            await asyncio.gather(*maintenance, return_exceptions=True)
+            logger.info("Execution worker stopped")
+
+    async def _consume(self):
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.reserve(timeout=1.0)
+            except Exception as e:
+                logger.error(f"Failed to reserve execution job: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            if job is None:
+                continue
+            await self._handle(job)
+
+    async def _handle(self, job: ExecutionJob):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            if job.deliveries > settings.EXECUTION_MAX_DELIVERIES:
+                await self._give_up(job)
+            else:
+                async with AsyncSessionLocal() as db:
+                    await WorkflowEngine(db).run_execution(UUID(job.execution_id))
+        except Exception as e:
+            # 不确认，等待可见超时后重新投递
+            logger.error(f"Execution {job.execution_id} failed in worker: {str(e)}")
+            return
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+        await self.queue.ack(job)
+
+    async def _heartbeat(self, job: ExecutionJob):
+        """执行期间定期续期，避免长时间运行的工作流被重复投递"""
+        interval = max(self.queue.visibility_timeout / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.extend(job)
+            except Exception as e:
+                logger.warning(f"Failed to extend visibility of execution {job.execution_id}: {str(e)}")
+
+    async def _reap(self):
+        """定期将超时未确认的任务放回队列"""
+        interval = min(max(self.queue.visibility_timeout / 10, 1), 30)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.requeue_expired()
+            except Exception as e:
+                logger.warning(f"Failed to requeue expired execution jobs: {str(e)}")
+
+    async def _purge_rollups(self):
+        """定期删除超过保留期的分钟/小时指标桶"""
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    purged = await purge_expired_rollups(db)
+                if purged:
+                    logger.info(f"Purged {purged} expired metric rollup buckets")
+            except Exception as e:
+                logger.warning(f"Failed to purge metric rollups: {str(e)}")
+            await asyncio.sleep(settings.METRICS_ROLLUP_PURGE_INTERVAL)
+
+    async def _give_up(self, job: ExecutionJob):
+        """超过最大投递次数，标记执行失败"""
+        logger.error(f"Execution {job.execution_id} exceeded {settings.EXECUTION_MAX_DELIVERIES} deliveries")
+        async with AsyncSessionLocal() as db:
+            execution = await db.get(WorkflowExecution, UUID(job.execution_id))
+            if execution and execution.status not in (ExecutionStatus.COMPLETED, ExecutionStatus.FAILED):
+                await WorkflowEngine(db).fail_execution(
+                    execution, f"Execution abandoned after {job.deliveries - 1} deliveries"
+                )
+
+
+async def _run_worker(concurrency: Optional[int]):
+    worker = ExecutionWorker(get_execution_queue(), concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    # worker 进程的 CPU、事件循环延迟和进行中的执行数是调整进程数和并发数的依据
+    system_metrics_sampler.start()
+    # worker 不提供 HTTP 接口，指标写入共享目录后由 API 进程的 /metrics 合并输出
+    metrics_writer.start()
+    try:
+        await worker.run()
+    finally:
+        await system_metrics_sampler.stop()
+        await metrics_writer.stop()
+        await get_llm_service().close()
+        await close_http_clients()
+        await close_redis()
+
+
+def _worker_process(concurrency: Optional[int]):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_run_worker(concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BizBrain workflow execution worker")
+    parser.add_argument("--processes", type=int, default=1, help="worker 进程数")
+    parser.add_argument("--concurrency", type=int, default=None, help="每个进程同时执行的工作流数")
+    args = parser.parse_args()
+
+    if settings.EXECUTION_QUEUE_BACKEND == "memory":
+        parser.error("The in-memory execution queue is process-local; use EXECUTION_QUEUE_BACKEND=redis")
+
+    if args.processes <= 1:
+        _worker_process(args.concurrency)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(args.concurrency,), name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward_signal(signum, frame):
+        # 容器停止时只有主进程收到 SIGTERM，转发给各 worker 进程以便优雅退出
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward_signal)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()